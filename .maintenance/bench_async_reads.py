@@ -0,0 +1,152 @@
+"""
+Benchmark lado a lado: endpoints de leitura no caminho síncrono (threadpool) e no
+assíncrono (DB_ASYNC=1, asyncpg/aiosqlite).
+
+Sobe dois uvicorn (um worker cada) sobre o mesmo banco, popula dados de exemplo e
+dispara a mesma mistura de leituras (listas, portal do cliente e extrato) com alta
+concorrência, reportando vazão e latência. O ganho do caminho assíncrono aparece
+quando cada query tem latência de rede (PostgreSQL remoto): aponte DATABASE_URL para
+um banco de teste assim para medir o cenário do Render.
+
+Uso:
+    python .maintenance/bench_async_reads.py [--requests 2000] [--concurrency 100] [--clients 200]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+
+def start_server(port, database_url, workdir, async_reads):
+    env = dict(os.environ, DATABASE_URL=database_url, PYTHONPATH=str(BACKEND_DIR), DB_ASYNC="1" if async_reads else "0")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{base}/health/", timeout=1)
+            return proc, base
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.kill()
+    raise SystemExit("Servidor não subiu")
+
+
+def seed(base, n_clients, n_plants=5, months=12):
+    stamp = int(time.time())
+    with httpx.Client(base_url=base, timeout=60) as http:
+        plant_ids = [
+            http.post("/plants/", json=dict(
+                name=f"Usina {i}", address="-", uc_number=f"BENCH-P{stamp}-{i}",
+                capacity_kw=100, acquisition_cost=0, maintenance_cost=0,
+            )).json()["id"]
+            for i in range(n_plants)
+        ]
+        client_ids = [
+            http.post("/clients/", json=dict(
+                name=f"Cliente {i}", address="-", uc_number=f"BENCH-C{stamp}-{i}",
+                email=f"bench{stamp}-{i}@example.com", password="-",
+            )).json()["id"]
+            for i in range(n_clients)
+        ]
+        for p_index, plant_id in enumerate(plant_ids):
+            members = client_ids[p_index::n_plants]
+            http.post(f"/plants/{plant_id}/distributions/", json=[
+                {"client_id": c, "percentage": 100.0 / len(members)} for c in members
+            ])
+            for m in range(1, months + 1):
+                http.post(f"/plants/{plant_id}/production/", json={"month": f"2025-{m:02d}", "kwh_generated": 5000})
+        for client_id in client_ids:
+            for m in range(1, months + 1, 3):
+                http.post("/invoices/", json=dict(
+                    month=f"2025-{m:02d}", consumption_kwh=100, kwh_value=1, kwh_value_original=1,
+                    kwh_value_injection=1, client_id=client_id, credited_balance=50, invoice_value=80,
+                    fixed_cost=10, total_invoiced=70, amount_to_collect=80, value_without_discount=100,
+                    original_value=100, total_value=80, discount=20, profit=16,
+                ))
+    return client_ids, stamp
+
+
+async def run_load(base, paths, total, concurrency):
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(paths[i % len(paths)])
+
+    async def worker(http):
+        nonlocal errors
+        while not queue.empty():
+            path = queue.get_nowait()
+            start = time.perf_counter()
+            r = await http.get(path)
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += r.status_code >= 400
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, timeout=120, limits=limits) as http:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def report(label, latencies, errors, elapsed):
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{label:<10} {len(latencies) / elapsed:8.1f} req/s  p50={statistics.median(latencies):7.1f} ms  "
+          f"p99={p99:7.1f} ms  erros={errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8770)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    database_url = os.getenv("DATABASE_URL") or f"sqlite:///{workdir}/bench.db"
+
+    proc, base = start_server(args.port, database_url, workdir, async_reads=False)
+    try:
+        client_ids, stamp = seed(base, args.clients)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    sample = client_ids[:: max(1, len(client_ids) // 20)]
+    paths = ["/plants/", "/clients/?view=summary&limit=100", "/invoices/?limit=100"]
+    for i, client_id in enumerate(sample):
+        paths += [
+            f"/clients/id/{client_id}",
+            f"/clients/BENCH-C{stamp}-{client_ids.index(client_id)}",
+            f"/clients/{client_id}/statement?limit=50",
+            f"/clients/{client_id}/balance?month=2025-06",
+        ]
+
+    print(f"Banco: {database_url.split('://')[0]} | {args.requests} leituras, concorrência {args.concurrency}")
+    for label, async_reads, port in (("sync", False, args.port + 1), ("async", True, args.port + 2)):
+        proc, base = start_server(port, database_url, workdir, async_reads=async_reads)
+        try:
+            asyncio.run(run_load(base, paths, min(200, args.requests), args.concurrency))  # aquecimento
+            report(label, *asyncio.run(run_load(base, paths, args.requests, args.concurrency)))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
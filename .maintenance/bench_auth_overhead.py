@@ -0,0 +1,81 @@
+"""
+Benchmark: custo da autenticação por token em cada requisição.
+
+Mede (1) a validação isolada do token (assinatura + validade + lista de revogação) e
+(2) a mesma rota protegida, chamada em processo, com token de operador contra a rota
+pública equivalente, contando as queries ao banco de cada chamada.
+
+Uso:
+    python .maintenance/bench_auth_overhead.py [--requests 2000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+workdir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/bench.db")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.chdir(workdir)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import logging
+logging.disable(logging.INFO)
+
+from fastapi import Depends
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import auth
+import main as backend_main
+from database import engine
+
+queries = []
+event.listen(engine, "before_cursor_execute", lambda *args: queries.append(1))
+
+
+@backend_main.app.get("/_bench/public")
+def bench_public():
+    return {"ok": True}
+
+
+@backend_main.app.get("/_bench/admin", dependencies=[Depends(auth.require_admin)])
+def bench_admin():
+    return {"ok": True}
+
+
+def timed(fn, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    token = auth.create_access_token(1, "admin")["access_token"]
+    for i in range(1000):
+        auth.denylist.revoke_token(f"revogado-{i}", int(time.time()) + 3600)
+
+    decode = timed(lambda: auth.decode_access_token(token), args.requests)
+    print(f"decode_access_token        mediana={statistics.median(decode):8.1f} µs  (lista de revogação com {len(auth.denylist)} entradas)")
+
+    client = TestClient(backend_main.app)
+    headers = {"Authorization": f"Bearer {token}"}
+    for path, h in (("/_bench/public", {}), ("/_bench/admin", headers)):
+        client.get(path, headers=h)
+        del queries[:]
+        samples = timed(lambda: client.get(path, headers=h), args.requests)
+        print(f"GET {path:<22} mediana={statistics.median(samples):8.1f} µs  queries/req={len(queries) / args.requests:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+Benchmark de todos os endpoints do main.py, em processo, sobre um banco sintético.
+
+Gera um banco com generate_dataset.py (ou usa uma cópia de um já gerado), chama cada
+endpoint --repeat vezes pelo TestClient e registra latência (mediana, p95, mínimo), número
+de queries SQL e tamanho da resposta. Os caches de resposta (ETag e dashboard) são limpos
+antes de cada chamada: mede-se o trabalho feito no banco, não o cache. As escritas atuam
+sobre registros criados pelo próprio benchmark a cada rodada.
+
+O resultado é gravado em .maintenance/bench_results/<data>.json (uma entrada por endpoint,
+chaves ordenadas) e comparado com o resultado anterior gerado com os mesmos parâmetros de
+dados: latência acima de --threshold ou mais queries que antes aparecem como regressão.
+
+Uso:
+    python .maintenance/bench_endpoints.py [--plants 20] [--clients 2000] [--years 3] [--repeat 5]
+    python .maintenance/bench_endpoints.py --dataset sqlite:///dados.db     # banco já gerado (é copiado)
+    python .maintenance/bench_endpoints.py --baseline .maintenance/bench_results/x.json --fail-on-regression
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+RESULTS_DIR = Path(__file__).resolve().parent / "bench_results"
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument("--dataset", help="URL de um banco gerado por generate_dataset.py (SQLite é copiado antes)")
+parser.add_argument("--plants", type=int, default=20)
+parser.add_argument("--clients", type=int, default=2000)
+parser.add_argument("--years", type=int, default=3)
+parser.add_argument("--seed", type=int, default=42)
+parser.add_argument("--repeat", type=int, default=5)
+parser.add_argument("--output", help="arquivo de resultado (padrão: bench_results/<data>.json)")
+parser.add_argument("--baseline", help="resultado para comparar (padrão: o último com os mesmos parâmetros)")
+parser.add_argument("--threshold", type=float, default=0.25, help="aumento relativo de latência tolerado (0.25 = 25%%)")
+parser.add_argument("--min-delta-ms", type=float, default=2.0, help="diferença absoluta mínima para contar como regressão")
+parser.add_argument("--fail-on-regression", action="store_true", help="sai com código 1 se houver regressão")
+args = parser.parse_args()
+
+workdir = tempfile.mkdtemp()
+if args.dataset and args.dataset.startswith("sqlite:///"):
+    shutil.copy(args.dataset[len("sqlite:///"):], f"{workdir}/bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+else:
+    os.environ["DATABASE_URL"] = args.dataset or f"sqlite:///{workdir}/bench.db"
+os.chdir(workdir)
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import logging
+logging.disable(logging.WARNING)
+
+import generate_dataset # configura sys.path para o backend
+
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func
+
+import models
+from database import SessionLocal, async_engine, engine
+
+if args.dataset:
+    dataset = {"source": args.dataset}
+else:
+    print(f"Gerando dados: {args.plants} usinas, {args.clients} clientes, {args.years} anos...")
+    dataset = {"plants": args.plants, "clients": args.clients, "years": args.years, "seed": args.seed}
+    generate_dataset.generate(args.plants, args.clients, args.years, seed=args.seed)
+
+import main
+
+# --- Contagem de queries ---
+query_count = 0
+
+def _count_query(*_):
+    global query_count
+    query_count += 1
+
+for counted in filter(None, (engine, async_engine and async_engine.sync_engine)):
+    event.listen(counted, "before_cursor_execute", _count_query)
+
+
+# --- Endpoints ---
+def sample_pdf() -> bytes:
+    try:
+        from pypdf import PdfWriter
+    except ImportError:
+        return b"%PDF-1.4\n%%EOF\n"
+    writer, buffer = PdfWriter(), io.BytesIO()
+    writer.add_blank_page(width=595, height=842)
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def sample_context():
+    """Registros típicos do banco gerado: cliente do meio, sua usina, sua última fatura."""
+    with SessionLocal() as db:
+        month = db.query(func.max(models.Production.month)).scalar()
+        client_id = db.query(models.Client.id).order_by(models.Client.id).offset(db.query(models.Client).count() // 2).limit(1).scalar()
+        return {
+            "month": month,
+            "first_month": db.query(func.min(models.Production.month)).scalar(),
+            "client_id": client_id,
+            "uc_number": db.get(models.Client, client_id).uc_number,
+            "plant_id": db.query(models.PlantDistribution.plant_id).filter(models.PlantDistribution.client_id == client_id).limit(1).scalar(),
+            "invoice_id": db.query(models.Invoice.id).filter(models.Invoice.client_id == client_id).order_by(models.Invoice.id.desc()).limit(1).scalar(),
+            "operator_id": db.query(models.Operator.id).order_by(models.Operator.id).limit(1).scalar(),
+            "plant_ids": [p for (p,) in db.query(models.GenerationPlant.id).order_by(models.GenerationPlant.id).limit(50)],
+            "client_ids": [c for (c,) in db.query(models.Client.id).filter(models.Client.is_active.is_(True)).order_by(models.Client.id).limit(500)],
+        }
+
+
+def case(label, method, route, save=None, path=None, **request):
+    """
+    Um endpoint: `route` é o template do main.py, preenchido com o contexto da rodada; `path`
+    troca um parâmetro por outra chave do contexto (ex.: registros criados na rodada).
+    Valores callable em `request` são resolvidos com o contexto na hora da chamada.
+    """
+    return {"label": label, "method": method, "route": route, "save": save, "path": path or {}, "request": request}
+
+
+def month_ahead(month, offset):
+    year, number = map(int, month.split("-"))
+    index = year * 12 + number - 1 + offset
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+def cases(pdf):
+    invoice = lambda ctx: dict(
+        month=ctx["month"], consumption_kwh=250, kwh_value=0.8, kwh_value_original=1, kwh_value_injection=0.8,
+        client_id=ctx["new_client"], credited_balance=100, invoice_value=200, fixed_cost=30, total_invoiced=170,
+        amount_to_collect=200, value_without_discount=280, original_value=280, total_value=200, discount=80, profit=40,
+    )
+    return [
+        case("health", "GET", "/health/"),
+        case("login", "POST", "/login", json=lambda ctx: {"identifier": "bench@example.com", "password": generate_dataset.BENCH_PASSWORD, "user_type": "admin"},
+             save=lambda ctx, body: ctx.update(session_token=body["access_token"])),
+        # Leituras
+        case("plants (summary)", "GET", "/plants/"),
+        case("plants (full)", "GET", "/plants/", params={"view": "full", "limit": 20}),
+        case("plant distributions", "GET", "/plants/{plant_id}/distributions/"),
+        case("plant productions", "GET", "/plants/{plant_id}/productions/"),
+        case("clients (summary)", "GET", "/clients/", params={"view": "summary", "limit": 100}),
+        case("clients (full)", "GET", "/clients/", params={"view": "full", "limit": 100}),
+        case("clients by plant", "GET", "/clients/", params=lambda ctx: {"view": "summary", "plant_id": ctx["plant_id"]}),
+        case("client by uc", "GET", "/clients/{uc_number}"),
+        case("client by id", "GET", "/clients/id/{client_id}"),
+        case("client statement (page)", "GET", "/clients/{client_id}/statement", params={"limit": 50}),
+        case("client statement (stream)", "GET", "/clients/{client_id}/statement"),
+        case("client ledger", "GET", "/clients/{client_id}/ledger"),
+        case("client ledger (year)", "GET", "/clients/{client_id}/ledger", params=lambda ctx: {"month_from": month_ahead(ctx["month"], -11), "month_to": ctx["month"]}),
+        case("client balance", "GET", "/clients/{client_id}/balance", params=lambda ctx: {"month": ctx["month"]}),
+        case("invoices", "GET", "/invoices/", params={"limit": 100}),
+        case("invoices (open in month)", "GET", "/invoices/", params=lambda ctx: {"month_from": ctx["month"], "month_to": ctx["month"], "status_pago": False}),
+        case("invoices (client)", "GET", "/invoices/", params=lambda ctx: {"client_id": ctx["client_id"]}),
+        case("invoices (plant, month)", "GET", "/invoices/", params=lambda ctx: {"plant_id": ctx["plant_id"], "month_from": ctx["month"], "month_to": ctx["month"]}),
+        case("invoices pix (month)", "GET", "/invoices/pix", params=lambda ctx: {"month": ctx["month"]}),
+        case("invoice pix", "GET", "/invoices/{invoice_id}/pix"),
+        case("operators", "GET", "/operators/"),
+        case("operator", "GET", "/operators/{operator_id}"),
+        case("dashboard", "GET", "/admin/dashboard"),
+        case("dashboard (month)", "GET", "/admin/dashboard", params=lambda ctx: {"month": ctx["month"]}),
+        # Escritas sobre registros criados nesta rodada
+        case("create plant", "POST", "/plants/", json=lambda ctx: dict(
+            name="Usina Benchmark", address="-", uc_number=f"BENCH-P{ctx['round']}-{time.time_ns()}", capacity_kw=300,
+            acquisition_cost=1000000, maintenance_cost=900), save=lambda ctx, body: ctx.update(new_plant=body["id"])),
+        case("update plant", "PATCH", "/plants/{plant_id}", path={"plant_id": "new_plant"}, json={"maintenance_cost": 950}),
+        case("create client", "POST", "/clients/", json=lambda ctx: dict(
+            name="Cliente Benchmark", address="-", uc_number=f"BENCH-C{ctx['round']}-{time.time_ns()}",
+            email=f"bench-{ctx['round']}-{time.time_ns()}@example.com", password="bench", kwh_value_original=1, negotiated_discount=20,
+        ), save=lambda ctx, body: ctx.update(new_client=body["id"])),
+        case("update client", "PATCH", "/clients/{client_id}", path={"client_id": "new_client"}, json={"phone": "98999990000"}),
+        case("update client profile", "PATCH", "/clients/profile/{client_id}", path={"client_id": "new_client"}, json={"address": "Rua Nova, 1"}),
+        case("add client credits", "POST", "/clients/{client_id}/credits/", path={"client_id": "new_client"}, json={"credits_to_add": 10}),
+        case("adjust client credits", "POST", "/clients/{client_id}/adjust-credits/", path={"client_id": "new_client"}, json={"amount": 5, "description": "Ajuste benchmark"}),
+        case("set plant distributions", "POST", "/plants/{plant_id}/distributions/", path={"plant_id": "new_plant"},
+             json=lambda ctx: [{"plant_id": ctx["new_plant"], "client_id": ctx["new_client"], "percentage": 100}]),
+        case("create production", "POST", "/plants/{plant_id}/production/", path={"plant_id": "new_plant"}, json=lambda ctx: {"month": ctx["month"], "kwh_generated": 40000},
+             save=lambda ctx, body: ctx.update(new_production=body["id"])),
+        case("update production", "PATCH", "/productions/{production_id}", path={"production_id": "new_production"}, json={"kwh_generated": 41000}),
+        case("import productions (dry run)", "POST", "/productions/import", params={"dry_run": True}, json=lambda ctx: [
+            {"plant_id": plant_id, "month": month_ahead(ctx["month"], 1), "kwh_generated": 30000} for plant_id in ctx["plant_ids"]]),
+        case("import productions csv (dry run)", "POST", "/productions/import/csv", params={"dry_run": True}, files=lambda ctx: {"file": (
+            "producao.csv", "plant_id;month;kwh_generated\n" + "".join(f"{p};{month_ahead(ctx['month'], 1)};30000,5\n" for p in ctx["plant_ids"]))}),
+        case("create invoice", "POST", "/invoices/", json=invoice, save=lambda ctx, body: ctx.update(new_invoice=body["id"])),
+        case("update invoice", "PATCH", "/invoices/{invoice_id}", path={"invoice_id": "new_invoice"}, json={"credited_balance": 120, "status_pago": True}),
+        case("upload equatorial pdf", "POST", "/invoices/{invoice_id}/upload-equatorial", path={"invoice_id": "new_invoice"}, files=lambda ctx: {"file": ("conta.pdf", pdf, "application/pdf")}),
+        case("parse equatorial pdf", "POST", "/equatorial/parse", files=lambda ctx: {"file": ("conta.pdf", pdf, "application/pdf")}),
+        case("equatorial batch (preview)", "POST", "/equatorial/batch", params=lambda ctx: {"month": ctx["month"]}),
+        case("billing run (dry run)", "POST", "/billing/runs", params={"dry_run": True}, json=lambda ctx: {
+            "month": month_ahead(ctx["month"], 1), "readings": [{"client_id": c, "consumption_kwh": 300} for c in ctx["client_ids"]]}),
+        case("credit snapshots", "POST", "/admin/credits/snapshots", params=lambda ctx: {"month": ctx["month"]}),
+        case("reconcile balances (report)", "POST", "/admin/credits/reconcile"),
+        case("rebuild rollups", "POST", "/admin/rollups/rebuild"),
+        case("metrics", "GET", "/metrics"),
+        case("dashboard (profiled)", "GET", "/admin/dashboard", headers={"X-Profile": "1"}),
+        case("profiles", "GET", "/admin/profiles", save=lambda ctx, body: ctx.update(profile_id=body[0]["id"])),
+        case("profile", "GET", "/admin/profiles/{profile_id}"),
+        case("slow queries", "GET", "/admin/slow-queries"),
+        case("create operator", "POST", "/operators/", json=lambda ctx: dict(
+            full_name="Operador Benchmark", email=f"op-{ctx['round']}-{time.time_ns()}@example.com", cpf=str(time.time_ns()), password="bench"),
+            save=lambda ctx, body: ctx.update(new_operator=body["id"])),
+        case("update operator", "PATCH", "/operators/{operator_id}", path={"operator_id": "new_operator"}, json={"full_name": "Operador Benchmark 2"}),
+        case("delete operator", "DELETE", "/operators/{operator_id}", path={"operator_id": "new_operator"}),
+        case("delete production", "DELETE", "/productions/{production_id}", path={"production_id": "new_production"}),
+        case("delete invoice", "DELETE", "/invoices/{invoice_id}", path={"invoice_id": "new_invoice"}),
+        case("delete client", "DELETE", "/clients/{client_id}", path={"client_id": "new_client"}),
+        case("logout", "POST", "/logout", headers=lambda ctx: {"Authorization": f"Bearer {ctx['session_token']}"}),
+    ]
+
+
+def resolve(value, ctx):
+    return value(ctx) if callable(value) else value
+
+
+def run_case(http, item, ctx, headers):
+    global query_count
+    request = {key: resolve(value, ctx) for key, value in item["request"].items()}
+    request["headers"] = {**headers, **request.get("headers", {})}
+    path = item["route"].format(**{**ctx, **{key: ctx[source] for key, source in item["path"].items()}})
+    main.response_cache.invalidate()
+    main.dashboard_cache.invalidate()
+    query_count = 0
+    start = time.perf_counter()
+    response = http.request(item["method"], path, **request)
+    elapsed = (time.perf_counter() - start) * 1000
+    if item["save"] and response.status_code < 400:
+        item["save"](ctx, response.json())
+    return {"ms": elapsed, "queries": query_count, "bytes": len(response.content), "status": response.status_code}
+
+
+def run(repeat):
+    ctx = sample_context()
+    items = cases(sample_pdf())
+    routes = {(method, route.path) for route in main.app.routes if isinstance(route, APIRoute) for method in route.methods}
+    missing = routes - {(item["method"], item["route"]) for item in items}
+    if missing:
+        print("Endpoints sem caso no benchmark: " + ", ".join(f"{m} {p}" for m, p in sorted(missing, key=lambda r: r[1])))
+
+    samples = {item["label"]: [] for item in items}
+    with TestClient(main.app) as http:
+        token = http.post("/login", json={"identifier": "bench@example.com", "password": generate_dataset.BENCH_PASSWORD,
+                                          "user_type": "admin"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        for round_number in range(repeat + 1): # a rodada 0 aquece imports e caches do processo
+            ctx["round"] = round_number
+            for item in items:
+                sample = run_case(http, item, ctx, headers)
+                if round_number:
+                    samples[item["label"]].append(sample)
+
+    results = {}
+    for item in items:
+        runs = samples[item["label"]]
+        latencies = sorted(s["ms"] for s in runs)
+        results[item["label"]] = {
+            "method": item["method"],
+            "route": item["route"],
+            "status": runs[-1]["status"],
+            "latency_ms": {
+                "median": round(statistics.median(latencies), 2),
+                "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+                "min": round(latencies[0], 2),
+            },
+            "queries": int(statistics.median(s["queries"] for s in runs)),
+            "response_bytes": int(statistics.median(s["bytes"] for s in runs)),
+        }
+    return results
+
+
+# --- Resultado e comparação ---
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RESULTS_DIR.parent, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def find_baseline(meta, output):
+    for path in sorted(glob.glob(str(RESULTS_DIR / "*.json")), reverse=True):
+        if Path(path) == output:
+            continue
+        with open(path) as f:
+            previous = json.load(f)
+        if previous["meta"]["dataset"] == meta["dataset"] and previous["meta"]["database"] == meta["database"]:
+            return path, previous
+    return None, None
+
+
+def compare(baseline, current):
+    """Tabela endpoint a endpoint contra o resultado anterior. Retorna o número de regressões."""
+    regressions = 0
+    print(f"\n{'endpoint':<34} {'mediana ms':>22} {'queries':>12} {'bytes':>18}")
+    for label, result in current.items():
+        before = baseline.get(label)
+        ms, queries, size = result["latency_ms"]["median"], result["queries"], result["response_bytes"]
+        if before is None:
+            print(f"{label:<34} {ms:>22.2f} {queries:>12} {size:>18}   (novo)")
+            continue
+        old_ms = before["latency_ms"]["median"]
+        slower = ms > old_ms * (1 + args.threshold) and ms - old_ms > args.min_delta_ms
+        more_queries = queries > before["queries"]
+        flag = "   REGRESSÃO" if slower or more_queries else ""
+        regressions += bool(flag)
+        change = f"{(ms - old_ms) / old_ms:+.0%}" if old_ms else ""
+        columns = (f"{old_ms:.2f} -> {ms:.2f} {change}", f"{before['queries']} -> {queries}", f"{before['response_bytes']} -> {size}")
+        print(f"{label:<34} {columns[0]:>22} {columns[1]:>12} {columns[2]:>18}{flag}")
+    for label in sorted(set(baseline) - set(current)):
+        print(f"{label:<34} (removido)")
+    return regressions
+
+
+def main_cli():
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{datetime.utcnow():%Y%m%d-%H%M%S}.json"
+    meta = {
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "database": engine.dialect.name,
+        "dataset": dataset,
+        "repeat": args.repeat,
+    }
+    results = run(args.repeat)
+
+    if args.baseline:
+        baseline_path = args.baseline
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    else:
+        baseline_path, baseline = find_baseline(meta, output)
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"meta": meta, "endpoints": results}, f, indent=2, sort_keys=True, ensure_ascii=False)
+        f.write("\n")
+
+    errors = {label: r["status"] for label, r in results.items() if r["status"] >= 400}
+    if baseline:
+        print(f"Comparando com {baseline_path}")
+        regressions = compare(baseline["endpoints"], results)
+    else:
+        regressions = 0
+        print(f"\n{'endpoint':<34} {'mediana ms':>10} {'p95 ms':>10} {'queries':>8} {'bytes':>10}")
+        for label, r in results.items():
+            print(f"{label:<34} {r['latency_ms']['median']:>10.2f} {r['latency_ms']['p95']:>10.2f} {r['queries']:>8} {r['response_bytes']:>10}")
+    if errors:
+        print("\nRespostas com erro: " + ", ".join(f"{label} ({status})" for label, status in errors.items()))
+    print(f"\nResultado gravado em {output}")
+    if regressions:
+        print(f"{regressions} endpoints com regressão")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
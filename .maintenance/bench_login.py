@@ -0,0 +1,117 @@
+"""
+Benchmark de login: vazão e latência (p50/p99) sob tentativas concorrentes.
+
+Sobe o backend com uvicorn (um worker) num banco SQLite temporário, cria um operador e
+um cliente e dispara logins concorrentes. Em paralelo mede GET /plants/ para mostrar se
+os logins estão roubando as threads dos demais endpoints.
+
+Uso:
+    python .maintenance/bench_login.py [--requests 400] [--concurrency 32] [--rounds 12]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+
+def start_server(port, rounds):
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{workdir}/bench.db")
+    env["PYTHONPATH"] = str(BACKEND_DIR)
+    env["BCRYPT_ROUNDS"] = str(rounds)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{base}/plants/", timeout=1)
+            return proc, base
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.kill()
+    raise SystemExit("Servidor não subiu")
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=12, help="BCRYPT_ROUNDS do servidor")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    proc, base = start_server(args.port, args.rounds)
+    try:
+        stamp = time.time()
+        httpx.post(f"{base}/operators/", json=dict(
+            full_name="Bench", email=f"bench{stamp}@example.com", cpf=str(int(stamp)), password="segredo123",
+        )).raise_for_status()
+        httpx.post(f"{base}/clients/", json=dict(
+            name="Bench", address="-", uc_number=f"BENCH-{stamp}", email=f"client{stamp}@example.com", password="segredo123",
+        )).raise_for_status()
+        bodies = [
+            {"identifier": f"bench{stamp}@example.com", "password": "segredo123", "user_type": "admin"},
+            {"identifier": f"BENCH-{stamp}", "password": "segredo123", "user_type": "client"},
+        ]
+
+        latencies, statuses = [], {}
+        lock = threading.Lock()
+
+        def attempt(i):
+            with httpx.Client(base_url=base, timeout=120) as http:
+                start = time.perf_counter()
+                r = http.post("/login", json=bodies[i % 2])
+                elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+        stop, probe = threading.Event(), []
+
+        def probe_loop():
+            with httpx.Client(base_url=base, timeout=120) as http:
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    http.get("/plants/")
+                    probe.append((time.perf_counter() - start) * 1000)
+                    time.sleep(0.02)
+
+        prober = threading.Thread(target=probe_loop)
+        prober.start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(attempt, range(args.requests)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        prober.join()
+
+        print(f"bcrypt rounds={args.rounds} | {args.requests} logins, concorrência {args.concurrency}")
+        print(f"status: {statuses}")
+        print(f"vazão: {args.requests / elapsed:.1f} logins/s")
+        print(f"login       p50={statistics.median(latencies):8.1f} ms  p99={percentile(latencies, 0.99):8.1f} ms")
+        print(f"GET /plants p50={statistics.median(probe):8.1f} ms  p99={percentile(probe, 0.99):8.1f} ms  (durante os logins)")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark: latência das requisições comuns enquanto PDFs grandes estão sendo enviados.
+
+Sobe o backend com uvicorn (um worker) num diretório temporário, mede a latência de
+GET /plants/ sem carga e depois durante um lote de uploads concorrentes para
+/invoices/{id}/upload-equatorial. Se o upload bloquear o event loop, o p95/máximo das
+requisições comuns sobe junto com o tamanho dos arquivos.
+
+Uso:
+    python .maintenance/bench_upload_concurrency.py [--uploads 8] [--size-mb 10] [--port 8765]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+
+def start_server(port):
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{workdir}/bench.db")
+    env["PYTHONPATH"] = str(BACKEND_DIR)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{base}/plants/", timeout=1)
+            return proc, base
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.kill()
+    raise SystemExit("Servidor não subiu")
+
+
+def seed(base):
+    client_id = httpx.post(f"{base}/clients/", json=dict(
+        name="Bench", address="-", uc_number=f"BENCH-{time.time()}", email=f"bench{time.time()}@example.com", password="-",
+    )).json()["id"]
+    invoice = httpx.post(f"{base}/invoices/", json=dict(
+        month="2025-01", consumption_kwh=100, kwh_value=1, kwh_value_original=1, kwh_value_injection=1,
+        client_id=client_id, credited_balance=0, invoice_value=0, fixed_cost=0, total_invoiced=0,
+        amount_to_collect=0, value_without_discount=0, original_value=0, total_value=0, discount=0, profit=0,
+    )).json()
+    return invoice["id"]
+
+
+def probe(base, stop, samples):
+    with httpx.Client(base_url=base, timeout=60) as http:
+        while not stop.is_set():
+            start = time.perf_counter()
+            http.get("/plants/")
+            samples.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.01)
+
+
+def summary(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1] if len(samples) >= 20 else samples[-1]
+    print(f"{label:<22} n={len(samples):<5} p50={statistics.median(samples):7.1f} ms  p95={p95:7.1f} ms  max={samples[-1]:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--uploads", type=int, default=8)
+    parser.add_argument("--size-mb", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    proc, base = start_server(args.port)
+    try:
+        invoice_id = seed(base)
+
+        stop, idle = threading.Event(), []
+        t = threading.Thread(target=probe, args=(base, stop, idle))
+        t.start()
+        time.sleep(2)
+        stop.set()
+        t.join()
+
+        # Conteúdos distintos: cada upload grava um arquivo novo
+        payloads = [b"%PDF-1.4\n" + os.urandom(int(args.size_mb * 1024 * 1024)) for _ in range(args.uploads)]
+        stop, loaded, upload_times = threading.Event(), [], []
+
+        def upload(content):
+            start = time.perf_counter()
+            r = httpx.post(f"{base}/invoices/{invoice_id}/upload-equatorial",
+                           files={"file": ("conta.pdf", content, "application/pdf")}, timeout=300)
+            r.raise_for_status()
+            upload_times.append(time.perf_counter() - start)
+
+        t = threading.Thread(target=probe, args=(base, stop, loaded))
+        t.start()
+        time.sleep(0.2)
+        uploaders = [threading.Thread(target=upload, args=(content,)) for content in payloads]
+        batch_start = time.perf_counter()
+        for u in uploaders:
+            u.start()
+        for u in uploaders:
+            u.join()
+        batch_time = time.perf_counter() - batch_start
+        stop.set()
+        t.join()
+
+        print(f"{args.uploads} uploads de {args.size_mb:g} MB em {batch_time:.2f}s "
+              f"(mais lento {max(upload_times):.2f}s)")
+        summary("GET /plants/ ocioso", idle)
+        summary("GET /plants/ c/ upload", loaded)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Conferência do leitor de contas da Equatorial com as contas de exemplo.
+
+Lê cada PDF de uploads/equatorial_invoices com equatorial.parse_pdf (sem cache: o
+resultado vai para um diretório temporário) e compara os campos com os valores
+conferidos à mão na própria conta. Falha (exit 1) se algum campo divergir; rode depois
+de mexer em equatorial.PATTERNS e suba o PARSER_VERSION.
+
+Uso:
+    python .maintenance/check_equatorial_samples.py [--samples-dir uploads/equatorial_invoices] [--verbose]
+
+Precisa do pacote pypdf (backend/requirements.txt).
+"""
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+import equatorial
+
+# Conta FEV/2026 da UC 690140988 (a própria usina: geração no ciclo, consumo no mínimo)
+GENERATOR_FEB_2026 = {
+    "month": "2026-02", "uc_number": "690140988", "consumption_kwh": 100.0,
+    "kwh_value_original": 1.12652, "injected_kwh": 1473.0, "credited_balance": 0.0,
+}
+EXPECTED = {
+    "invoice_1_690140988.pdf": GENERATOR_FEB_2026,
+    # Cita "CADASTRO RATEIO GERAÇÃO: UC 690140988 = 10%": a UC da conta é outra
+    "invoice_2_690010138.pdf": {
+        "month": "2026-02", "uc_number": "690010138", "consumption_kwh": 183.0,
+        "kwh_value_original": 1.12652, "injected_kwh": 0.0, "credited_balance": 0.0,
+    },
+    # Mesma conta sem a UC na linha de baixo do mês: só a do canhoto
+    "invoice_3_690140988.pdf": GENERATOR_FEB_2026,
+    "invoice_4_690140988.pdf": GENERATOR_FEB_2026,
+}
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument("--samples-dir", type=Path, default=ROOT / "uploads" / "equatorial_invoices")
+parser.add_argument("--verbose", action="store_true", help="mostra os campos lidos de cada conta")
+args = parser.parse_args()
+
+if equatorial.PdfReader is None:
+    sys.exit("pypdf não instalado: pip install -r backend/requirements.txt")
+
+failures = 0
+cache_dir = Path(tempfile.mkdtemp())
+for name, expected in EXPECTED.items():
+    path = args.samples_dir / name
+    if not path.exists():
+        print(f"FALTA  {name}")
+        failures += 1
+        continue
+    result = equatorial.parse_pdf(path, cache_dir=cache_dir)
+    if result["error"]:
+        print(f"ERRO   {name}: {result['error']}")
+        failures += 1
+        continue
+    fields = result["fields"]
+    wrong = {field: (fields.get(field), value) for field, value in expected.items() if fields.get(field) != value}
+    print(f"{'OK    ' if not wrong else 'FALHOU'} {name}")
+    for field, (got, value) in wrong.items():
+        print(f"    {field}: lido {got!r}, esperado {value!r}")
+    if args.verbose:
+        print(f"    {fields}")
+    failures += bool(wrong)
+
+print(f"\n{len(EXPECTED) - failures}/{len(EXPECTED)} contas conferem")
+sys.exit(1 if failures else 0)
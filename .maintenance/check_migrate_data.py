@@ -0,0 +1,96 @@
+"""
+Teste local do backend/migrate_data.py: SQLite -> SQLite (ou -> --target de teste).
+
+Gera uma origem com dados sintéticos, interrompe a primeira cópia no meio (falha
+simulada ao gravar um checkpoint), roda de novo para retomar e confere que o destino
+ficou idêntico à origem (contagem e checksum por tabela) e que nenhuma linha duplicou.
+
+Uso:
+    python .maintenance/check_migrate_data.py [--target postgresql://.../banco_de_teste] [--clients 300]
+"""
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument("--target")
+parser.add_argument("--clients", type=int, default=300)
+parser.add_argument("--batch-size", type=int, default=100)
+args = parser.parse_args()
+
+workdir = tempfile.mkdtemp()
+source_url = f"sqlite:///{workdir}/source.db"
+target_url = args.target or f"sqlite:///{workdir}/target.db"
+os.environ["DATABASE_URL"] = source_url
+os.chdir(workdir)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import logging
+logging.disable(logging.INFO)
+
+import crud, models, schemas, migrations
+import migrate_data
+from database import SessionLocal, engine
+
+
+def seed():
+    models.Base.metadata.create_all(bind=engine)
+    migrations.run_migrations(engine)
+    with SessionLocal() as db:
+        plants = [crud.create_generation_plant(db, schemas.GenerationPlantCreate(
+            name=f"Usina {p}", address="-", uc_number=f"MIG-P{p}", capacity_kw=100, acquisition_cost=0, maintenance_cost=0,
+        )) for p in range(5)]
+        clients = [crud.create_client(db, schemas.ClientCreate(
+            name=f"Cliente {c}", address="-", uc_number=f"MIG-C{c}", email=f"mig{c}@example.com", password="-",
+            kwh_value_original=0.95, negotiated_discount=15,
+        )) for c in range(args.clients)]
+        for i, plant in enumerate(plants):
+            members = clients[i::len(plants)]
+            crud.set_plant_distributions(db, plant.id, [schemas.PlantDistributionCreate(
+                plant_id=plant.id, client_id=client.id, percentage=100 / len(members)) for client in members])
+            crud.import_productions(db, [{"plant_id": plant.id, "month": f"2025-{m:02d}", "kwh_generated": 4321.5} for m in range(1, 13)])
+        crud.run_billing(db, schemas.BillingRunRequest(month="2025-12", readings=[
+            schemas.BillingReading(client_id=client.id, consumption_kwh=150.25) for client in clients
+        ]))
+        crud.create_credit_snapshots(db, "2025-06")
+
+
+def run(reset=False):
+    options = argparse.Namespace(source=source_url, target=target_url, batch_size=args.batch_size, workers=4,
+                                 reset=reset, migrate_source=False, no_verify=False)
+    return migrate_data.migrate(options)
+
+
+def main():
+    seed()
+
+    # 1. Falha simulada no meio da cópia
+    original = migrate_data.save_checkpoint
+    calls = {"n": 0}
+    def failing_checkpoint(*a, **kw):
+        calls["n"] += 1
+        if calls["n"] == 12:
+            raise RuntimeError("falha simulada")
+        return original(*a, **kw)
+    migrate_data.save_checkpoint = failing_checkpoint
+    try:
+        run(reset=True)
+        raise SystemExit("FALHA: a cópia interrompida deveria ter falhado")
+    except RuntimeError as e:
+        print(f"Primeira execução interrompida: {e}")
+    finally:
+        migrate_data.save_checkpoint = original
+
+    # 2. Retomada a partir dos checkpoints, com conferência de contagem e checksum
+    if run() != 0:
+        raise SystemExit("FALHA: destino divergente após retomar")
+    # 3. Rodar de novo com tudo concluído não copia nada
+    if run() != 0:
+        raise SystemExit("FALHA: reexecução alterou o destino")
+    print("\nMigração retomável conferida.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Verificação dos planos de execução das queries quentes do crud.
+
+Popula um banco de teste, executa as funções do crud usadas pelo extrato, saldo, livro,
+listagens de faturas/produção/rateios, PIX e faturamento em lote, captura cada SELECT
+emitido e roda EXPLAIN sobre ele. Falha (exit 1) se alguma delas varrer inteira uma das
+tabelas grandes em vez de buscar por índice:
+
+- SQLite: linha "SCAN <tabela>" no EXPLAIN QUERY PLAN (inclusive varredura completa de índice);
+- PostgreSQL: nó "Seq Scan on <tabela>" com enable_seqscan=off (com poucas linhas o
+  planejador prefere seq scan mesmo havendo índice; desligado, só o usa se não houver outro caminho).
+
+Uso:
+    python .maintenance/check_query_plans.py [--database-url postgresql://.../banco_de_teste] [--verbose]
+
+Sem --database-url usa um SQLite temporário. Nunca aponte para o banco de produção: o
+script insere dados sintéticos.
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument("--database-url")
+parser.add_argument("--verbose", action="store_true", help="mostra o plano de todas as queries")
+args = parser.parse_args()
+
+workdir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{workdir}/plans.db"
+os.chdir(workdir)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import logging
+logging.disable(logging.INFO)
+
+from sqlalchemy import event, text
+
+import crud, models, schemas, migrations
+from fixedpoint import share
+from database import SessionLocal, engine
+
+# Tabelas que crescem com o tempo: nenhuma query por cliente/usina/mês pode varrê-las
+LARGE_TABLES = {
+    "invoices", "production", "plant_distributions", "production_allocations", "credit_adjustments",
+    "credit_movements", "credit_balance_snapshots",
+}
+N_PLANTS, N_CLIENTS, N_MONTHS = 10, 300, 24
+MONTHS = [f"{2024 + m // 12}-{m % 12 + 1:02d}" for m in range(N_MONTHS)]
+
+
+def seed(db):
+    db.add_all(models.GenerationPlant(name=f"Usina {p}", address="-", uc_number=f"PLAN-P{p}", capacity_kw=100,
+                                      pix_key="chave@pix.com") for p in range(N_PLANTS))
+    db.add_all(models.Client(name=f"Cliente {c}", address="-", uc_number=f"PLAN-C{c}", email=f"plan{c}@example.com",
+                             password="-", kwh_value_original=1.0, negotiated_discount=20) for c in range(N_CLIENTS))
+    db.flush()
+    plant_ids = [p.id for p in db.query(models.GenerationPlant.id)]
+    client_ids = [c.id for c in db.query(models.Client.id)]
+    db.add_all(models.PlantDistribution(plant_id=plant_ids[i % N_PLANTS], client_id=client_id, percentage=100.0 * N_PLANTS / N_CLIENTS)
+               for i, client_id in enumerate(client_ids))
+    db.add_all(models.Production(plant_id=plant_id, month=month, kwh_generated=5000) for plant_id in plant_ids for month in MONTHS)
+    db.flush()
+    percentage = 100.0 * N_PLANTS / N_CLIENTS
+    db.add_all(models.ProductionAllocation(production_id=production.id, plant_id=production.plant_id, client_id=client_id,
+                                           month=production.month, percentage=percentage, kwh=share(percentage, 5000))
+               for production in db.query(models.Production)
+               for i, client_id in enumerate(client_ids) if plant_ids[i % N_PLANTS] == production.plant_id)
+    db.add_all(models.Invoice(client_id=client_id, month=month, consumption_kwh=100, credited_balance=50, total_value=80, amount_to_collect=80,
+                              profit=16, status="aberto", status_pago=month < MONTHS[-3])
+               for client_id in client_ids for month in MONTHS[::2])
+    db.add_all(models.CreditAdjustment(client_id=client_id, amount=10, description="Ajuste") for client_id in client_ids[::5])
+    db.commit()
+    crud.ensure_credit_ledger(db)
+    crud.create_credit_snapshots(db, MONTHS[12])
+    db.execute(text("ANALYZE"))
+    db.commit()
+    return plant_ids, client_ids
+
+
+def hot_queries(plant_ids, client_ids):
+    client_id, plant_id, month = client_ids[len(client_ids) // 2], plant_ids[3], MONTHS[-2]
+    billing = schemas.BillingRunRequest(month=MONTHS[-1], readings=[
+        schemas.BillingReading(client_id=c, consumption_kwh=100) for c in client_ids[:50]
+    ])
+    return [
+        ("extrato (página)", lambda db: crud.get_client_statement(db, client_id, limit=50)),
+        ("saldo no mês", lambda db: crud.get_client_balance(db, client_id, MONTHS[-1])),
+        ("livro de créditos", lambda db: crud.get_client_ledger(db, client_id, MONTHS[6], MONTHS[12])),
+        ("faturas do cliente", lambda db: crud.get_invoices(db, client_id=client_id, limit=20)),
+        ("faturas em aberto do mês", lambda db: crud.get_invoices(db, month_from=month, month_to=month, status_pago=False, limit=50)),
+        ("faturas da usina", lambda db: crud.get_invoices(db, plant_id=plant_id, month_from=month, month_to=month, limit=50)),
+        ("produção da usina", lambda db: crud.get_plant_productions(db, plant_id)),
+        ("rateio da usina", lambda db: crud.get_plant_distributions(db, plant_id)),
+        ("rateio da usina no mês", lambda db: crud.get_plant_distributions(db, plant_id, month=month)),
+        ("resumo das usinas", lambda db: crud.get_generation_plants(db, view="summary")),
+        ("PIX do mês", lambda db: crud.get_month_pix_payloads(db, month)),
+        ("faturamento (simulação)", lambda db: crud.run_billing(db, billing, dry_run=True)),
+    ]
+
+
+def explain(connection, statement, parameters):
+    cursor = connection.cursor()
+    try:
+        if engine.dialect.name == "postgresql":
+            cursor.execute("SET enable_seqscan = off")
+            cursor.execute("EXPLAIN " + statement, parameters)
+        else:
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        return [" ".join(str(col) for col in row[-1:]) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def full_scans(plan):
+    pattern = r"Seq Scan on (\w+)" if engine.dialect.name == "postgresql" else r"^SCAN (\w+)"
+    return {match.group(1) for line in plan for match in [re.search(pattern, line.strip())] if match} & LARGE_TABLES
+
+
+def main():
+    models.Base.metadata.create_all(bind=engine)
+    migrations.run_migrations(engine)
+    with SessionLocal() as db:
+        plant_ids, client_ids = seed(db)
+
+    captured = []
+    listener = lambda conn, cursor, statement, parameters, context, executemany: \
+        captured.append((statement, parameters)) if statement.lstrip().upper().startswith(("SELECT", "WITH")) else None
+    event.listen(engine, "before_cursor_execute", listener)
+
+    failures = 0
+    for label, run in hot_queries(plant_ids, client_ids):
+        del captured[:]
+        with SessionLocal() as db:
+            run(db)
+            db.rollback()
+        raw = engine.raw_connection()
+        try:
+            label_failures = 0
+            for statement, parameters in captured:
+                plan = explain(raw, statement, parameters)
+                scanned = full_scans(plan)
+                label_failures += bool(scanned)
+                if scanned or args.verbose:
+                    print(f"{'FALHA' if scanned else '':<5} {label}: varredura completa de {', '.join(sorted(scanned)) or '-'}")
+                    print("      " + " ".join(statement.split())[:200])
+                    print("\n".join(f"        {line}" for line in plan))
+        finally:
+            raw.close()
+        if not label_failures:
+            print(f"ok    {label} ({len(captured)} queries)")
+        failures += label_failures
+
+    if failures:
+        print(f"\n{failures} queries varrem tabelas grandes sem índice.")
+        sys.exit(1)
+    print("\nTodas as queries quentes usam índices.")
+
+
+if __name__ == "__main__":
+    main()
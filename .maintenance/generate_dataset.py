@@ -0,0 +1,269 @@
+"""
+Gerador de dados sintéticos em escala (usinas, clientes, rateios, produção, faturas, livro).
+
+Simula mês a mês a operação real: cada usina gera conforme a capacidade e a sazonalidade,
+a geração é rateada entre os clientes, cada cliente consome, a fatura debita os créditos
+disponíveis (crud.compute_invoice_values) e tudo entra no livro razão. Saldos, snapshots de
+fim de ano e rollups mensais ficam consistentes com o histórico, então o banco gerado
+passa na reconciliação e serve de base para os benchmarks (bench_endpoints.py).
+
+Os dados são determinísticos para os mesmos parâmetros (--seed, --end-month). As linhas
+entram por INSERT em lote direto nas tabelas, sem passar pelos endpoints.
+
+Uso:
+    python .maintenance/generate_dataset.py [--database-url sqlite:///dados.db] [--plants 200] [--clients 20000] [--years 10]
+
+Sem --database-url grava num SQLite temporário e mostra o caminho. O banco de destino
+precisa estar vazio: nunca aponte para o banco de produção.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+# Fator de geração por mês (1 = média do ano)
+SEASONALITY = (1.00, 0.95, 0.93, 0.94, 1.00, 1.04, 1.08, 1.12, 1.12, 1.08, 1.02, 0.98)
+PLANT_SIZES_KW = (75, 150, 300, 500, 1000, 2500)
+CAPACITY_FACTOR = 0.18
+HOURS_PER_MONTH = 730
+BENCH_PASSWORD = "bench" # Senha do operador e dos clientes gerados
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database-url")
+    parser.add_argument("--plants", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=20000)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--end-month", default="2025-12", help="último mês gerado (YYYY-MM)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    if not args.database_url:
+        args.database_url = f"sqlite:///{tempfile.mkdtemp()}/dataset.db"
+    return args
+
+
+# models importa database, que cria o engine da aplicação a partir de DATABASE_URL
+if __name__ == "__main__":
+    ARGS = parse_args()
+    os.environ["DATABASE_URL"] = ARGS.database_url
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from sqlalchemy import bindparam, insert, text, update
+
+import crud, models, migrations, security
+from database import SessionLocal, engine
+from fixedpoint import kwh, percent, share
+from migrate_data import fix_sequences
+
+
+def month_range(end_month: str, count: int) -> list:
+    year, month = map(int, end_month.split("-"))
+    index = year * 12 + month - 1
+    return [f"{i // 12}-{i % 12 + 1:02d}" for i in range(index - count + 1, index + 1)]
+
+
+def month_date(month: str, day: int = 1) -> datetime:
+    year, number = map(int, month.split("-"))
+    return datetime(year, number, day)
+
+
+def split_percentages(rng, count: int) -> list:
+    """`count` percentuais (4 casas) somando exatamente 100%."""
+    total = 100 * 10 ** 4
+    weights = [rng.uniform(0.5, 2.0) for _ in range(count)]
+    units = [int(total * w / sum(weights)) for w in weights]
+    units[-1] += total - sum(units)
+    return [Decimal(u).scaleb(-4) for u in units]
+
+
+class BatchWriter:
+    """Acumula linhas por tabela e grava em INSERTs em lote (executemany)."""
+
+    def __init__(self, conn, batch_size: int):
+        self.conn, self.batch_size = conn, batch_size
+        self.pending, self.counts = {}, {}
+
+    def add(self, model, row: dict):
+        rows = self.pending.setdefault(model, [])
+        rows.append(row)
+        if len(rows) >= self.batch_size:
+            self.flush(model)
+
+    def flush(self, model=None):
+        for key in [model] if model is not None else list(self.pending):
+            rows = self.pending.pop(key, [])
+            if rows:
+                self.conn.execute(insert(key.__table__), rows)
+                self.counts[key.__tablename__] = self.counts.get(key.__tablename__, 0) + len(rows)
+
+
+def generate(n_plants: int, n_clients: int, years: int, end_month: str = "2025-12", seed: int = 42,
+             batch_size: int = 5000) -> dict:
+    """Popula o banco de DATABASE_URL (vazio). Retorna {tabela: linhas inseridas}."""
+    models.Base.metadata.create_all(bind=engine)
+    migrations.run_migrations(engine)
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT 1 FROM clients LIMIT 1")).first():
+            raise SystemExit("O banco de destino já tem clientes: use um banco vazio")
+
+    rng = random.Random(seed)
+    months = month_range(end_month, years * 12)
+    password = security.hash_password(BENCH_PASSWORD) # um hash para todos: bcrypt por cliente levaria minutos
+
+    with engine.begin() as conn:
+        writer = BatchWriter(conn, batch_size)
+        writer.add(models.Operator, dict(id=1, full_name="Operador Benchmark", email="bench@example.com",
+                                         cpf="00000000000", hashed_password=password, is_active=True))
+
+        # Usinas e geração mensal
+        plants = []
+        for p in range(1, n_plants + 1):
+            capacity = rng.choice(PLANT_SIZES_KW)
+            plants.append({"id": p, "capacity": capacity})
+            writer.add(models.GenerationPlant, dict(
+                id=p, name=f"Usina {p:04d}", address=f"Rodovia MA-{100 + p % 300}, km {p % 90}",
+                uc_number=f"GEN{p:08d}", capacity_kw=capacity, acquisition_cost=Decimal(capacity * 4200),
+                maintenance_cost=Decimal(capacity * 3), is_active=rng.random() > 0.03, pix_key=f"usina{p}@pix.example.com",
+            ))
+        production = {} # (plant_id, month) -> (production_id, kWh)
+        for plant in plants:
+            for month in months:
+                generated = kwh(plant["capacity"] * HOURS_PER_MONTH * CAPACITY_FACTOR
+                                * SEASONALITY[int(month[5:]) - 1] * rng.uniform(0.85, 1.08))
+                production[plant["id"], month] = (len(production) + 1, generated)
+                writer.add(models.Production, dict(
+                    id=len(production), plant_id=plant["id"], month=month, kwh_generated=generated,
+                    created_at=month_date(month, 28),
+                ))
+
+        # Clientes e rateio: cada cliente numa usina, ~10% também numa segunda
+        client_ids = list(range(1, n_clients + 1))
+        members = {plant["id"]: [] for plant in plants}
+        for index, client_id in enumerate(rng.sample(client_ids, n_clients)):
+            members[plants[index % n_plants]["id"]].append(client_id)
+            if rng.random() < 0.1:
+                members[rng.choice(plants)["id"]].append(client_id)
+        memberships = {client_id: [] for client_id in client_ids} # client_id -> [(plant_id, percentage)]
+        for plant_id, plant_clients in members.items():
+            plant_clients = sorted(set(plant_clients))
+            for client_id, percentage in zip(plant_clients, split_percentages(rng, len(plant_clients))):
+                memberships[client_id].append((plant_id, percentage))
+                writer.add(models.PlantDistribution, dict(plant_id=plant_id, client_id=client_id, percentage=percentage))
+
+        clients = {}
+        for client_id in client_ids:
+            expected = sum(float(p) / 100 * float(production[plant_id, months[-1]][1]) for plant_id, p in memberships[client_id])
+            clients[client_id] = dict(
+                consumption=max(100.0, expected * rng.uniform(0.7, 1.3)),
+                tariff=Decimal(rng.choice(("0.89", "0.95", "1.02", "1.10"))),
+                discount=percent(rng.choice((10, 15, 20, 25))),
+            )
+            writer.add(models.Client, dict(
+                id=client_id, name=f"Cliente {client_id:06d}", address=f"Rua {client_id % 500}, {client_id}",
+                uc_number=f"UC{client_id:010d}", email=f"cliente{client_id}@example.com", password=password,
+                phone=f"98{client_id:09d}", payment_day=rng.choice((5, 10, 15, 20)),
+                kwh_value_original=clients[client_id]["tariff"], negotiated_discount=clients[client_id]["discount"],
+                current_credits=0, is_active=rng.random() > 0.05,
+            ))
+        writer.flush()
+
+        # Simulação mês a mês: geração rateada, ajustes e fatura debitando os créditos
+        invoice_id = adjustment_id = 0
+        balances = {}
+        recent = set(months[-2:])
+        for client_id in client_ids:
+            client = clients[client_id]
+            balance = Decimal(0)
+            adjustment_month = rng.choice(months) if rng.random() < 0.03 else None
+            for month in months:
+                created_at = month_date(month, 28)
+                for plant_id, percentage in memberships[client_id]:
+                    production_id, generated = production[plant_id, month]
+                    amount = share(percentage, generated)
+                    balance += amount
+                    writer.add(models.ProductionAllocation, dict(
+                        production_id=production_id, plant_id=plant_id, client_id=client_id, month=month,
+                        percentage=percentage, kwh=amount,
+                    ))
+                    writer.add(models.CreditMovement, {**crud._credit_movement(
+                        client_id, amount, "geracao", month, description=f"Geração - Usina {plant_id:04d}",
+                        production_id=production_id,
+                    ), "created_at": created_at})
+                if month == adjustment_month:
+                    adjustment_id += 1
+                    amount = kwh(rng.choice((-1, 1)) * rng.randint(10, 200))
+                    balance += amount
+                    writer.add(models.CreditAdjustment, dict(id=adjustment_id, client_id=client_id, amount=amount,
+                                                             description="Ajuste de leitura", created_at=month_date(month, 15)))
+                    writer.add(models.CreditMovement, {**crud._credit_movement(
+                        client_id, amount, "ajuste", month, description="Ajuste de leitura", adjustment_id=adjustment_id,
+                    ), "created_at": month_date(month, 15)})
+
+                values = crud.compute_invoice_values(
+                    consumption_kwh=round(client["consumption"] * SEASONALITY[int(month[5:]) - 1] * rng.uniform(0.8, 1.2)),
+                    kwh_value_original=client["tariff"], discount_percent=client["discount"],
+                    fixed_cost=rng.choice((10, 30, 50)), available_credits=balance,
+                )
+                invoice_id += 1
+                paid = month not in recent
+                writer.add(models.Invoice, dict(
+                    id=invoice_id, client_id=client_id, month=month, invoice_number=f"{invoice_id:010d}",
+                    consumption_kwh=values["consumption_kwh"], kwh_value=values["kwh_value_injection"],
+                    kwh_value_original=values["kwh_value_original"], kwh_value_injection=values["kwh_value_injection"],
+                    credited_balance=values["credited_balance"], invoice_value=values["amount_to_collect"],
+                    fixed_cost=values["fixed_cost"], total_invoiced=values["total_invoiced"],
+                    amount_to_collect=values["amount_to_collect"], value_without_discount=values["value_without_discount"],
+                    total_value=values["amount_to_collect"], original_value=values["value_without_discount"],
+                    discount=values["discount"], profit=values["profit"],
+                    status="pago" if paid else rng.choice(("aberto", "aberto", "vencido")),
+                    status_cobrado=True, status_pago=paid, status_recebido=True,
+                ))
+                if values["credited_balance"] > 0:
+                    balance -= kwh(values["credited_balance"])
+                    writer.add(models.CreditMovement, {**crud._credit_movement(
+                        client_id, -values["credited_balance"], "faturamento", month,
+                        description=f"Fatura #{invoice_id}", invoice_id=invoice_id,
+                    ), "created_at": created_at})
+            balances[client_id] = balance
+        writer.flush()
+
+        conn.execute(
+            update(models.Client.__table__).where(models.Client.__table__.c.id == bindparam("client_id"))
+            .values(current_credits=bindparam("balance")),
+            [{"client_id": client_id, "balance": balance} for client_id, balance in balances.items()],
+        )
+    fix_sequences(engine, models.Base.metadata.sorted_tables)
+
+    with SessionLocal() as db:
+        crud.rebuild_monthly_rollups(db)
+        for month in months:
+            if month.endswith("-12") and month != months[-1]:
+                crud.create_credit_snapshots(db, month)
+        crud.ensure_cache_versions(db)
+        db.execute(text("ANALYZE"))
+        db.commit()
+    return writer.counts
+
+
+def main(args):
+    start = time.perf_counter()
+    counts = generate(args.plants, args.clients, args.years, end_month=args.end_month, seed=args.seed,
+                      batch_size=args.batch_size)
+    for table, rows in sorted(counts.items()):
+        print(f"{table:<28} {rows:>10}")
+    print(f"\n{sum(counts.values())} linhas em {time.perf_counter() - start:.1f}s -> {engine.url.render_as_string(hide_password=True)}")
+    print(f"Operador: bench@example.com / senha {BENCH_PASSWORD!r}")
+
+
+if __name__ == "__main__":
+    main(ARGS)
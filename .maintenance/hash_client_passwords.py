@@ -0,0 +1,54 @@
+"""
+Converte de uma vez as senhas de clientes ainda em texto puro para bcrypt.
+
+O login já faz essa migração aos poucos (cada cliente na primeira entrada); este script
+serve para não esperar por quem não entra há muito tempo. Os hashes são calculados em
+paralelo no executor de security.py e gravados num único UPDATE em lote.
+
+Uso (da raiz do repositório, com DATABASE_URL apontando para o banco desejado):
+    python .maintenance/hash_client_passwords.py [--dry-run]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from sqlalchemy import bindparam, update
+from database import SessionLocal
+import models
+import security
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        legacy = [
+            (client_id, password)
+            for client_id, password in db.query(models.Client.id, models.Client.password)
+            if password and not security.is_password_hash(password)
+        ]
+        print(f"{len(legacy)} clientes com senha em texto puro (bcrypt rounds={security.BCRYPT_ROUNDS})")
+        if args.dry_run or not legacy:
+            return
+
+        hashes = security._executor.map(security.hash_password, [password for _, password in legacy])
+        rows = [{"b_id": client_id, "b_password": hashed} for (client_id, _), hashed in zip(legacy, hashes)]
+        db.connection().execute(
+            update(models.Client.__table__)
+            .where(models.Client.__table__.c.id == bindparam("b_id"))
+            .values(password=bindparam("b_password")),
+            rows,
+        )
+        db.commit()
+        print(f"{len(rows)} senhas convertidas.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Teste de estresse dos saldos de crédito sob escrita concorrente.
+
+Varias threads lançam produções, faturas, ajustes e estornos ao mesmo tempo para clientes
+que se sobrepõem. No final o saldo em cache (clients.current_credits) de cada cliente
+precisa ser exatamente a soma do livro razão e o valor recalculado a partir do historico.
+
+Uso:
+    python .maintenance/stress_credit_concurrency.py [--threads 8] [--ops 40]
+
+Sem DATABASE_URL usa um SQLite temporario; com DATABASE_URL roda contra o banco informado
+(use um banco de teste: o script cria e apaga dados).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/stress.db"
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from sqlalchemy import func
+from sqlalchemy.exc import InvalidRequestError, OperationalError
+from sqlalchemy.orm.exc import ObjectDeletedError
+from database import SessionLocal, engine
+import models
+import schemas
+import crud
+
+
+def seed(n_plants=3, n_clients=12):
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        plants = [
+            crud.create_generation_plant(db, schemas.GenerationPlantCreate(
+                name=f"Stress {i}", address="-", uc_number=f"STRESS-P{i}-{random.random()}",
+                capacity_kw=100, acquisition_cost=0, maintenance_cost=0,
+            ))
+            for i in range(n_plants)
+        ]
+        clients = [
+            crud.create_client(db, schemas.ClientCreate(
+                name=f"Stress {i}", address="-", uc_number=f"STRESS-C{i}-{random.random()}",
+                email=f"stress{i}-{random.random()}@example.com", password="-",
+            ))
+            for i in range(n_clients)
+        ]
+        # Cada cliente participa de duas usinas: as threads sempre disputam os mesmos saldos
+        for p_index, plant in enumerate(plants):
+            members = [c for c_index, c in enumerate(clients) if c_index % n_plants != p_index]
+            crud.set_plant_distributions(db, plant.id, [
+                schemas.PlantDistributionCreate(plant_id=plant.id, client_id=client.id, percentage=100.0 / len(members))
+                for client in members
+            ])
+        return [p.id for p in plants], [c.id for c in clients]
+    finally:
+        db.close()
+
+
+def with_retry(fn, attempts=20):
+    for attempt in range(attempts):
+        db = SessionLocal()
+        try:
+            return fn(db)
+        except OperationalError:
+            db.rollback()
+            if attempt == attempts - 1:
+                raise
+        except (InvalidRequestError, ObjectDeletedError) as e:
+            # As threads apagam linhas ao acaso, inclusive a que outra acabou de gravar: o
+            # refresh depois do commit não a encontra mais. A escrita e a exclusão valeram.
+            if not isinstance(e, ObjectDeletedError) and "Could not refresh" not in str(e):
+                raise
+            return None
+        finally:
+            db.close()
+
+
+def worker(seed_value, plant_ids, client_ids, ops, errors):
+    rnd = random.Random(seed_value)
+    try:
+        for i in range(ops):
+            op = rnd.choice(["production", "production", "invoice", "adjust", "edit_production", "edit_invoice"])
+            month = f"2024-{rnd.randint(1, 12):02d}"
+            if op == "production":
+                production = schemas.ProductionCreate(month=month, kwh_generated=rnd.randint(100, 5000))
+                with_retry(lambda db: crud.create_plant_production(db, production, rnd.choice(plant_ids)))
+            elif op == "invoice":
+                client_id = rnd.choice(client_ids)
+                invoice = schemas.InvoiceCreate(
+                    month=month, consumption_kwh=100, kwh_value=1, kwh_value_original=1, kwh_value_injection=1,
+                    client_id=client_id, credited_balance=rnd.randint(1, 300), invoice_value=0, fixed_cost=0,
+                    total_invoiced=0, amount_to_collect=0, value_without_discount=0, original_value=0,
+                    total_value=0, discount=0, profit=0,
+                )
+                with_retry(lambda db: crud.create_invoice(db, invoice))
+            elif op == "adjust":
+                adjustment = schemas.CreditAdjustmentCreate(amount=rnd.randint(-50, 50), description="stress")
+                with_retry(lambda db: crud.create_credit_adjustment(db, rnd.choice(client_ids), adjustment))
+            elif op == "edit_production":
+                def edit(db):
+                    ids = [pid for (pid,) in db.query(models.Production.id).filter(models.Production.plant_id.in_(plant_ids))]
+                    if not ids:
+                        return
+                    target = rnd.choice(ids)
+                    if rnd.random() < 0.3:
+                        crud.delete_plant_production(db, target)
+                    else:
+                        crud.update_plant_production(db, target, schemas.ProductionUpdate(kwh_generated=rnd.randint(100, 5000)))
+                with_retry(edit)
+            else:
+                def edit(db):
+                    ids = [iid for (iid,) in db.query(models.Invoice.id).filter(models.Invoice.client_id.in_(client_ids))]
+                    if not ids:
+                        return
+                    target = rnd.choice(ids)
+                    if rnd.random() < 0.3:
+                        crud.delete_invoice(db, target)
+                    else:
+                        crud.update_invoice(db, target, schemas.InvoiceUpdate(credited_balance=rnd.randint(0, 300)))
+                with_retry(edit)
+    except Exception as e:
+        errors.append(e)
+
+
+def expected_balances(db, client_ids):
+    """Saldo recalculado do zero a partir das fontes (não do livro razão)."""
+    expected = {client_id: 0 for client_id in client_ids}
+    generated = db.query(models.ProductionAllocation.client_id, func.sum(models.ProductionAllocation.kwh))\
+        .filter(models.ProductionAllocation.client_id.in_(client_ids))\
+        .group_by(models.ProductionAllocation.client_id)
+    for client_id, kwh in generated:
+        expected[client_id] += kwh or 0
+    used = db.query(models.Invoice.client_id, func.sum(models.Invoice.credited_balance))\
+        .filter(models.Invoice.client_id.in_(client_ids)).group_by(models.Invoice.client_id)
+    for client_id, kwh in used:
+        expected[client_id] -= kwh or 0
+    adjusted = db.query(models.CreditAdjustment.client_id, func.sum(models.CreditAdjustment.amount))\
+        .filter(models.CreditAdjustment.client_id.in_(client_ids)).group_by(models.CreditAdjustment.client_id)
+    for client_id, kwh in adjusted:
+        expected[client_id] += kwh or 0
+    return expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=40, help="operações por thread")
+    args = parser.parse_args()
+
+    plant_ids, client_ids = seed()
+    print(f"Banco: {engine.url.drivername} | {args.threads} threads x {args.ops} operações")
+
+    errors = []
+    threads = [
+        threading.Thread(target=worker, args=(i, plant_ids, client_ids, args.ops, errors))
+        for i in range(args.threads)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        print(f"FALHA: {len(errors)} threads terminaram com erro: {errors[0]!r}")
+        sys.exit(1)
+
+    db = SessionLocal()
+    try:
+        expected = expected_balances(db, client_ids)
+        ledger = dict(
+            db.query(models.CreditMovement.client_id, func.sum(models.CreditMovement.kwh))
+            .filter(models.CreditMovement.client_id.in_(client_ids))
+            .group_by(models.CreditMovement.client_id)
+            .all()
+        )
+        failures = 0
+        for client in db.query(models.Client).filter(models.Client.id.in_(client_ids)).order_by(models.Client.id):
+            cached = client.current_credits or 0
+            ledger_sum = ledger.get(client.id) or 0
+            ok = cached == expected[client.id] == ledger_sum
+            failures += not ok
+            print(f"{'OK  ' if ok else 'ERRO'} cliente {client.id}: cache={cached:.6f} livro={ledger_sum:.6f} esperado={expected[client.id]:.6f}")
+    finally:
+        db.close()
+
+    if failures:
+        print(f"\nFALHA: {failures} saldos divergentes")
+        sys.exit(1)
+    print("\nSaldos exatos sob carga concorrente.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Tokens de sessão assinados e autorização sem consulta ao banco.
+
+O /login emite um JWT (HS256) curto com id, tipo e escopo do usuário. O middleware
+valida assinatura e validade de cada requisição só com a chave em memória e deixa o
+usuário em `request.state.principal`; as rotas exigem o papel com as dependências
+`require_admin` / `require_client_access`.
+
+A revogação (logout, troca de senha, remoção do usuário) usa uma lista em memória e
+versionada: tokens revogados pelo jti e "todos os tokens do usuário emitidos antes de T".
+As entradas saem da lista quando os tokens que elas cobrem expiram. Com vários workers
+cada processo tem a sua lista; tokens curtos limitam a janela.
+"""
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+
+from fastapi import HTTPException, Request
+from jose import JWTError, jwt
+
+logger = logging.getLogger(__name__)
+
+ALGORITHM = "HS256"
+TOKEN_TTL_SECONDS = int(float(os.getenv("AUTH_TOKEN_TTL_MINUTES", "60")) * 60)
+SECRET_KEY = os.getenv("AUTH_SECRET_KEY")
+if not SECRET_KEY:
+    SECRET_KEY = secrets.token_urlsafe(32)
+    logger.warning("[Auth] AUTH_SECRET_KEY não definida: usando chave aleatória (tokens não sobrevivem a reinícios nem são aceitos por outros workers)")
+
+SCOPES = {"admin": ["admin"], "client": ["client"]}
+
+
+@dataclass(frozen=True)
+class Principal:
+    user_id: int
+    user_type: str  # "admin" or "client"
+    scopes: tuple = field(default_factory=tuple)
+    jti: str = None
+    expires_at: int = 0
+
+    @property
+    def is_admin(self) -> bool:
+        return self.user_type == "admin" and "admin" in self.scopes
+
+
+class TokenDenylist:
+    """Revogações em memória; `version` muda a cada alteração."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = {}  # jti -> exp
+        self._users = {}  # (user_type, user_id) -> (revogado antes de, exp máx. coberta)
+        self.version = 0
+
+    def revoke_token(self, jti: str, expires_at: int):
+        with self._lock:
+            self._prune(time.time())
+            self._tokens[jti] = expires_at
+            self.version += 1
+
+    def revoke_user(self, user_type: str, user_id: int):
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            self._users[(user_type, user_id)] = (now, now + TOKEN_TTL_SECONDS)
+            self.version += 1
+
+    def is_revoked(self, jti: str, user_type: str, user_id: int, issued_at: float) -> bool:
+        # Leitura sem lock: dicts do Python são seguros para get concorrente
+        if jti in self._tokens:
+            return True
+        entry = self._users.get((user_type, user_id))
+        return entry is not None and issued_at <= entry[0]
+
+    def _prune(self, now: float):
+        self._tokens = {jti: exp for jti, exp in self._tokens.items() if exp > now}
+        self._users = {key: entry for key, entry in self._users.items() if entry[1] > now}
+
+    def __len__(self):
+        return len(self._tokens) + len(self._users)
+
+
+denylist = TokenDenylist()
+
+
+def create_access_token(user_id: int, user_type: str) -> dict:
+    # iat com fração de segundo: um login logo após revoke_user continua válido
+    now = time.time()
+    claims = {
+        "sub": str(user_id),
+        "typ": user_type,
+        "scope": SCOPES[user_type],
+        "iat": now,
+        "exp": int(now) + TOKEN_TTL_SECONDS,
+        "jti": uuid.uuid4().hex,
+    }
+    return {
+        "access_token": jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM),
+        "token_type": "bearer",
+        "expires_in": TOKEN_TTL_SECONDS,
+    }
+
+
+def decode_access_token(token: str) -> Principal:
+    """Valida assinatura, validade e revogação. Levanta ValueError se o token não vale."""
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"verify_iat": False})
+        principal = Principal(
+            user_id=int(claims["sub"]),
+            user_type=claims["typ"],
+            scopes=tuple(claims.get("scope") or ()),
+            jti=claims.get("jti"),
+            expires_at=int(claims["exp"]),
+        )
+        issued_at = float(claims.get("iat") or 0)
+    except (JWTError, KeyError, TypeError, ValueError) as e:
+        raise ValueError("Token inválido ou expirado") from e
+    if denylist.is_revoked(principal.jti, principal.user_type, principal.user_id, issued_at):
+        raise ValueError("Token revogado")
+    return principal
+
+
+class AuthenticationMiddleware:
+    """
+    Lê o cabeçalho Authorization: Bearer e guarda o Principal em request.state.principal.
+    Sem token a requisição segue anônima (as rotas decidem); token inválido responde 401.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            principal = None
+            for name, value in scope["headers"]:
+                if name == b"authorization":
+                    scheme, _, token = value.decode("latin-1").partition(" ")
+                    if scheme.lower() == "bearer" and token:
+                        try:
+                            principal = decode_access_token(token.strip())
+                        except ValueError as e:
+                            await _unauthorized(send, str(e))
+                            return
+                    break
+            scope.setdefault("state", {})["principal"] = principal
+        await self.app(scope, receive, send)
+
+
+async def _unauthorized(send, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": 401, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"www-authenticate", b"Bearer"),
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def get_principal(request: Request):
+    return getattr(request.state, "principal", None)
+
+
+def require_principal(request: Request) -> Principal:
+    principal = get_principal(request)
+    if principal is None:
+        raise HTTPException(status_code=401, detail="Autenticação necessária", headers={"WWW-Authenticate": "Bearer"})
+    return principal
+
+
+def require_admin(request: Request) -> Principal:
+    principal = require_principal(request)
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Acesso restrito a operadores")
+    return principal
+
+
+def check_client_access(principal: Principal, client_id: int) -> Principal:
+    """O próprio cliente ou um operador; para rotas em que o cliente só é conhecido depois de uma consulta."""
+    if principal.is_admin or (principal.user_type == "client" and principal.user_id == client_id):
+        return principal
+    raise HTTPException(status_code=403, detail="Acesso negado a este cliente")
+
+
+def require_client_access(client_id: int, request: Request) -> Principal:
+    """O próprio cliente ou um operador."""
+    return check_client_access(require_principal(request), client_id)
@@ -0,0 +1,143 @@
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("value", "created_at", "refreshing")
+
+    def __init__(self, value, created_at):
+        self.value = value
+        self.created_at = created_at
+        self.refreshing = False
+
+
+class _Flight:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class StaleWhileRevalidateCache:
+    """
+    Cache em memória com single-flight e stale-while-revalidate.
+
+    - Entrada com idade < ttl: devolvida direto.
+    - Entrada com idade < ttl + stale_ttl: devolvida imediatamente e recalculada em
+      background (uma única thread por chave).
+    - Sem entrada (ou expirada): apenas a primeira requisição calcula; as concorrentes
+      aguardam o mesmo resultado em vez de repetir o trabalho.
+    """
+
+    def __init__(self, ttl: float = 15.0, stale_ttl: float = 300.0, max_entries: int = 256):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry.created_at
+                if age < self.ttl:
+                    return entry.value
+                if age < self.ttl + self.stale_ttl:
+                    if not entry.refreshing:
+                        entry.refreshing = True
+                        threading.Thread(target=self._refresh, args=(key, compute), daemon=True).start()
+                    return entry.value
+
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+            with self._lock:
+                self._store(key, flight.value)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+        return flight.value
+
+    def _refresh(self, key, compute):
+        try:
+            value = compute()
+            with self._lock:
+                self._store(key, value)
+        except Exception as e:
+            logger.error(f"[Cache] Error refreshing {key!r}: {type(e).__name__}: {str(e)}")
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.refreshing = False
+
+    def _store(self, key, value):
+        self._entries[key] = _Entry(value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+class ResponseCache:
+    """
+    Corpos de resposta já serializados, validados por ETag. Cada entrada guarda a ETag
+    calculada a partir das versões das tabelas; se a ETag atual for outra, a entrada
+    está obsoleta. LRU limitado a max_entries.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, etag):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, etag, value):
+        with self._lock:
+            self._entries[key] = (etag, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
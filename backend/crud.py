@@ -1,79 +1,585 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload, load_only
+from sqlalchemy import event, func, tuple_, case, update, insert, select, bindparam, literal, cast, String
+from sqlalchemy.engine import Connection
+from datetime import datetime
+from decimal import Decimal
 import models, schemas
+from fixedpoint import Energy, TARIFF_SCALE, brl, kwh, percent, quantize, share
+import pix
+import security
+import base64
+import csv
+import io
+import json
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
 
-def _normalize_text(text: str) -> str:
-    """Remove acentuação e caracteres especiais para compatibilidade com o padrão EMV."""
-    import unicodedata
-    import re
-    if not text:
-        return ""
-    # Normaliza para decompor caracteres acentuados (ex: 'á' vira 'a' + '´')
-    normalized = unicodedata.normalize('NFD', text)
-    # Mantém apenas caracteres ASCII básicos
-    ascii_only = normalized.encode('ascii', 'ignore').decode('ascii')
-    # Remove qualquer caractere que não seja letra, número ou espaço e limpa espaços extras
-    clean = re.sub(r'[^a-zA-Z0-9\s]', '', ascii_only)
-    return " ".join(clean.split()).upper()
-
-
-def _generate_pix_brcode(name: str, key: str, amount: float, city: str = "BRASILIA", txid: str = "***") -> str:
-    """
-    Gera o payload PIX seguindo o padrão BR Code (EMV QRCPS-MPM).
-    Tags obrigatórias: 00, 01, 26 (com Chave PIX), 52, 53, 54, 58, 59, 60, 62, 63 (CRC).
-    """
-    def field(tag: str, value: str) -> str:
-        return f"{tag}{len(value):02d}{value}"
-
-    # Tag 26 - Merchant Account Info (GUI + Chave PIX)
-    gui = field("00", "br.gov.bcb.pix")
-    pix_key_field = field("01", key.strip())
-    merchant_account = field("26", gui + pix_key_field)
-
-    # Tag 54 - Valor (obrigatório se Point of Initiation for 11/12 e valor fixo)
-    amount_str = f"{float(amount):.2f}"
-
-    # Limpeza de nome e cidade (Normalização rigorosa)
-    clean_name = _normalize_text(name)[:25]
-    clean_city = _normalize_text(city)[:15]
-    clean_txid = "***"  # Forçar txid nulo para máxima compatibilidade em Pix Estático
-
-    # Tag 62 - Additional Data (txid)
-    reference_label = field("05", clean_txid)
-    additional = field("62", reference_label)
-
-    # Montar payload sem CRC
-    payload = (
-        field("00", "01")        +  # Payload Format Indicator
-        # Tag 01 removida por compatibilidade (opcional em Pix Estático)
-        merchant_account         +  # Tag 26
-        field("52", "0000")      +  # MCC
-        field("53", "986")       +  # Currency BRL
-        field("54", amount_str)  +  # Valor
-        field("58", "BR")        +  # Country Code
-        field("59", clean_name)  +  # Nome do Recebedor
-        field("60", clean_city)  +  # Cidade
-        additional                  # Tag 62
+# --- Keyset Pagination ---
+def encode_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> list:
+    """Decodifica um cursor opaco. Levanta ValueError se o cursor for invalido."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Cursor invalido")
+    if not isinstance(values, list):
+        raise ValueError("Cursor invalido")
+    return values
+
+def _paginate(query, keys, skip: int = 0, limit: int = 100, cursor: str = None, descending: bool = False):
+    """
+    Ordena a query pelas colunas `keys` (a ultima deve ser unica, ex: id) e pagina por keyset
+    quando um cursor é informado. Retorna (linhas, proximo_cursor).
+    """
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(keys):
+            raise ValueError("Cursor invalido")
+        bound = tuple_(*keys)
+        query = query.filter(bound < tuple_(*values) if descending else bound > tuple_(*values))
+    query = query.order_by(*[key.desc() if descending else key.asc() for key in keys])
+    if skip and not cursor:
+        query = query.offset(skip)
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(getattr(rows[-1], key.key) for key in keys)
+    return rows, next_cursor
+
+
+# --- Monthly Rollup ---
+ROLLUP_FIELDS = ("production_kwh", "production_count", "invoice_count", "open_invoice_count", "open_invoice_value", "profit")
+
+def _dialect_insert(db: Session):
+    """insert() com suporte a ON CONFLICT para o banco em uso (PostgreSQL ou SQLite)."""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+def _bump_monthly_rollup(db: Session, month: str, deltas: dict):
+    """Aplica incrementos ao rollup do mês na transação atual (UPDATE col = col + delta)."""
+    _bump_monthly_rollups(db, {month: deltas})
+
+def _bump_monthly_rollups(db: Session, deltas_by_month: dict):
+    """Versão em lote: um INSERT ... ON CONFLICT e um UPDATE (executemany) para todos os meses."""
+    params = []
+    for month, deltas in deltas_by_month.items():
+        if month and any(deltas.values()):
+            params.append({"m": month, **{field: deltas.get(field, 0) for field in ROLLUP_FIELDS}})
+    if not params:
+        return
+    conn = db.connection()
+    _touch(db, models.MonthlyRollup.__tablename__)
+    insert = _dialect_insert(db)
+    conn.execute(
+        insert(models.MonthlyRollup).on_conflict_do_nothing(index_elements=["month"]),
+        [{"month": p["m"]} for p in params],
+    )
+    values = {field: getattr(models.MonthlyRollup, field) + bindparam(field) for field in ROLLUP_FIELDS}
+    values["updated_at"] = datetime.utcnow()
+    conn.execute(
+        update(models.MonthlyRollup).where(models.MonthlyRollup.month == bindparam("m")).values(**values),
+        params,
     )
 
-    # Tag 63 - CRC16 CCITT (polinomio 0x1021, valor inicial 0xFFFF)
-    payload_for_crc = payload + "6304"
-    crc = 0xFFFF
-    for char in payload_for_crc:
-        crc ^= ord(char) << 8
-        for _ in range(8):
-            if crc & 0x8000:
-                crc = (crc << 1) ^ 0x1021
-            else:
-                crc <<= 1
-            crc &= 0xFFFF
+def _production_rollup(kwh_generated, sign: int = 1) -> dict:
+    return {"production_kwh": sign * kwh(kwh_generated), "production_count": sign}
+
+def _invoice_rollup(invoice, sign: int = 1) -> dict:
+    is_open = not invoice.status_pago
+    return {
+        "invoice_count": sign,
+        "open_invoice_count": sign if is_open else 0,
+        "open_invoice_value": sign * brl(invoice.total_value) if is_open else 0,
+        "profit": sign * brl(invoice.profit),
+    }
+
+def _merge_rollups(*parts) -> dict:
+    merged = {}
+    for part in parts:
+        for k, v in part.items():
+            merged[k] = merged.get(k, 0) + v
+    return merged
+
+def _invoice_rollup_query(db: Session):
+    is_open = models.Invoice.status_pago.isnot(True)
+    return db.query(
+        models.Invoice.month,
+        func.count(models.Invoice.id),
+        func.sum(case((is_open, 1), else_=0)),
+        func.sum(case((is_open, func.coalesce(models.Invoice.total_value, 0)), else_=0)),
+        func.sum(func.coalesce(models.Invoice.profit, 0)),
+    ).group_by(models.Invoice.month)
+
+def rebuild_monthly_rollups(db: Session):
+    """Recalcula todo o rollup a partir do historico (GROUP BY por mês)."""
+    rows = {}
+    def row(month):
+        return rows.setdefault(month, {field: 0 for field in ROLLUP_FIELDS})
+
+    productions = db.query(
+        models.Production.month,
+        func.sum(models.Production.kwh_generated),
+        func.count(models.Production.id),
+    ).group_by(models.Production.month)
+    for month, kwh, count in productions:
+        row(month).update(production_kwh=kwh or 0, production_count=count)
+
+    for month, count, open_count, open_value, profit in _invoice_rollup_query(db):
+        row(month).update(
+            invoice_count=count,
+            open_invoice_count=open_count or 0,
+            open_invoice_value=open_value or 0,
+            profit=profit or 0,
+        )
+
+    db.query(models.MonthlyRollup).delete()
+    db.add_all(models.MonthlyRollup(month=month, **values) for month, values in rows.items() if month)
+    db.commit()
+    return len(rows)
+
+def ensure_monthly_rollups(db: Session):
+    """
+    Popula o rollup se ele estiver vazio e houver histórico. Roda na migração 6, sob o lock
+    das migrações: dois workers não reconstroem o rollup ao mesmo tempo.
+    """
+    if db.query(models.MonthlyRollup.month).first() is not None:
+        return
+    if db.query(models.Production.id).first() is None and db.query(models.Invoice.id).first() is None:
+        return
+    rebuild_monthly_rollups(db)
+
+
+# --- Cache Versions ---
+# Cada commit incrementa a versão das tabelas que escreveu. As ETags das respostas em cache
+# são derivadas dessas versões, então todos os workers enxergam a invalidação logo depois da
+# escrita. O incremento roda numa transação própria e curta, depois do commit e com a conexão
+# da sessão já devolvida ao pool: dentro da transação da escrita, o UPDATE das mesmas linhas
+# de cache_versions travaria todos os escritores uns atrás dos outros até o commit (no
+# PostgreSQL), anulando o lock por cliente. Entre o commit e o incremento um leitor pode ver o
+# dado novo com a versão antiga, o que só guarda em cache um dado já atual; o contrário (versão
+# nova com dado antigo) não acontece.
+def _touch(db: Session, *tables: str):
+    """Marca tabelas escritas por SQL Core (fora do unit of work do ORM)."""
+    db.info.setdefault("touched_tables", set()).update(tables)
+
+@event.listens_for(Session, "after_flush")
+def _track_flushed_tables(session, flush_context):
+    touched = session.info.setdefault("touched_tables", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        touched.add(obj.__table__.name)
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_orm_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None:
+            _touch(orm_execute_state.session, table.name)
 
-    final_payload = payload_for_crc + format(crc, "04X").upper()
-    logger.info(f"[PIX BR Code] Generated payload ({len(final_payload)} chars): {final_payload[:60]}...")
-    return final_payload
+@event.listens_for(Session, "before_commit")
+def _flush_touched_tables(session):
+    session.flush() # Registra em touched_tables o que ainda estava pendente
+
+@event.listens_for(Session, "after_commit")
+def _queue_cache_bump(session):
+    touched = session.info.pop("touched_tables", set())
+    touched.discard(models.CacheVersion.__tablename__)
+    session.info.setdefault("committed_tables", set()).update(touched)
+
+@event.listens_for(Session, "after_rollback")
+def _reset_touched_tables(session):
+    session.info.pop("touched_tables", None)
+
+@event.listens_for(Session, "after_transaction_end")
+def _bump_cache_versions(session, transaction):
+    # Só na transação raiz: aqui a conexão da sessão já voltou para o pool
+    if transaction.parent is not None:
+        return
+    committed = session.info.pop("committed_tables", None)
+    if not committed:
+        return
+    table = models.CacheVersion.__table__
+    bump = update(table).where(table.c.entity.in_(sorted(committed)))\
+        .values(version=table.c.version + 1, updated_at=datetime.utcnow())
+    try:
+        bind = session.get_bind()
+        if isinstance(bind, Connection):
+            # Sessão dentro da transação de uma conexão (migrações): o incremento vai junto dela
+            bind.execute(bump)
+            return
+        with bind.begin() as conn:
+            conn.execute(bump)
+    except Exception as e:
+        # A escrita já foi confirmada: sem o incremento, o cache dessas tabelas só é
+        # invalidado na próxima escrita
+        logger.error(f"[Cache] Falha ao incrementar a versão de {sorted(committed)}: {type(e).__name__}: {e}")
+
+def ensure_cache_versions(db: Session):
+    """Cria (versão 0) o contador de cada tabela do modelo que ainda não tem um."""
+    insert = _dialect_insert(db)
+    db.execute(
+        insert(models.CacheVersion).on_conflict_do_nothing(index_elements=["entity"]),
+        [{"entity": table, "version": 0} for table in models.Base.metadata.tables],
+    )
+    db.commit()
+
+def get_cache_versions(db: Session, tables) -> dict:
+    """{tabela: (versão, updated_at)} para as tabelas pedidas: uma query pela chave primária."""
+    rows = db.query(models.CacheVersion.entity, models.CacheVersion.version, models.CacheVersion.updated_at)\
+        .filter(models.CacheVersion.entity.in_(list(tables)))
+    return {entity: (version, updated_at) for entity, version, updated_at in rows}
+
+
+# --- Credit Ledger ---
+def _current_month() -> str:
+    return datetime.utcnow().strftime("%Y-%m")
+
+def _next_month(month: str) -> str:
+    year, number = map(int, month.split("-"))
+    return f"{year + number // 12}-{number % 12 + 1:02d}"
+
+def _for_update(db: Session, query):
+    """SELECT ... FOR UPDATE no PostgreSQL (no SQLite a escrita já é serializada pelo banco)."""
+    if db.get_bind().dialect.name == "postgresql":
+        return query.with_for_update()
+    return query
+
+def _lock_rows(db: Session, model, ids):
+    """
+    Trava as linhas até o fim da transação antes de lê-las para um read-modify-write.
+    PostgreSQL: SELECT ... FOR UPDATE em ordem de id. SQLite: um UPDATE nulo adquire o lock
+    de escrita do banco, então a leitura seguinte já vê o estado final de escritas concorrentes.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.query(model.id).filter(model.id.in_(ids)).order_by(model.id).with_for_update().all()
+    else:
+        db.execute(update(model).where(model.id.in_(ids)).values(id=model.id).execution_options(synchronize_session=False))
+
+def _credit_movement(client_id: int, kwh_amount, kind: str, month: str, description: str = None,
+                     production_id: int = None, invoice_id: int = None, adjustment_id: int = None) -> dict:
+    return {
+        "client_id": client_id,
+        "month": month,
+        "kind": kind,
+        "kwh": kwh(kwh_amount),
+        "description": description,
+        "production_id": production_id,
+        "invoice_id": invoice_id,
+        "adjustment_id": adjustment_id,
+    }
+
+def _post_credit_movements(db: Session, movements: list):
+    """
+    Registra movimentos no livro razão e atualiza os saldos em cache sem read-modify-write:
+    os clientes afetados são buscados (e travados, no PostgreSQL, em ordem de id) numa única
+    query IN, os movimentos entram num INSERT em lote e os saldos num único UPDATE atômico.
+    """
+    movements = [m for m in movements if m["kwh"]]
+    if not movements:
+        return
+    client_ids = {m["client_id"] for m in movements}
+    existing = _for_update(
+        db,
+        db.query(models.Client.id).filter(models.Client.id.in_(client_ids)).order_by(models.Client.id)
+    ).all()
+    existing = {client_id for (client_id,) in existing}
+    movements = [m for m in movements if m["client_id"] in existing]
+    if not movements:
+        return
+
+    now = datetime.utcnow()
+    db.execute(insert(models.CreditMovement), [{**m, "created_at": now} for m in movements])
+    deltas = {}
+    for m in movements:
+        deltas[m["client_id"]] = deltas.get(m["client_id"], 0) + m["kwh"]
+    _apply_credit_deltas(db, deltas)
+
+def _apply_credit_deltas(db: Session, deltas: dict):
+    """Aplica {client_id: kwh} a vários clientes com um único UPDATE (CASE por id)."""
+    deltas = {client_id: literal(delta, Energy) for client_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # Literais tipados: o CASE soma Wh inteiros à coluna, não kWh
+    db.execute(
+        update(models.Client)
+        .where(models.Client.id.in_(deltas.keys()))
+        .values(current_credits=func.coalesce(models.Client.current_credits, 0) + case(deltas, value=models.Client.id, else_=literal(0, Energy)))
+        .execution_options(synchronize_session=False)
+    )
+
+def get_client_balance(db: Session, client_id: int, month: str):
+    """
+    Saldo de créditos ao fim de `month`: ultimo snapshot <= month mais os movimentos posteriores
+    a ele (incluindo lançamentos retroativos feitos depois do snapshot). Sem varrer o historico.
+    """
+    movements = models.CreditMovement
+    snapshot = db.query(models.CreditBalanceSnapshot)\
+        .filter(models.CreditBalanceSnapshot.client_id == client_id, models.CreditBalanceSnapshot.month <= month)\
+        .order_by(models.CreditBalanceSnapshot.month.desc())\
+        .first()
+
+    query = db.query(func.coalesce(func.sum(movements.kwh), 0))\
+        .filter(movements.client_id == client_id, movements.month <= month)
+    if snapshot:
+        query = query.filter((movements.month > snapshot.month) | (movements.id > snapshot.last_movement_id))
+    delta = query.scalar()
+
+    return {
+        "client_id": client_id,
+        "month": month,
+        "balance": (snapshot.balance if snapshot else 0) + delta,
+        "snapshot_month": snapshot.month if snapshot else None,
+    }
+
+def get_client_ledger(db: Session, client_id: int, month_from: str = None, month_to: str = None):
+    """Movimentos do cliente no intervalo de meses (leitura por faixa no indice client_id, month, id)."""
+    query = db.query(models.CreditMovement).filter(models.CreditMovement.client_id == client_id)
+    if month_from:
+        query = query.filter(models.CreditMovement.month >= month_from)
+    if month_to:
+        query = query.filter(models.CreditMovement.month <= month_to)
+    return query.order_by(models.CreditMovement.month, models.CreditMovement.id).all()
+
+def create_credit_snapshots(db: Session, month: str):
+    """
+    Consolida o saldo de todos os clientes até o fim de `month`, partindo do snapshot anterior
+    de cada um. Uma query agrupada; substitui snapshots já existentes do mesmo mês.
+    """
+    movements = models.CreditMovement
+    snapshots = models.CreditBalanceSnapshot
+    last_movement_id = db.query(func.coalesce(func.max(movements.id), 0)).scalar()
+
+    previous_month = db.query(snapshots.client_id, func.max(snapshots.month).label("month"))\
+        .filter(snapshots.month < month)\
+        .group_by(snapshots.client_id)\
+        .subquery()
+    previous = db.query(snapshots.client_id, snapshots.month, snapshots.balance, snapshots.last_movement_id)\
+        .join(previous_month, (snapshots.client_id == previous_month.c.client_id) & (snapshots.month == previous_month.c.month))\
+        .subquery()
+
+    pending = db.query(movements.client_id, func.sum(movements.kwh).label("kwh"))\
+        .outerjoin(previous, previous.c.client_id == movements.client_id)\
+        .filter(
+            movements.month <= month,
+            movements.id <= last_movement_id,
+            (previous.c.month.is_(None)) | (movements.month > previous.c.month) | (movements.id > previous.c.last_movement_id),
+        )\
+        .group_by(movements.client_id)\
+        .subquery()
+
+    rows = db.query(models.Client.id, previous.c.balance, pending.c.kwh)\
+        .outerjoin(previous, previous.c.client_id == models.Client.id)\
+        .outerjoin(pending, pending.c.client_id == models.Client.id)\
+        .all()
+
+    db.query(snapshots).filter(snapshots.month == month).delete()
+    db.add_all(
+        snapshots(
+            client_id=client_id,
+            month=month,
+            balance=(balance or 0) + (kwh or 0),
+            last_movement_id=last_movement_id,
+        )
+        for client_id, balance, kwh in rows
+    )
+    db.commit()
+    return len(rows)
+
+def ensure_credit_ledger(db: Session):
+    """
+    Gera o livro razão a partir do historico existente na primeira execução. A diferença
+    entre o saldo em cache e o historico (créditos lançados sem registro) vira um ajuste de abertura.
+    Roda na migração 7, sob o lock das migrações: dois workers não lançam o histórico em dobro.
+    """
+    if db.query(models.CreditMovement.id).first() is not None:
+        return
+    if db.query(models.Client.id).first() is None:
+        return
+
+    month = _current_month()
+    movements = []
+    allocations = db.query(models.ProductionAllocation, models.GenerationPlant.name)\
+        .join(models.GenerationPlant, models.ProductionAllocation.plant_id == models.GenerationPlant.id)\
+        .all()
+    for allocation, plant_name in allocations:
+        movements.append(dict(
+            client_id=allocation.client_id, month=allocation.month, kind="geracao", kwh=allocation.kwh,
+            description=f"Geração - {plant_name}", production_id=allocation.production_id,
+        ))
+    for inv in db.query(models.Invoice).filter(models.Invoice.credited_balance > 0):
+        movements.append(dict(
+            client_id=inv.client_id, month=inv.month, kind="faturamento",
+            kwh=-kwh(inv.credited_balance), description=f"Fatura #{inv.id}", invoice_id=inv.id,
+        ))
+    for adj in db.query(models.CreditAdjustment):
+        movements.append(dict(
+            client_id=adj.client_id, month=adj.created_at.strftime("%Y-%m"), kind="ajuste",
+            kwh=kwh(adj.amount), description=adj.description, adjustment_id=adj.id,
+        ))
+
+    history = {}
+    for movement in movements:
+        history[movement["client_id"]] = history.get(movement["client_id"], 0) + movement["kwh"]
+    for client_id, current_credits in db.query(models.Client.id, models.Client.current_credits):
+        opening = kwh(current_credits) - history.get(client_id, 0)
+        if opening:
+            movements.append(dict(
+                client_id=client_id, month=month, kind="ajuste",
+                kwh=opening, description="Saldo de abertura do livro razão",
+            ))
+
+    db.bulk_insert_mappings(models.CreditMovement, [m for m in movements if m["kwh"]])
+    _touch(db, models.CreditMovement.__tablename__)
+    db.commit()
+
+
+# --- Balance Reconciliation ---
+# Correções da reconciliação entram no livro com este tipo: contam no saldo do livro, mas não
+# no saldo esperado (senão cada correção mudaria o próprio alvo).
+RECONCILIATION_KIND = "reconciliacao"
+
+def _balance_check_query(db: Session, client_ids=None):
+    """
+    Saldo esperado e saldo do livro razão por cliente numa única query agrupada: UNION ALL do
+    rateio gravado de cada produção, faturas, ajustes e movimentos do livro, somado por
+    cliente. Lançamentos do livro sem origem (saldo de abertura, crédito manual) contam no
+    esperado. `client_ids` (lista ou subquery) restringe cada ramo aos clientes pedidos.
+    """
+    zero = literal(0, Energy)
+    def scoped(query, column):
+        return query.filter(column.in_(client_ids)) if client_ids is not None else query
+
+    productions = scoped(db.query(
+        models.ProductionAllocation.client_id.label("client_id"),
+        models.ProductionAllocation.kwh.label("expected"),
+        zero.label("ledger"),
+    ), models.ProductionAllocation.client_id)
+
+    invoices = scoped(db.query(
+        models.Invoice.client_id,
+        case((models.Invoice.credited_balance > 0, -models.Invoice.credited_balance), else_=zero),
+        zero,
+    ), models.Invoice.client_id)
+
+    adjustments = scoped(db.query(
+        models.CreditAdjustment.client_id,
+        func.coalesce(models.CreditAdjustment.amount, 0),
+        zero,
+    ), models.CreditAdjustment.client_id)
+
+    movements = models.CreditMovement
+    manual = movements.production_id.is_(None) & movements.invoice_id.is_(None) & movements.adjustment_id.is_(None) \
+        & (movements.kind != RECONCILIATION_KIND)
+    ledger = scoped(db.query(
+        movements.client_id,
+        case((manual, movements.kwh), else_=zero),
+        movements.kwh,
+    ), movements.client_id)
+
+    entries = productions.union_all(invoices, adjustments, ledger).subquery()
+    totals = db.query(
+        entries.c.client_id,
+        func.sum(entries.c.expected).label("expected"),
+        func.sum(entries.c.ledger).label("ledger"),
+    ).group_by(entries.c.client_id).subquery()
+
+    query = db.query(
+        models.Client.id,
+        models.Client.name,
+        models.Client.current_credits,
+        func.coalesce(totals.c.expected, zero).label("expected"),
+        func.coalesce(totals.c.ledger, zero).label("ledger"),
+    ).outerjoin(totals, totals.c.client_id == models.Client.id)
+    return scoped(query, models.Client.id).order_by(models.Client.id)
+
+def _balance_drifts(rows) -> list:
+    drifts = []
+    for client_id, name, current_credits, expected, ledger in rows:
+        current_credits = kwh(current_credits)
+        if current_credits != expected or ledger != expected:
+            drifts.append({
+                "client_id": client_id,
+                "name": name,
+                "expected": expected,
+                "current_credits": current_credits,
+                "ledger_balance": ledger,
+                "drift": current_credits - expected,
+                "ledger_drift": ledger - expected,
+            })
+    return drifts
+
+def reconcile_balances(db: Session, incremental: bool = False, fix: bool = False):
+    """
+    Confere o saldo em cache (clients.current_credits) e o livro razão de cada cliente contra o
+    histórico e, com fix=True, corrige a diferença: um UPDATE em lote nos saldos e um INSERT em
+    lote de movimentos de reconciliação no livro. Os clientes corrigidos são travados e
+    recalculados antes da escrita, então lançamentos concorrentes não são sobrescritos.
+
+    incremental=True confere só os clientes com movimentos no livro desde a última execução
+    com correção (toda escrita da aplicação que mexe em créditos gera movimento). Alterações
+    feitas direto no banco só aparecem na conferência completa.
+    """
+    movements = models.CreditMovement
+    runs = models.BalanceReconciliation
+    last_movement_id = db.query(func.coalesce(func.max(movements.id), 0)).scalar()
+
+    since = None
+    if incremental:
+        since = db.query(runs.last_movement_id).filter(runs.applied.is_(True)).order_by(runs.id.desc()).limit(1).scalar()
+    client_ids = None
+    if since is not None:
+        client_ids = select(movements.client_id).where(movements.id > since).distinct()
+
+    rows = _balance_check_query(db, client_ids).all()
+    checked = len(rows)
+    drifts = _balance_drifts(rows)
+
+    if fix and drifts:
+        ids = [d["client_id"] for d in drifts]
+        _lock_rows(db, models.Client, ids)
+        drifts = _balance_drifts(_balance_check_query(db, ids))
+        _apply_credit_deltas(db, {d["client_id"]: -d["drift"] for d in drifts})
+        month, now = _current_month(), datetime.utcnow()
+        corrections = [
+            {**_credit_movement(d["client_id"], -d["ledger_drift"], RECONCILIATION_KIND, month,
+                                description="Reconciliação de saldo"), "created_at": now}
+            for d in drifts if d["ledger_drift"]
+        ]
+        if corrections:
+            db.execute(insert(movements), corrections)
+
+    run = runs(
+        mode="incremental" if incremental else "full",
+        applied=fix,
+        last_movement_id=last_movement_id,
+        clients_checked=checked,
+        clients_with_drift=len(drifts),
+        total_drift=sum(abs(d["drift"]) for d in drifts),
+    )
+    db.add(run)
+    db.commit()
+    if drifts:
+        logger.warning(f"[Reconciliação] {len(drifts)} de {checked} clientes com saldo divergente ({'corrigido' if fix else 'não corrigido'})")
+    return {
+        "id": run.id,
+        "mode": run.mode,
+        "applied": run.applied,
+        "since_movement_id": since,
+        "last_movement_id": last_movement_id,
+        "clients_checked": checked,
+        "clients_with_drift": len(drifts),
+        "total_drift": run.total_drift,
+        "items": drifts,
+    }
 
 
 def create_client_production(db: Session, production: schemas.ProductionCreate, client_id: int):
@@ -115,8 +621,88 @@ def create_generation_plant(db: Session, plant: schemas.GenerationPlantCreate):
     db.refresh(db_plant)
     return db_plant
 
-def get_generation_plants(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.GenerationPlant).offset(skip).limit(limit).all()
+def get_generation_plants(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    view: str = "summary",
+    recent_months: int = 12,
+    cursor: str = None,
+    is_active: bool = None,
+):
+    """
+    view="summary": colunas da usina + agregados calculados no banco (geração total,
+    percentual rateado e os ultimos `recent_months` meses de geração). Custo fixo de
+    quatro queries por página, independente do tamanho do historico.
+    view="full": historico completo, com relacionamentos carregados via selectinload.
+    Retorna (usinas, proximo_cursor).
+    """
+    query = db.query(models.GenerationPlant)
+    if is_active is not None:
+        query = query.filter(models.GenerationPlant.is_active == is_active)
+    if view == "full":
+        query = query.options(
+            selectinload(models.GenerationPlant.productions),
+            selectinload(models.GenerationPlant.distributions),
+        )
+    plants, next_cursor = _paginate(query, (models.GenerationPlant.id,), skip=skip, limit=limit, cursor=cursor)
+    if view == "full":
+        return plants, next_cursor
+
+    plant_ids = [p.id for p in plants]
+    if not plant_ids:
+        return [], next_cursor
+
+    # Geração acumulada por usina
+    production_totals = dict(
+        (plant_id, (total or 0, count))
+        for plant_id, total, count in db.query(
+            models.Production.plant_id,
+            func.sum(models.Production.kwh_generated),
+            func.count(models.Production.id),
+        )
+        .filter(models.Production.plant_id.in_(plant_ids))
+        .group_by(models.Production.plant_id)
+    )
+
+    # Percentual já rateado entre clientes
+    allocated = dict(
+        db.query(models.PlantDistribution.plant_id, func.sum(models.PlantDistribution.percentage))
+        .filter(models.PlantDistribution.plant_id.in_(plant_ids), models.PlantDistribution.effective_to.is_(None))
+        .group_by(models.PlantDistribution.plant_id)
+        .all()
+    )
+
+    # Ultimos N meses de cada usina (ROW_NUMBER por usina, limitado no banco)
+    recent = {plant_id: [] for plant_id in plant_ids}
+    if recent_months > 0:
+        ranked = db.query(
+            models.Production.plant_id.label("plant_id"),
+            models.Production.month.label("month"),
+            models.Production.kwh_generated.label("kwh_generated"),
+            func.row_number().over(
+                partition_by=models.Production.plant_id,
+                order_by=(models.Production.month.desc(), models.Production.id.desc()),
+            ).label("rn"),
+        ).filter(models.Production.plant_id.in_(plant_ids)).subquery()
+        rows = db.query(ranked.c.plant_id, ranked.c.month, ranked.c.kwh_generated)\
+            .filter(ranked.c.rn <= recent_months)\
+            .order_by(ranked.c.plant_id, ranked.c.month.desc())\
+            .all()
+        for plant_id, month, kwh in rows:
+            recent[plant_id].append({"month": month, "kwh_generated": kwh or 0})
+
+    result = []
+    for plant in plants:
+        total_kwh, production_count = production_totals.get(plant.id, (0, 0))
+        result.append({
+            **schemas.GenerationPlantPlain.model_validate(plant).model_dump(),
+            "lifetime_kwh": total_kwh,
+            "production_count": production_count,
+            "allocated_percentage": allocated.get(plant.id) or 0,
+            "recent_production": recent[plant.id],
+        })
+    return result, next_cursor
 
 def get_plant_by_id(db: Session, plant_id: int):
     return db.query(models.GenerationPlant).filter(models.GenerationPlant.id == plant_id).first()
@@ -132,50 +718,260 @@ def update_generation_plant(db: Session, plant_id: int, plant_update: schemas.Ge
     return db_plant
 
 # --- Plant Distributions ---
-def create_plant_distribution(db: Session, distribution: schemas.PlantDistributionCreate):
-    db_dist = models.PlantDistribution(**distribution.dict())
-    db.add(db_dist)
-    db.commit()
-    db.refresh(db_dist)
-    return db_dist
+def _in_force(month: str):
+    """Linhas de rateio da versão vigente para a produção de `month`."""
+    dists = models.PlantDistribution
+    return (dists.effective_from.is_(None) | (dists.effective_from <= month)) \
+        & (dists.effective_to.is_(None) | (dists.effective_to > month))
+
+def get_plant_distributions(db: Session, plant_id: int, month: str = None):
+    """Rateio vigente da usina, ou o que valia para a produção de `month`."""
+    query = db.query(models.PlantDistribution).filter(models.PlantDistribution.plant_id == plant_id)
+    if month:
+        query = query.filter(_in_force(month))
+    else:
+        query = query.filter(models.PlantDistribution.effective_to.is_(None))
+    return query.order_by(models.PlantDistribution.id).all()
 
-def get_plant_distributions(db: Session, plant_id: int):
-    return db.query(models.PlantDistribution).filter(models.PlantDistribution.plant_id == plant_id).all()
+def set_plant_distributions(db: Session, plant_id: int, distributions: list, effective_from: str = None):
+    """
+    Troca o rateio da usina a partir de `effective_from` numa única transação: a versão
+    anterior é encerrada nesse mês (versões que começavam nele ou depois são substituídas) e a
+    nova entra num INSERT em lote. Produções já lançadas mantêm o rateio com que foram creditadas.
 
-def delete_plant_distributions(db: Session, plant_id: int):
-    db.query(models.PlantDistribution).filter(models.PlantDistribution.plant_id == plant_id).delete()
+    Sem `effective_from`, o novo rateio vale a partir do mês seguinte à última produção lançada
+    da usina: a primeira produção que ainda falta lançar já usa o rateio novo, qualquer que seja
+    o mês em que ela for digitada. Sem produções (ou no primeiro rateio) vale desde sempre.
+    Para mudar o rateio de um mês já lançado, informe `effective_from` e relance as produções.
+    """
+    dists = models.PlantDistribution
+    _lock_rows(db, models.GenerationPlant, [plant_id]) # Serializa trocas concorrentes do rateio
+    existing = db.query(dists).filter(dists.plant_id == plant_id)
+    if effective_from is None and existing.with_entities(dists.id).first() is not None:
+        latest = db.query(func.max(models.Production.month)).filter(models.Production.plant_id == plant_id).scalar()
+        effective_from = _next_month(latest) if latest else None
+
+    if effective_from is None:
+        existing.delete(synchronize_session=False)
+    else:
+        existing.filter(dists.effective_from >= effective_from).delete(synchronize_session=False)
+        existing.filter(dists.effective_to.is_(None) | (dists.effective_to > effective_from))\
+            .update({dists.effective_to: effective_from}, synchronize_session=False)
+    if distributions:
+        db.execute(insert(dists), [
+            {"plant_id": plant_id, "client_id": d.client_id, "percentage": percent(d.percentage), "effective_from": effective_from}
+            for d in distributions
+        ])
     db.commit()
+    return get_plant_distributions(db, plant_id)
 
 # --- Production & Automatic Credit Distribution ---
+def _allocate_productions(db: Session, productions: list) -> list:
+    """
+    Grava o rateio de cada produção (dicts com id, plant_id, month, kwh_generated e description)
+    com a versão vigente no mês dela: uma query para os rateios das usinas e um INSERT em lote.
+    Retorna os movimentos de crédito correspondentes, para `_post_credit_movements`.
+    """
+    versions = {}
+    for dist in db.query(models.PlantDistribution).filter(
+        models.PlantDistribution.plant_id.in_({p["plant_id"] for p in productions}),
+        models.PlantDistribution.client_id.isnot(None),
+    ):
+        versions.setdefault(dist.plant_id, []).append(dist)
+
+    allocations = []
+    movements = []
+    for production in productions:
+        month = production["month"]
+        percentages = {} # Cliente repetido no rateio: uma linha com a soma
+        for dist in versions.get(production["plant_id"], []):
+            if (dist.effective_from is None or dist.effective_from <= month) and (dist.effective_to is None or dist.effective_to > month):
+                percentages[dist.client_id] = percentages.get(dist.client_id, 0) + dist.percentage
+        for client_id, percentage in percentages.items():
+            amount = share(percentage, production["kwh_generated"])
+            allocations.append({
+                "production_id": production["id"], "plant_id": production["plant_id"], "client_id": client_id,
+                "month": month, "percentage": percentage, "kwh": amount,
+            })
+            movements.append(_credit_movement(
+                client_id, amount, "geracao", month, description=production["description"], production_id=production["id"]
+            ))
+    if allocations:
+        db.execute(insert(models.ProductionAllocation), allocations)
+    return movements
+
+def _production_allocations(db: Session, production_id: int):
+    return db.query(models.ProductionAllocation)\
+        .filter(models.ProductionAllocation.production_id == production_id)\
+        .order_by(models.ProductionAllocation.id)\
+        .all()
+
+def _reverse_allocations(db: Session, production_id: int, description: str) -> list:
+    """Apaga o rateio gravado da produção e retorna os movimentos que estornam cada parte."""
+    movements = [
+        _credit_movement(a.client_id, -a.kwh, "geracao", a.month, description=description, production_id=production_id)
+        for a in _production_allocations(db, production_id)
+    ]
+    db.query(models.ProductionAllocation)\
+        .filter(models.ProductionAllocation.production_id == production_id)\
+        .delete(synchronize_session=False)
+    return movements
+
 def create_plant_production(db: Session, production: schemas.ProductionCreate, plant_id: int):
     # 1. Create Production Entry
     db_production = models.Production(**production.dict(), plant_id=plant_id)
     db.add(db_production)
+    db.flush()
     
-    # 2. Distribute credits based on percentages
-    distributions = get_plant_distributions(db, plant_id)
-    total_kwh = production.kwh_generated
-    
-    for dist in distributions:
-        # Calculate amount for this client
-        kwh_to_add = (dist.percentage / 100.0) * total_kwh
-        # Update client credits
-        client = get_client(db, dist.client_id)
-        if client:
-            client.current_credits += kwh_to_add
-            
+    # 2. Distribute credits with the distribution in force for the month
+    total_kwh = kwh(production.kwh_generated)
+    plant = get_plant_by_id(db, plant_id)
+    movements = _allocate_productions(db, [{
+        "id": db_production.id, "plant_id": plant_id, "month": production.month, "kwh_generated": total_kwh,
+        "description": f"Geração - {plant.name if plant else plant_id}",
+    }])
+    # Update client credits
+    _post_credit_movements(db, movements)
+
+    _bump_monthly_rollup(db, production.month, _production_rollup(total_kwh))
     db.commit()
     db.refresh(db_production)
     return db_production
 
-def get_plant_productions(db: Session, plant_id: int):
-    return db.query(models.Production).filter(models.Production.plant_id == plant_id).order_by(models.Production.month.desc()).all()
+MONTH_PATTERN = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+def parse_production_csv(content: str):
+    """Converte um CSV (plant_id ou plant_uc_number, month, kwh_generated) em linhas brutas."""
+    reader = csv.DictReader(io.StringIO(content), delimiter=";" if content.count(";") > content.count(",") else ",")
+    rows = []
+    for raw in reader:
+        raw = {(k or "").strip().lower(): (v or "").strip() for k, v in raw.items()}
+        rows.append({
+            "plant_id": raw.get("plant_id") or None,
+            "plant_uc_number": raw.get("plant_uc_number") or None,
+            "month": raw.get("month", ""),
+            "kwh_generated": raw.get("kwh_generated", ""),
+        })
+    return rows
+
+def import_productions(db: Session, rows: list, dry_run: bool = False):
+    """
+    Importa um lote de produções (plant, month, kWh). Valida tudo em uma passada (usinas,
+    duplicidades no lote e no banco carregadas com uma query cada) e aplica as linhas válidas
+    numa única transação: INSERT em lote das produções e dos movimentos de crédito e um único
+    UPDATE dos saldos. Linhas inválidas são relatadas e não impedem as demais.
+    """
+    results = [{"row": i + 1, "status": "valid"} for i in range(len(rows))]
+
+    plant_ids = set()
+    plant_ucs = set()
+    for raw in rows:
+        if raw.get("plant_id") not in (None, ""):
+            try:
+                plant_ids.add(int(raw["plant_id"]))
+            except (TypeError, ValueError):
+                pass
+        elif raw.get("plant_uc_number"):
+            plant_ucs.add(str(raw["plant_uc_number"]))
+
+    plants_by_id = {}
+    if plant_ids or plant_ucs:
+        plant_filter = models.GenerationPlant.id.in_(plant_ids) | models.GenerationPlant.uc_number.in_(plant_ucs)
+        plants_by_id = {p.id: p for p in db.query(models.GenerationPlant).filter(plant_filter)}
+    plants_by_uc = {p.uc_number: p for p in plants_by_id.values()}
+
+    # 1. Validação linha a linha
+    valid = []
+    for raw, result in zip(rows, results):
+        plant = None
+        try:
+            if raw.get("plant_id") not in (None, ""):
+                plant = plants_by_id.get(int(raw["plant_id"]))
+            elif raw.get("plant_uc_number"):
+                plant = plants_by_uc.get(str(raw["plant_uc_number"]))
+        except (TypeError, ValueError):
+            pass
+        month = str(raw.get("month") or "").strip()
+        try:
+            kwh_generated = kwh(Decimal(str(raw.get("kwh_generated")).replace(",", ".")))
+        except (ArithmeticError, TypeError, ValueError):
+            kwh_generated = None
+
+        result.update(plant_id=plant.id if plant else None, month=month, kwh_generated=kwh_generated)
+        if plant is None:
+            result.update(status="error", error="Usina não encontrada")
+        elif not MONTH_PATTERN.match(month):
+            result.update(status="error", error="Mês inválido (use YYYY-MM)")
+        elif kwh_generated is None or kwh_generated < 0:
+            result.update(status="error", error="kWh inválido")
+        else:
+            valid.append(result)
+
+    # 2. Duplicidades: no próprio lote e já registradas no banco
+    keys = {(r["plant_id"], r["month"]) for r in valid}
+    existing = set()
+    if keys:
+        existing = set(
+            db.query(models.Production.plant_id, models.Production.month)
+            .filter(tuple_(models.Production.plant_id, models.Production.month).in_(list(keys)))
+            .all()
+        )
+    seen = set()
+    to_create = []
+    for result in valid:
+        key = (result["plant_id"], result["month"])
+        if key in existing:
+            result.update(status="error", error="Produção já registrada para esta usina e mês")
+        elif key in seen:
+            result.update(status="error", error="Linha duplicada no lote")
+        else:
+            seen.add(key)
+            to_create.append(result)
+
+    if to_create and not dry_run:
+        # 3. Produções em lote; os ids vêm do RETURNING, na ordem das linhas enviadas
+        now = datetime.utcnow()
+        created = db.execute(
+            insert(models.Production).returning(models.Production.id, sort_by_parameter_order=True),
+            [{"plant_id": r["plant_id"], "month": r["month"], "kwh_generated": r["kwh_generated"], "created_at": now} for r in to_create],
+        ).scalars().all()
+        for result, production_id in zip(to_create, created):
+            result.update(status="created", production_id=production_id)
+
+        # 4. Rateio: linhas de rateio e movimentos de crédito em lote + um UPDATE atômico de saldos
+        movements = _allocate_productions(db, [{
+            "id": r["production_id"], "plant_id": r["plant_id"], "month": r["month"], "kwh_generated": r["kwh_generated"],
+            "description": f"Geração - {plants_by_id[r['plant_id']].name}",
+        } for r in to_create])
+        rollups = {}
+        for result in to_create:
+            rollups[result["month"]] = _merge_rollups(rollups.get(result["month"], {}), _production_rollup(result["kwh_generated"]))
+        _post_credit_movements(db, movements)
+        _bump_monthly_rollups(db, rollups)
+        db.commit()
+
+    errors = sum(1 for r in results if r["status"] == "error")
+    return {
+        "dry_run": dry_run,
+        "total": len(rows),
+        "created": 0 if dry_run else len(to_create),
+        "errors": errors,
+        "results": results,
+    }
+
+def get_plant_productions(db: Session, plant_id: int, skip: int = 0, limit: int = 120):
+    return db.query(models.Production)\
+        .filter(models.Production.plant_id == plant_id)\
+        .order_by(models.Production.month.desc(), models.Production.id.desc())\
+        .offset(skip).limit(limit).all()
 
 def update_plant_production(db: Session, production_id: int, production_update: schemas.ProductionUpdate):
+    _lock_rows(db, models.Production, [production_id])
     db_production = db.query(models.Production).filter(models.Production.id == production_id).first()
     if db_production:
         old_kwh = db_production.kwh_generated
-        new_kwh = production_update.kwh_generated if production_update.kwh_generated is not None else old_kwh
+        old_month = db_production.month
+        new_kwh = kwh(production_update.kwh_generated) if production_update.kwh_generated is not None else old_kwh
         diff_kwh = new_kwh - old_kwh
         
         # 1. Update the record
@@ -184,33 +980,46 @@ def update_plant_production(db: Session, production_id: int, production_update:
         if production_update.month is not None:
             db_production.month = production_update.month
             
-        # 2. Adjust coefficients (credits)
-        distributions = get_plant_distributions(db, db_production.plant_id)
-        for dist in distributions:
-            kwh_adj = (dist.percentage / 100.0) * diff_kwh
-            client = get_client(db, dist.client_id)
-            if client:
-                client.current_credits += kwh_adj
-        
+        # 2. Adjust the recorded allocations (credits)
+        description = f"Correção da geração #{db_production.id}"
+        if db_production.month == old_month:
+            # Mesmo mês: cada parte é recalculada com o percentual com que foi lançada
+            movements = []
+            for allocation in _production_allocations(db, db_production.id):
+                amount = share(allocation.percentage, new_kwh)
+                movements.append(_credit_movement(allocation.client_id, amount - allocation.kwh, "geracao", old_month,
+                                                  description=description, production_id=db_production.id))
+                allocation.kwh = amount
+        else:
+            # Mudança de mês: estorna no mês antigo e rateia de novo com a versão vigente no novo
+            movements = _reverse_allocations(db, db_production.id, description)
+            movements += _allocate_productions(db, [{
+                "id": db_production.id, "plant_id": db_production.plant_id, "month": db_production.month,
+                "kwh_generated": new_kwh, "description": description,
+            }])
+        _post_credit_movements(db, movements)
+
+        if db_production.month == old_month:
+            _bump_monthly_rollup(db, old_month, {"production_kwh": diff_kwh})
+        else:
+            _bump_monthly_rollup(db, old_month, _production_rollup(old_kwh, -1))
+            _bump_monthly_rollup(db, db_production.month, _production_rollup(new_kwh))
+
         db.commit()
         db.refresh(db_production)
         return db_production
     return None
 
 def delete_plant_production(db: Session, production_id: int):
+    _lock_rows(db, models.Production, [production_id])
     db_production = db.query(models.Production).filter(models.Production.id == production_id).first()
     if db_production:
-        # 1. Reverse the credits
-        distributions = get_plant_distributions(db, db_production.plant_id)
-        total_kwh = db_production.kwh_generated
-        
-        for dist in distributions:
-            kwh_to_remove = (dist.percentage / 100.0) * total_kwh
-            client = get_client(db, dist.client_id)
-            if client:
-                client.current_credits -= kwh_to_remove
+        # 1. Reverse the credits recorded for this production
+        movements = _reverse_allocations(db, db_production.id, f"Estorno da geração #{db_production.id}")
+        _post_credit_movements(db, movements)
         
         # 2. Delete the record
+        _bump_monthly_rollup(db, db_production.month, _production_rollup(db_production.kwh_generated, -1))
         db.delete(db_production)
         db.commit()
         return True
@@ -226,11 +1035,61 @@ def get_client_by_uc(db: Session, uc_number: str):
 def get_client_by_email(db: Session, email: str):
     return db.query(models.Client).filter(models.Client.email == email).first()
 
-def get_clients(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Client).offset(skip).limit(limit).all()
+# Colunas usadas pela listagem resumida (schemas.ClientPlain)
+CLIENT_SUMMARY_COLUMNS = (
+    models.Client.id,
+    models.Client.name,
+    models.Client.address,
+    models.Client.uc_number,
+    models.Client.email,
+    models.Client.phone,
+    models.Client.payment_day,
+    models.Client.kwh_value_original,
+    models.Client.negotiated_discount,
+    models.Client.current_credits,
+    models.Client.is_active,
+)
+
+def get_clients(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    view: str = "full",
+    cursor: str = None,
+    is_active: bool = None,
+    plant_id: int = None,
+):
+    """
+    view="summary": apenas as colunas da tabela (uma query, sem relacionamentos).
+    view="full": relacionamentos carregados com selectinload (uma query por relacionamento,
+    independente do numero de clientes).
+    Retorna (clientes, proximo_cursor).
+    """
+    query = db.query(models.Client)
+    if is_active is not None:
+        query = query.filter(models.Client.is_active == is_active)
+    if plant_id is not None:
+        query = query.filter(
+            db.query(models.PlantDistribution.id).filter(
+                models.PlantDistribution.plant_id == plant_id,
+                models.PlantDistribution.client_id == models.Client.id,
+                models.PlantDistribution.effective_to.is_(None),
+            ).exists()
+        )
+    if view == "summary":
+        query = query.options(load_only(*CLIENT_SUMMARY_COLUMNS))
+    else:
+        query = query.options(
+            selectinload(models.Client.invoices),
+            selectinload(models.Client.plant_distributions),
+            selectinload(models.Client.credit_adjustments),
+        )
+    return _paginate(query, (models.Client.id,), skip=skip, limit=limit, cursor=cursor)
 
 def create_client(db: Session, client: schemas.ClientCreate):
-    db_client = models.Client(**client.dict())
+    client_data = client.dict()
+    client_data["password"] = security.hash_password(client_data["password"])
+    db_client = models.Client(**client_data)
     db.add(db_client)
     db.commit()
     db.refresh(db_client)
@@ -239,7 +1098,9 @@ def create_client(db: Session, client: schemas.ClientCreate):
 def update_client_credits(db: Session, client_id: int, credits_to_add: float):
     db_client = get_client(db, client_id)
     if db_client:
-        db_client.current_credits += credits_to_add
+        _post_credit_movements(db, [
+            _credit_movement(client_id, credits_to_add, "ajuste", _current_month(), description="Crédito manual")
+        ])
         db.commit()
         db.refresh(db_client)
     return db_client
@@ -248,6 +1109,10 @@ def update_client(db: Session, client_id: int, client_update: schemas.ClientUpda
     db_client = get_client(db, client_id)
     if db_client:
         update_data = client_update.dict(exclude_unset=True)
+        if update_data.get("password"):
+            update_data["password"] = security.hash_password(update_data["password"])
+        else:
+            update_data.pop("password", None)
         for key, value in update_data.items():
             setattr(db_client, key, value)
         db.commit()
@@ -259,8 +1124,20 @@ def delete_client(db: Session, client_id: int):
     if db_client:
         # Delete related distributions first to avoid FK constraints
         db.query(models.PlantDistribution).filter(models.PlantDistribution.client_id == client_id).delete()
-        # Delete invoices
+        db.query(models.ProductionAllocation).filter(models.ProductionAllocation.client_id == client_id).delete()
+        # Delete invoices (removendo a contribuição delas do rollup mensal)
+        client_invoices = _invoice_rollup_query(db).filter(models.Invoice.client_id == client_id)
+        for month, count, open_count, open_value, profit in client_invoices:
+            _bump_monthly_rollup(db, month, {
+                "invoice_count": -count,
+                "open_invoice_count": -(open_count or 0),
+                "open_invoice_value": -(open_value or 0),
+                "profit": -(profit or 0),
+            })
         db.query(models.Invoice).filter(models.Invoice.client_id == client_id).delete()
+        # Livro razão e snapshots do cliente
+        db.query(models.CreditMovement).filter(models.CreditMovement.client_id == client_id).delete()
+        db.query(models.CreditBalanceSnapshot).filter(models.CreditBalanceSnapshot.client_id == client_id).delete()
         # Finally delete client
         db.delete(db_client)
         db.commit()
@@ -272,9 +1149,6 @@ def create_credit_adjustment(db: Session, client_id: int, adjustment: schemas.Cr
     if not db_client:
         return None
     
-    # Update client credits
-    db_client.current_credits += adjustment.amount
-    
     # Create adjustment log
     db_adjustment = models.CreditAdjustment(
         client_id=client_id,
@@ -282,6 +1156,13 @@ def create_credit_adjustment(db: Session, client_id: int, adjustment: schemas.Cr
         description=adjustment.description
     )
     db.add(db_adjustment)
+    db.flush()
+
+    # Update client credits
+    _post_credit_movements(db, [_credit_movement(
+        client_id, adjustment.amount, "ajuste", db_adjustment.created_at.strftime("%Y-%m"),
+        description=adjustment.description, adjustment_id=db_adjustment.id
+    )])
     db.commit()
     db.refresh(db_client)
     return db_client
@@ -290,104 +1171,223 @@ def create_credit_adjustment(db: Session, client_id: int, adjustment: schemas.Cr
 def create_invoice(db: Session, invoice: schemas.InvoiceCreate):
     db_invoice = models.Invoice(**invoice.dict())
     db.add(db_invoice)
+    db.flush()
     
     # Handle credit deduction
-    if db_invoice.credited_balance > 0:
-        client = get_client(db, db_invoice.client_id)
-        if client:
-            client.current_credits -= db_invoice.credited_balance
-            
+    if kwh(db_invoice.credited_balance) > 0:
+        _post_credit_movements(db, [_credit_movement(
+            db_invoice.client_id, -kwh(db_invoice.credited_balance), "faturamento", db_invoice.month,
+            description=f"Fatura #{db_invoice.id}", invoice_id=db_invoice.id
+        )])
+
+    _bump_monthly_rollup(db, db_invoice.month, _invoice_rollup(db_invoice))
     db.commit()
     db.refresh(db_invoice)
     return db_invoice
 
-def get_invoices(db: Session, skip: int = 0, limit: int = 100):
+def get_invoices(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str = None,
+    month_from: str = None,
+    month_to: str = None,
+    status: str = None,
+    status_pago: bool = None,
+    client_id: int = None,
+    plant_id: int = None,
+):
+    """Faturas mais recentes primeiro (month, id). Retorna (faturas, proximo_cursor)."""
     from sqlalchemy.orm import joinedload
-    return db.query(models.Invoice).options(joinedload(models.Invoice.client)).offset(skip).limit(limit).all()
+    query = db.query(models.Invoice).options(joinedload(models.Invoice.client))
+    if month_from:
+        query = query.filter(models.Invoice.month >= month_from)
+    if month_to:
+        query = query.filter(models.Invoice.month <= month_to)
+    if status:
+        query = query.filter(models.Invoice.status == status)
+    if status_pago is not None:
+        query = query.filter(models.Invoice.status_pago == status_pago)
+    if client_id is not None:
+        query = query.filter(models.Invoice.client_id == client_id)
+    if plant_id is not None:
+        query = query.filter(
+            db.query(models.PlantDistribution.id).filter(
+                models.PlantDistribution.plant_id == plant_id,
+                models.PlantDistribution.client_id == models.Invoice.client_id,
+                models.PlantDistribution.effective_to.is_(None),
+            ).exists()
+        )
+    return _paginate(query, (models.Invoice.month, models.Invoice.id), skip=skip, limit=limit, cursor=cursor, descending=True)
 
 def update_invoice(db: Session, invoice_id: int, invoice_update: schemas.InvoiceUpdate):
+    _lock_rows(db, models.Invoice, [invoice_id])
     db_invoice = db.query(models.Invoice).filter(models.Invoice.id == invoice_id).first()
     if db_invoice:
         update_data = invoice_update.dict(exclude_unset=True)
+        if update_data.get("month", "") is None:
+            del update_data["month"] # month é NOT NULL: null no PATCH não apaga o mês
         
-        # Handle credit balance sync
-        if "credited_balance" in update_data:
-            old_balance = db_invoice.credited_balance or 0.0
-            new_balance = update_data["credited_balance"]
-            diff = old_balance - new_balance
-            # Adjust client credits (if diff > 0, we used less credit, so add back. if diff < 0, we used more, so subtract)
-            client = get_client(db, db_invoice.client_id)
-            if client:
-                client.current_credits += diff
-
+        old_month, old_rollup = db_invoice.month, _invoice_rollup(db_invoice, -1)
+        old_balance = kwh(db_invoice.credited_balance)
         for key, value in update_data.items():
             setattr(db_invoice, key, value)
+
+        # Handle credit balance sync
+        new_balance = kwh(db_invoice.credited_balance)
+        if new_balance != old_balance or db_invoice.month != old_month:
+            refs = dict(description=f"Correção da fatura #{db_invoice.id}", invoice_id=db_invoice.id)
+            client_id = db_invoice.client_id
+            if db_invoice.month == old_month:
+                # diff > 0: usou menos crédito, devolve; diff < 0: usou mais, desconta
+                movements = [_credit_movement(client_id, old_balance - new_balance, "faturamento", old_month, **refs)]
+            else:
+                movements = [
+                    _credit_movement(client_id, old_balance, "faturamento", old_month, **refs),
+                    _credit_movement(client_id, -new_balance, "faturamento", db_invoice.month, **refs),
+                ]
+            _post_credit_movements(db, movements)
+        if db_invoice.month == old_month:
+            _bump_monthly_rollup(db, old_month, _merge_rollups(old_rollup, _invoice_rollup(db_invoice)))
+        else:
+            _bump_monthly_rollup(db, old_month, old_rollup)
+            _bump_monthly_rollup(db, db_invoice.month, _invoice_rollup(db_invoice))
         db.commit()
         db.refresh(db_invoice)
     return db_invoice
 
-def get_dashboard_metrics(db: Session):
-    # Faturas em Aberto (Not Paid)
-    open_invoices_query = db.query(models.Invoice).filter(models.Invoice.status_pago == False)
-    open_invoices_count = open_invoices_query.count()
-    open_invoices_value = sum(inv.total_value for inv in open_invoices_query.all())
-
-    # Monthly Production (Total kWh from all productions)
-    total_production = db.query(models.Production).with_entities(models.Production.kwh_generated).all()
-    monthly_production = sum(p[0] for p in total_production)
+def get_dashboard_metrics(db: Session, month: str = None):
+    """
+    Métricas do painel lidas do rollup mensal. `month` (YYYY-MM) define o mês dos campos
+    monthly_*; sem ele usa o mês mais recente com dados. Faturas em aberto e totais são acumulados.
+    """
+    rollup = models.MonthlyRollup
+    totals = db.query(
+        func.coalesce(func.sum(rollup.open_invoice_count), 0),
+        func.coalesce(func.sum(rollup.open_invoice_value), 0),
+        func.coalesce(func.sum(rollup.production_kwh), 0),
+        func.coalesce(func.sum(rollup.profit), 0),
+        func.max(rollup.month),
+    ).one()
+    open_invoices_count, open_invoices_value, total_production, total_margin, latest_month = totals
 
-    # Monthly Margin (Total Profit)
-    total_profit = db.query(models.Invoice).with_entities(models.Invoice.profit).all()
-    monthly_margin = sum(p[0] for p in total_profit)
+    month = month or latest_month
+    current = db.query(rollup).filter(rollup.month == month).first() if month else None
 
     # Recent Clients (Last 5)
     recent_clients = db.query(models.Client).order_by(models.Client.id.desc()).limit(5).all()
 
     return {
+        "month": month,
         "open_invoices_count": open_invoices_count,
         "open_invoices_value": open_invoices_value,
-        "monthly_production": monthly_production,
-        "monthly_margin": monthly_margin,
+        "monthly_production": current.production_kwh if current else 0,
+        "monthly_margin": current.profit if current else 0,
+        "total_production": total_production,
+        "total_margin": total_margin,
         "recent_clients": recent_clients
     }
 
 def delete_invoice(db: Session, invoice_id: int):
+    _lock_rows(db, models.Invoice, [invoice_id])
     db_invoice = db.query(models.Invoice).filter(models.Invoice.id == invoice_id).first()
     if db_invoice:
         # Handle credit restoration
         if db_invoice.credited_balance > 0:
-            client = get_client(db, db_invoice.client_id)
-            if client:
-                client.current_credits += db_invoice.credited_balance
-                
+            _post_credit_movements(db, [_credit_movement(
+                db_invoice.client_id, db_invoice.credited_balance, "faturamento", db_invoice.month,
+                description=f"Estorno da fatura #{db_invoice.id}", invoice_id=db_invoice.id
+            )])
+
+        _bump_monthly_rollup(db, db_invoice.month, _invoice_rollup(db_invoice, -1))
         db.delete(db_invoice)
         db.commit()
         return True
     return False
 
-def get_client_statement(db: Session, client_id: int):
-    # 1. Get all invoices
-    invoices = db.query(models.Invoice).filter(models.Invoice.client_id == client_id).all()
-    
-    # 2. Get all productions for plants this client is in
-    productions = db.query(models.Production, models.PlantDistribution.percentage, models.GenerationPlant.name)\
-        .join(models.PlantDistribution, models.Production.plant_id == models.PlantDistribution.plant_id)\
-        .join(models.GenerationPlant, models.Production.plant_id == models.GenerationPlant.id)\
-        .filter(models.PlantDistribution.client_id == client_id)\
-        .all()
-    
-    statement = []
-    
-    # Add Invoices (Deductions)
-    for inv in invoices:
-        statement.append({
-            "date": inv.month,
-            "type": "faturamento",
-            "kwh": -inv.credited_balance if inv.credited_balance else 0,
-            "description": f"Fatura #{inv.id}",
-            "status": inv.status,
-            "invoice_id": inv.id,
-            "item": {
+def _month_of(db: Session, column):
+    """Expressão YYYY-MM de uma coluna DateTime no banco em uso."""
+    if db.get_bind().dialect.name == "postgresql":
+        return func.to_char(column, "YYYY-MM")
+    return func.strftime("%Y-%m", column)
+
+# Ordem cronológica dentro do mês: gerações, ajustes e por fim as faturas que consomem o saldo
+STATEMENT_TYPE_RANK = {"geracao": 0, "ajuste": 1, "faturamento": 2}
+STATEMENT_STATUS = {"geracao": "concluído", "ajuste": "processado"}
+
+def _client_statement_query(db: Session, client_id: int, cursor: str = None):
+    """
+    Extrato como uma única query: UNION ALL de faturas, rateio gravado das gerações e ajustes,
+    com o saldo acumulado calculado por window function e ordenado do mais recente para o mais
+    antigo.
+    """
+    invoices = db.query(
+        models.Invoice.month.label("period"),
+        literal(STATEMENT_TYPE_RANK["faturamento"]).label("type_rank"),
+        models.Invoice.id.label("source_id"),
+        (-func.coalesce(models.Invoice.credited_balance, 0)).label("kwh"),
+        ("Fatura #" + cast(models.Invoice.id, String)).label("description"),
+        models.Invoice.status.label("status"),
+    ).filter(models.Invoice.client_id == client_id)
+
+    productions = db.query(
+        models.ProductionAllocation.month.label("period"),
+        literal(STATEMENT_TYPE_RANK["geracao"]).label("type_rank"),
+        models.ProductionAllocation.production_id.label("source_id"),
+        models.ProductionAllocation.kwh.label("kwh"),
+        ("Geração - " + func.coalesce(models.GenerationPlant.name, "")).label("description"),
+        literal(None, String).label("status"),
+    ).join(models.GenerationPlant, models.ProductionAllocation.plant_id == models.GenerationPlant.id)\
+        .filter(models.ProductionAllocation.client_id == client_id)
+
+    adjustments = db.query(
+        _month_of(db, models.CreditAdjustment.created_at).label("period"),
+        literal(STATEMENT_TYPE_RANK["ajuste"]).label("type_rank"),
+        models.CreditAdjustment.id.label("source_id"),
+        models.CreditAdjustment.amount.label("kwh"),
+        models.CreditAdjustment.description.label("description"),
+        literal(None, String).label("status"),
+    ).filter(models.CreditAdjustment.client_id == client_id)
+
+    entries = invoices.union_all(productions, adjustments).subquery()
+    chronological = (entries.c.period, entries.c.type_rank, entries.c.source_id)
+    ledger = db.query(
+        entries,
+        func.sum(entries.c.kwh).over(order_by=chronological, rows=(None, 0)).label("balance"),
+    ).subquery()
+
+    keys = (ledger.c.period, ledger.c.type_rank, ledger.c.source_id)
+    query = db.query(ledger)
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(keys):
+            raise ValueError("Cursor invalido")
+        query = query.filter(tuple_(*keys) < tuple_(*values))
+    return query.order_by(*[key.desc() for key in keys])
+
+def _statement_entries(db: Session, rows):
+    """Converte linhas do extrato em dicts; detalhes das faturas vêm de uma query IN por lote."""
+    type_by_rank = {rank: kind for kind, rank in STATEMENT_TYPE_RANK.items()}
+    invoice_ids = [row.source_id for row in rows if type_by_rank[row.type_rank] == "faturamento"]
+    invoices = {}
+    if invoice_ids:
+        invoices = {inv.id: inv for inv in db.query(models.Invoice).filter(models.Invoice.id.in_(invoice_ids))}
+
+    entries = []
+    for row in rows:
+        kind = type_by_rank[row.type_rank]
+        entry = {
+            "date": row.period,
+            "type": kind,
+            "kwh": row.kwh or 0,
+            "balance": row.balance or 0,
+            "description": row.description,
+            "status": row.status if kind == "faturamento" else STATEMENT_STATUS[kind],
+        }
+        inv = invoices.get(row.source_id) if kind == "faturamento" else None
+        if inv is not None:
+            entry["invoice_id"] = inv.id
+            entry["item"] = {
                 "id": inv.id,
                 "month": inv.month,
                 "consumption_kwh": inv.consumption_kwh,
@@ -404,62 +1404,191 @@ def get_client_statement(db: Session, client_id: int):
                 "status_pago": inv.status_pago,
                 "status_recebido": inv.status_recebido
             }
-        })
-            
-    # Add Productions (Additions)
-    for prod, percentage, plant_name in productions:
-        kwh_added = (percentage / 100.0) * prod.kwh_generated
-        statement.append({
-            "date": prod.month,
-            "type": "geracao",
-            "kwh": kwh_added,
-            "description": f"Geração - {plant_name}",
-            "status": "concluído"
-        })
+        entries.append(entry)
+    return entries
 
-    # Add Manual Adjustments
-    adjustments = db.query(models.CreditAdjustment).filter(models.CreditAdjustment.client_id == client_id).all()
-    for adj in adjustments:
-        statement.append({
-            "date": adj.created_at.strftime("%Y-%m"),
-            "type": "ajuste",
-            "kwh": adj.amount,
-            "description": adj.description,
-            "status": "processado"
-        })
-        
-    # Sort by date descending
-    statement.sort(key=lambda x: x["date"], reverse=True)
-    return statement
+def get_client_statement(db: Session, client_id: int, limit: int = 100, cursor: str = None):
+    """Uma página do extrato (mais recente primeiro). Retorna (lançamentos, proximo_cursor)."""
+    rows = _client_statement_query(db, client_id, cursor=cursor).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor((last.period, last.type_rank, last.source_id))
+    return _statement_entries(db, rows), next_cursor
 
-# --- Operators ---
-import bcrypt
-
-def hash_password(password: str) -> str:
-    # Bcrypt has a maximum password length of 72 bytes
-    pwd_bytes = password.encode('utf-8')
-    # Truncation logic is still good practice though bcrypt 4.0+ might handle it
-    if len(pwd_bytes) > 72:
-        pwd_bytes = pwd_bytes[:72]
-    
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(pwd_bytes, salt)
-    return hashed.decode('utf-8')
+def iter_client_statement(db: Session, client_id: int, cursor: str = None, chunk_size: int = 500):
+    """Extrato completo em lotes, para streaming: memória limitada a `chunk_size` linhas."""
+    result = db.execute(
+        _client_statement_query(db, client_id, cursor=cursor).statement,
+        execution_options={"yield_per": chunk_size},
+    )
+    for rows in result.partitions():
+        yield from _statement_entries(db, rows)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    try:
-        if not hashed_password:
-            return False
-        return bcrypt.checkpw(
-            plain_password.encode('utf-8'),
-            hashed_password.encode('utf-8')
+# --- Billing Run ---
+BILLING_PROFIT_RATE = Decimal("0.2") # Margem sobre o valor cobrado
+DEFAULT_KWH_VALUE_ORIGINAL = Decimal("1.20") # Tarifa usada quando o cliente não tem uma cadastrada
+
+def compute_invoice_values(consumption_kwh, kwh_value_original, discount_percent,
+                           fixed_cost, available_credits, credited_balance=None) -> dict:
+    """Cálculo da fatura (o mesmo que o modal de faturamento fazia no navegador), em Decimal."""
+    consumption_kwh = kwh(consumption_kwh)
+    kwh_value_original = quantize(kwh_value_original, TARIFF_SCALE)
+    fixed_cost = brl(fixed_cost)
+    injection = kwh_value_original * (1 - percent(discount_percent) / 100)
+    # Créditos usados nunca passam do consumo nem do saldo, mesmo quando vêm lidos da conta
+    usable = min(consumption_kwh, max(kwh(available_credits), 0))
+    credited = usable if credited_balance is None else min(max(kwh(credited_balance), 0), usable)
+    value_without_discount = consumption_kwh * kwh_value_original + fixed_cost
+    total_invoiced = consumption_kwh * injection
+    amount_to_collect = total_invoiced + fixed_cost
+    return {
+        "consumption_kwh": consumption_kwh,
+        "kwh_value_original": kwh_value_original,
+        "kwh_value_injection": quantize(injection, 4),
+        "credited_balance": quantize(credited, 2),
+        "fixed_cost": fixed_cost,
+        "value_without_discount": brl(value_without_discount),
+        "total_invoiced": brl(total_invoiced),
+        "amount_to_collect": brl(amount_to_collect),
+        "discount": brl(value_without_discount - amount_to_collect),
+        "profit": brl(brl(amount_to_collect) * BILLING_PROFIT_RATE),
+    }
+
+def run_billing(db: Session, request: schemas.BillingRunRequest, dry_run: bool = False):
+    """
+    Fatura o mês para todos os clientes ativos com leitura informada, num único lote:
+    clientes e faturas existentes carregados com uma query cada, faturas inseridas em lote,
+    créditos debitados com um UPDATE atômico e o rollup atualizado uma vez. Idempotente por
+    (cliente, mês): clientes que já têm fatura no mês são ignorados. Tudo numa transação.
+    """
+    if not MONTH_PATTERN.match(request.month):
+        raise ValueError("Mês inválido (use YYYY-MM)")
+    month = request.month
+    readings = {}
+    for reading in request.readings:
+        readings[reading.client_id] = reading
+
+    if readings and not dry_run:
+        # Serializa execuções concorrentes sobre os mesmos clientes
+        _lock_rows(db, models.Client, list(readings))
+
+    clients = {c.id: c for c in db.query(models.Client).filter(models.Client.id.in_(readings.keys()))} if readings else {}
+    invoiced = {
+        client_id for (client_id,) in
+        db.query(models.Invoice.client_id).filter(models.Invoice.month == month, models.Invoice.client_id.in_(readings.keys()))
+    } if readings else set()
+
+    items = []
+    to_create = []
+    for client_id, reading in readings.items():
+        client = clients.get(client_id)
+        if client is None:
+            items.append({"client_id": client_id, "status": "skipped", "reason": "Cliente não encontrado"})
+            continue
+        item = {"client_id": client_id, "client_name": client.name}
+        if not client.is_active:
+            item.update(status="skipped", reason="Cliente inativo")
+        elif client_id in invoiced:
+            item.update(status="skipped", reason="Fatura do mês já existe")
+        elif reading.consumption_kwh < 0:
+            item.update(status="skipped", reason="Consumo inválido")
+        else:
+            item.update(compute_invoice_values(
+                consumption_kwh=reading.consumption_kwh,
+                kwh_value_original=reading.kwh_value_original or client.kwh_value_original or DEFAULT_KWH_VALUE_ORIGINAL,
+                discount_percent=client.negotiated_discount or 0.0,
+                fixed_cost=reading.fixed_cost if reading.fixed_cost is not None else request.default_fixed_cost,
+                available_credits=client.current_credits or 0.0,
+                credited_balance=reading.credited_balance,
+            ))
+            item["status"] = "preview" if dry_run else "created"
+            to_create.append(item)
+        items.append(item)
+
+    if to_create and not dry_run:
+        db.execute(insert(models.Invoice), [{
+            "client_id": item["client_id"],
+            "month": month,
+            "consumption_kwh": item["consumption_kwh"],
+            "kwh_value": item["kwh_value_injection"],
+            "kwh_value_original": item["kwh_value_original"],
+            "kwh_value_injection": item["kwh_value_injection"],
+            "credited_balance": item["credited_balance"],
+            "invoice_value": item["amount_to_collect"],
+            "fixed_cost": item["fixed_cost"],
+            "total_invoiced": item["total_invoiced"],
+            "amount_to_collect": item["amount_to_collect"],
+            "value_without_discount": item["value_without_discount"],
+            "total_value": item["amount_to_collect"],
+            "original_value": item["value_without_discount"],
+            "discount": item["discount"],
+            "profit": item["profit"],
+            "status": "aberto",
+            "status_cobrado": False,
+            "status_pago": False,
+            "status_recebido": True,
+            "equatorial_invoice_path": readings[item["client_id"]].equatorial_invoice_path,
+        } for item in to_create])
+        invoice_ids = dict(
+            db.query(models.Invoice.client_id, models.Invoice.id)
+            .filter(models.Invoice.month == month, models.Invoice.client_id.in_([item["client_id"] for item in to_create]))
         )
-    except Exception:
-        return False
+        movements = []
+        for item in to_create:
+            item["invoice_id"] = invoice_ids[item["client_id"]]
+            movements.append(_credit_movement(
+                item["client_id"], -item["credited_balance"], "faturamento", month,
+                description=f"Fatura #{item['invoice_id']}", invoice_id=item["invoice_id"]
+            ))
+        _post_credit_movements(db, movements)
+        _bump_monthly_rollup(db, month, {
+            "invoice_count": len(to_create),
+            "open_invoice_count": len(to_create),
+            "open_invoice_value": sum(item["amount_to_collect"] for item in to_create),
+            "profit": sum(item["profit"] for item in to_create),
+        })
+        db.commit()
 
+    return {
+        "month": month,
+        "dry_run": dry_run,
+        "created": 0 if dry_run else len(to_create),
+        "skipped": len(items) - len(to_create),
+        "total_amount_to_collect": sum(item["amount_to_collect"] for item in to_create),
+        "total_credited_kwh": sum(item["credited_balance"] for item in to_create),
+        "items": items,
+    }
+
+def _digits(value) -> str:
+    return re.sub(r"\D", "", value or "")
+
+def match_equatorial_bills(db: Session, results: list, month: str):
+    """
+    Associa as contas lidas aos clientes pela UC (comparando só os dígitos) e monta as
+    leituras do faturamento. Uma única query carrega as UCs dos clientes.
+    """
+    by_uc = {_digits(uc): client_id for client_id, uc in db.query(models.Client.id, models.Client.uc_number) if _digits(uc)}
+    readings = []
+    for result in results:
+        fields = result.get("fields") or {}
+        client_id = by_uc.get(_digits(fields.get("uc_number")))
+        result["client_id"] = client_id
+        if client_id is None or fields.get("month") != month or fields.get("consumption_kwh") is None:
+            continue
+        readings.append(schemas.BillingReading(
+            client_id=client_id,
+            consumption_kwh=fields["consumption_kwh"],
+            kwh_value_original=fields.get("kwh_value_original"),
+            credited_balance=fields.get("credited_balance"),
+            equatorial_invoice_path=result.get("path"),
+        ))
+    return readings
 
+# --- Operators ---
 def create_operator(db: Session, operator: schemas.OperatorCreate):
-    hashed_password = hash_password(operator.password)
+    hashed_password = security.hash_password(operator.password)
     db_operator = models.Operator(
         full_name=operator.full_name,
         email=operator.email,
@@ -471,8 +1600,11 @@ def create_operator(db: Session, operator: schemas.OperatorCreate):
     db.refresh(db_operator)
     return db_operator
 
-def get_operators(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Operator).offset(skip).limit(limit).all()
+def get_operators(db: Session, skip: int = 0, limit: int = 100, cursor: str = None, is_active: bool = None):
+    query = db.query(models.Operator)
+    if is_active is not None:
+        query = query.filter(models.Operator.is_active == is_active)
+    return _paginate(query, (models.Operator.id,), skip=skip, limit=limit, cursor=cursor)
 
 def get_operator_by_id(db: Session, operator_id: int):
     return db.query(models.Operator).filter(models.Operator.id == operator_id).first()
@@ -480,6 +1612,15 @@ def get_operator_by_id(db: Session, operator_id: int):
 def get_operator_by_email(db: Session, email: str):
     return db.query(models.Operator).filter(models.Operator.email == email).first()
 
+def store_password_hash(db: Session, user_type: str, user_id: int, hashed_password: str):
+    """Regrava a senha após o login (custo do bcrypt mudou ou senha legada em texto puro)."""
+    if user_type == "admin":
+        query = update(models.Operator).where(models.Operator.id == user_id).values(hashed_password=hashed_password)
+    else:
+        query = update(models.Client).where(models.Client.id == user_id).values(password=hashed_password)
+    db.execute(query)
+    db.commit()
+
 def update_operator(db: Session, operator_id: int, operator_update: schemas.OperatorUpdate):
     db_operator = get_operator_by_id(db, operator_id)
     if db_operator:
@@ -487,7 +1628,7 @@ def update_operator(db: Session, operator_id: int, operator_update: schemas.Oper
         
         # Hash password if it's being updated
         if "password" in update_data:
-            update_data["hashed_password"] = hash_password(update_data.pop("password"))
+            update_data["hashed_password"] = security.hash_password(update_data.pop("password"))
         
         for key, value in update_data.items():
             setattr(db_operator, key, value)
@@ -503,61 +1644,72 @@ def delete_operator(db: Session, operator_id: int):
         return True
     return False
 
-def get_invoice_pix_payload(db: Session, invoice_id: int):
-    invoice = db.query(models.Invoice).filter(models.Invoice.id == invoice_id).first()
-    if not invoice:
-        logger.warning(f"[PIX] Invoice {invoice_id} not found")
-        return None
-    
-    # Get the client's plant via distribution
-    distribution = db.query(models.PlantDistribution).filter(
-        models.PlantDistribution.client_id == invoice.client_id
-    ).first()
-    
-    if not distribution:
-        logger.warning(f"[PIX] No plant distribution found for client {invoice.client_id}")
+def _pix_source_query(db: Session):
+    """Fatura + usina de recebimento (primeiro rateio vigente do cliente) numa única query."""
+    first_distribution = (
+        select(func.min(models.PlantDistribution.id))
+        .where(models.PlantDistribution.client_id == models.Invoice.client_id, models.PlantDistribution.effective_to.is_(None))
+        .correlate(models.Invoice)
+        .scalar_subquery()
+    )
+    return db.query(
+        models.Invoice.id,
+        models.Invoice.client_id,
+        models.Invoice.month,
+        models.Invoice.amount_to_collect,
+        models.PlantDistribution.plant_id,
+        models.GenerationPlant.name,
+        models.GenerationPlant.pix_key,
+    ).outerjoin(models.PlantDistribution, models.PlantDistribution.id == first_distribution)\
+        .outerjoin(models.GenerationPlant, models.GenerationPlant.id == models.PlantDistribution.plant_id)
+
+def _pix_payload(row, include_qr: bool = False):
+    if row.plant_id is None:
+        logger.warning(f"[PIX] No plant distribution found for client {row.client_id}")
         return {"error": "Cliente sem usina vinculada. Verifique o rateio na usina."}
-        
-    plant = db.query(models.GenerationPlant).filter(
-        models.GenerationPlant.id == distribution.plant_id
-    ).first()
-    
-    if not plant:
-        logger.warning(f"[PIX] Plant {distribution.plant_id} not found")
+    if row.pix_key is None and row.name is None:
+        logger.warning(f"[PIX] Plant {row.plant_id} not found")
         return {"error": "Usina não encontrada."}
-        
-    if not plant.pix_key or plant.pix_key.strip() == '':
-        logger.warning(f"[PIX] Plant {plant.id} has no pix_key")
+    if not row.pix_key or row.pix_key.strip() == '':
+        logger.warning(f"[PIX] Plant {row.plant_id} has no pix_key")
         return {"error": "Usina sem Chave PIX cadastrada. Edite a usina e adicione a chave."}
-    
-    # Validate invoice amount
-    amount = invoice.amount_to_collect
+
+    amount = row.amount_to_collect
     if not amount or amount <= 0:
-        logger.warning(f"[PIX] Invoice {invoice_id} has invalid amount: {amount}")
+        logger.warning(f"[PIX] Invoice {row.id} has invalid amount: {amount}")
         return {"error": "Fatura com valor inválido (R$ 0,00)."}
 
     try:
-        # Generate PIX BR Code (EMV QRCPS-MPM) natively
-        recipient_name = (plant.name or "RAIZ SOLAR")
-        pix_city = "MACAPA"
-        txid = f"FAT{invoice.id:010d}"
-        
-        logger.info(f"[PIX] Generating for invoice={invoice_id}, key={plant.pix_key}, amount={amount:.2f}")
-        
-        payload_str = _generate_pix_brcode(
-            name=recipient_name,
-            key=plant.pix_key,
-            amount=amount,
-            city=pix_city,
-            txid=txid
-        )
-        
-        return {
-            "pix_payload": payload_str,
-            "pix_key": plant.pix_key,
-            "amount": round(amount, 2),
+        recipient_name = (row.name or pix.DEFAULT_RECIPIENT)
+        payload = {
+            "pix_payload": pix.generate_brcode(name=recipient_name, key=row.pix_key, amount=amount),
+            "pix_key": row.pix_key,
+            "amount": brl(amount),
             "recipient": recipient_name[:25]
         }
+        if include_qr:
+            payload["qr_image"] = pix.qr_png_base64(payload["pix_payload"])
+        return payload
     except Exception as e:
         logger.error(f"[PIX] Error generating payload: {type(e).__name__}: {str(e)}", exc_info=True)
         return {"error": f"Erro interno ao gerar PIX: {str(e)}"}
+
+def get_invoice_pix_payload(db: Session, invoice_id: int):
+    row = _pix_source_query(db).filter(models.Invoice.id == invoice_id).first()
+    if not row:
+        logger.warning(f"[PIX] Invoice {invoice_id} not found")
+        return None
+    return _pix_payload(row)
+
+def get_month_pix_payloads(db: Session, month: str, include_qr: bool = False):
+    """PIX de todas as faturas em aberto do mês: uma query e uma passada."""
+    rows = _pix_source_query(db).filter(
+        models.Invoice.month == month,
+        models.Invoice.status_pago.isnot(True),
+    ).order_by(models.Invoice.id).all()
+    items = []
+    for row in rows:
+        item = {"invoice_id": row.id, "client_id": row.client_id, "month": row.month}
+        item.update(_pix_payload(row, include_qr=include_qr))
+        items.append(item)
+    return items
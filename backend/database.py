@@ -1,13 +1,81 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 import os
 import logging
+import threading
+import time
 
 # Configuração de Logs
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Pool de conexões (dimensionar pelo nº de workers x threads; o Postgres do Render limita conexões)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # segundos
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # segundos esperando uma conexão livre
+
+# Pragmas do SQLite local: WAL deixa leituras concorrerem com a escrita e busy_timeout
+# espera o lock em vez de falhar na hora com "database is locked"
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE_MB = int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Caminho assíncrono opcional para as leituras (asyncpg no PostgreSQL, aiosqlite local)
+DB_ASYNC = os.getenv("DB_ASYNC", "0").lower() in ("1", "true", "yes")
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+class PoolStats:
+    """Contadores do pool para monitoramento (checkouts, espera por conexão, timeouts)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connections_opened = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+            self.timeouts += timed_out
+
+    def record_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connections_opened += 1
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mede quanto cada requisição esperou para obter uma conexão."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_stats.record_wait(time.perf_counter() - start)
+        return connection
+
+
 # Pega a URL do banco de dados da variável de ambiente (Render) ou usa SQLite localmente
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
@@ -15,23 +83,103 @@ if SQLALCHEMY_DATABASE_URL:
     # Ajuste para o Render que às vezes usa postgres:// em vez de postgresql://
     if SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
         SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
-    
-    logger.info("Conectando ao banco de dados PostgreSQL...")
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL,
-        # Argumentos para manter a conexão ativa e segura no Render
-        pool_pre_ping=True,
-    )
 else:
-    logger.info("Conectando ao banco de dados SQLite local...")
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     db_path = os.path.join(BASE_DIR, "sql_app.db")
     SQLALCHEMY_DATABASE_URL = f"sqlite:///{db_path}"
+
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+engine_options = dict(
+    poolclass=InstrumentedQueuePool,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_recycle=POOL_RECYCLE,
+    pool_timeout=POOL_TIMEOUT,
+)
+if IS_SQLITE:
+    logger.info("Conectando ao banco de dados SQLite local...")
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, **engine_options
+    )
+else:
+    logger.info("Conectando ao banco de dados PostgreSQL...")
     engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+        SQLALCHEMY_DATABASE_URL,
+        # Argumentos para manter a conexão ativa e segura no Render
+        pool_pre_ping=True,
+        **engine_options
     )
 
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if IS_SQLITE:
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE_MB * 1024 * 1024}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+
+@event.listens_for(engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    pool_stats.record_connect()
+    _apply_sqlite_pragmas(dbapi_connection, connection_record)
+
+
+@event.listens_for(engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_stats.record_checkout()
+
+
+def get_pool_stats() -> dict:
+    pool = engine.pool
+    stats = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "max_overflow": MAX_OVERFLOW,
+        "checkouts": pool_stats.checkouts,
+        "connections_opened": pool_stats.connections_opened,
+        "wait_avg_ms": round(pool_stats.wait_seconds / pool_stats.waits * 1000, 3) if pool_stats.waits else 0.0,
+        "wait_max_ms": round(pool_stats.max_wait_seconds * 1000, 3),
+        "timeouts": pool_stats.timeouts,
+    }
+    if async_engine is not None:
+        async_pool = async_engine.pool
+        stats["async"] = {
+            "size": async_pool.size(),
+            "checked_out": async_pool.checkedout(),
+            "checked_in": async_pool.checkedin(),
+            "overflow": async_pool.overflow(),
+        }
+    return stats
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
+        url = make_url(SQLALCHEMY_DATABASE_URL)
+        async_engine = create_async_engine(
+            url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()]),
+            pool_size=POOL_SIZE,
+            max_overflow=MAX_OVERFLOW,
+            pool_recycle=POOL_RECYCLE,
+            pool_timeout=POOL_TIMEOUT,
+            pool_pre_ping=not IS_SQLITE,
+        )
+        event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+        logger.info(f"Leituras assíncronas habilitadas ({async_engine.url.drivername})")
+    except (ImportError, KeyError) as e:
+        logger.warning(f"DB_ASYNC ignorado, driver assíncrono indisponível: {type(e).__name__}: {e}")
+        async_engine = None
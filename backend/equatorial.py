@@ -0,0 +1,295 @@
+"""
+Extração dos dados de faturamento das contas em PDF da Equatorial.
+
+Lê a camada de texto do PDF (pacote opcional `pypdf`) e procura, por expressões
+regulares, os campos que o operador digitava à mão: mês de referência, UC, consumo,
+tarifa cheia (R$/kWh), energia injetada e créditos recebidos. O resultado de cada
+arquivo fica em cache por SHA-256 (um JSON em PARSE_CACHE_DIR, fora do diretório público
+de uploads), e um índice sha -> mês diz quais contas já lidas são de cada mês: o lote
+abre só os PDFs ainda não lidos, num pool de processos do módulo, e só os resultados do
+mês pedido.
+"""
+import hashlib
+import json
+import os
+import re
+import unicodedata
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+try:
+    from pypdf import PdfReader  # Opcional: necessário apenas para ler os PDFs
+except ImportError:
+    PdfReader = None
+
+# Mudar quando os padrões mudarem: invalida o cache de resultados antigos
+PARSER_VERSION = 2
+PARSE_CACHE_DIR = Path(os.getenv("EQUATORIAL_PARSE_CACHE_DIR", "equatorial_parsed"))
+PARSE_WORKERS = int(os.getenv("EQUATORIAL_PARSE_WORKERS", "0")) or None  # None = nº de CPUs
+
+_NUMBER = r"(\d{1,3}(?:\.\d{3})*(?:,\d+)?|\d+(?:[.,]\d+)?)"
+_MONTHS = {"JAN": 1, "FEV": 2, "MAR": 3, "ABR": 4, "MAI": 5, "JUN": 6,
+           "JUL": 7, "AGO": 8, "SET": 9, "OUT": 10, "NOV": 11, "DEZ": 12}
+_MONTH_NAME = "(?:" + "|".join(_MONTHS) + ")"
+
+# Layout da conta (amostras em uploads/equatorial_invoices, conferidas por
+# .maintenance/check_equatorial_samples.py). O pypdf devolve as colunas coladas:
+# - o mês de referência aparece sozinho numa linha ("FEV/2026") e a UC da conta vem logo
+#   depois, na linha seguinte ou colada no canhoto ("FEV/2026690140988"); a conta não
+#   traz rótulo para a própria UC, e as citadas no bloco do SCEE ("UC 690140988 = 10%")
+#   são as do rateio, que podem ser de outra unidade: número depois de "UC" não é a UC da conta;
+# - a linha do item é "CONSUMO NÃO COMPENSADO kWh <tarifa com tributos, 6 casas><quantidade>",
+#   ex.: "1,126520100,00" = R$ 1,126520/kWh e 100,00 kWh;
+# - o bloco "INFORMAÇÕES DO SCEE" traz a geração do ciclo e o crédito recebido do rateio.
+#   O "SALDO KWH" dali é o saldo que sobra, não o crédito usado na conta: não é lido.
+# Padrões por campo, testados em ordem (o texto já está sem acentos e em maiúsculas)
+PATTERNS = {
+    "uc_number": [
+        r"(?m)^" + _MONTH_NAME + r"/\d{4}\s*(\d{5,})\b",
+        r"UNIDADE CONSUMIDORA\D{0,20}(\d[\d.\-/]{3,})",
+        r"CONTA CONTRATO\D{0,20}(\d[\d.\-/]{3,})",
+    ],
+    "consumption_kwh": [
+        r"CONSUMO NAO COMPENSADO KWH \d+,\d{6}(\d{1,3}(?:\.\d{3})*,\d{2})\b",
+        r"CONSUMO(?: ATIVO)?(?: FATURADO)?(?: EM)?(?: \(?KWH\)?)? ?" + _NUMBER + r"\s*KWH",
+        r"ENERGIA ATIVA FORNECIDA\D{0,30}?" + _NUMBER,
+    ],
+    "kwh_value_original": [
+        r"CONSUMO NAO COMPENSADO KWH (\d+,\d{6})",
+        r"TARIFA(?: COM TRIBUTOS)?\D{0,30}?(\d+,\d{2,})",
+        r"PRECO UNIT(?:ARIO)?(?: COM TRIBUTOS)?\D{0,30}?(\d+,\d{2,})",
+        r"R\$ ?/ ?KWH\D{0,10}?(\d+,\d{2,})",
+    ],
+    "injected_kwh": [
+        r"GERACAO CICLO \(\d{1,2}/\d{4}\) KWH:(?: UC \d+ :)? " + _NUMBER,
+        r"ENERGIA INJETADA\D{0,40}?" + _NUMBER,
+    ],
+    "credited_balance": [
+        r"ENERGIA COMPENSADA\D{0,40}?" + _NUMBER,
+        r"CREDITO(?:S)? UTILIZADO(?:S)?\D{0,40}?" + _NUMBER,
+        r"CREDITO RECEBIDO KWH:? " + _NUMBER,
+    ],
+}
+_COMPILED = {field: [re.compile(p) for p in patterns] for field, patterns in PATTERNS.items()}
+_MONTH_PATTERNS = [
+    re.compile(r"(?m)^(" + _MONTH_NAME + r")/(\d{4})"),
+    re.compile(r"(?:MES/ANO|MES DE REFERENCIA|REFERENCIA)\W{0,5}(\d{2})/(\d{4})"),
+    re.compile(r"(?:MES/ANO|MES DE REFERENCIA|REFERENCIA)\W{0,5}(" + _MONTH_NAME + r")\w*\W{0,3}(\d{4})"),
+]
+
+
+def parse_number(value: str) -> float:
+    """Número no formato brasileiro ('1.234,56', '150', '0,95') para float."""
+    if "," in value:
+        value = value.replace(".", "").replace(",", ".")
+    elif re.fullmatch(r"\d{1,3}(?:\.\d{3})+", value):
+        value = value.replace(".", "")
+    return float(value)
+
+
+def _normalize(text: str) -> str:
+    ascii_only = unicodedata.normalize("NFD", text).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[ \t]+", " ", ascii_only).upper()
+
+
+def parse_text(text: str) -> dict:
+    """Extrai os campos do texto da conta. Campos não encontrados ficam como None."""
+    text = _normalize(text)
+    result = {"month": None}
+    for pattern in _MONTH_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            month, year = match.groups()
+            month = _MONTHS.get(month[:3], month) if not month.isdigit() else int(month)
+            result["month"] = f"{year}-{int(month):02d}"
+            break
+    for field, patterns in _COMPILED.items():
+        result[field] = None
+        for pattern in patterns:
+            match = pattern.search(text)
+            if match:
+                raw = match.group(1)
+                result[field] = raw.rstrip(".-/") if field == "uc_number" else parse_number(raw)
+                break
+    return result
+
+
+def extract_text(path) -> str:
+    if PdfReader is None:
+        raise RuntimeError("Leitura de PDF indisponível: instale o pacote 'pypdf'")
+    reader = PdfReader(str(path))
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_file(cache_dir: Path, sha: str) -> Path:
+    return cache_dir / f"{sha}.v{PARSER_VERSION}.json"
+
+
+def _read_cache(cache_dir: Path, sha: str):
+    try:
+        return json.loads(_cache_file(cache_dir, sha).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(target: Path, data):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, target)
+
+
+def _write_cache(cache_dir: Path, sha: str, result: dict):
+    _write_json(_cache_file(cache_dir, sha), result)
+
+
+# --- Índice sha -> mês ---
+# Só acelera o lote: o cache por arquivo continua sendo a fonte. Um worker que não viu
+# a leitura feita por outro encontra o resultado no cache e o acrescenta ao próprio índice.
+_index_lock = threading.Lock()
+_indexes = {}
+
+
+def _index_file(cache_dir: Path) -> Path:
+    return cache_dir / f"index.v{PARSER_VERSION}.json"
+
+
+def _load_index(cache_dir: Path) -> dict:
+    with _index_lock:
+        if cache_dir not in _indexes:
+            try:
+                _indexes[cache_dir] = json.loads(_index_file(cache_dir).read_text())
+            except (OSError, ValueError):
+                _indexes[cache_dir] = {}
+        return _indexes[cache_dir]
+
+
+def _update_index(cache_dir: Path, results: list):
+    index = _load_index(cache_dir)
+    with _index_lock:
+        for result in results:
+            index[result["sha256"]] = (result.get("fields") or {}).get("month")
+        _write_json(_index_file(cache_dir), index)
+
+
+def _parse_file(path: str, sha: str) -> dict:
+    # Roda nos processos do pool: só recebe e devolve tipos simples
+    try:
+        fields = parse_text(extract_text(path))
+        missing = [k for k, v in fields.items() if v is None]
+        return {"sha256": sha, "fields": fields, "missing": missing, "error": None}
+    except Exception as e:
+        return {"sha256": sha, "fields": None, "missing": [], "error": f"{type(e).__name__}: {e}"}
+
+
+# Pool único por processo, criado no primeiro lote: o custo de subir os processos não
+# entra em cada requisição
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int = PARSE_WORKERS) -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers)
+        return _pool
+
+
+def _parse_in_pool(pending: list) -> list:
+    global _pool
+    try:
+        return list(_get_pool().map(_parse_file, [str(path) for path, _ in pending], [sha for _, sha in pending]))
+    except BrokenProcessPool:
+        # Um processo do pool morreu: o próximo lote cria outro; este segue no processo atual
+        with _pool_lock:
+            _pool = None
+        return [_parse_file(str(path), sha) for path, sha in pending]
+
+
+def _sha_from_name(path: Path):
+    # Arquivos do storage já são nomeados pelo próprio SHA-256
+    return path.stem if re.fullmatch(r"[0-9a-f]{64}", path.stem) else None
+
+
+def parse_pdf(path, cache_dir: Path = PARSE_CACHE_DIR, sha: str = None) -> dict:
+    path = Path(path)
+    sha = sha or _sha_from_name(path) or file_sha256(path)
+    cached = _read_cache(cache_dir, sha)
+    if cached is not None:
+        return dict(cached, file=path.name, cached=True)
+    result = _parse_file(str(path), sha)
+    _write_cache(cache_dir, sha, result)
+    _update_index(cache_dir, [result])
+    return dict(result, file=path.name, cached=False)
+
+
+def parse_many(paths, cache_dir: Path = PARSE_CACHE_DIR, workers: int = PARSE_WORKERS) -> list:
+    """
+    Processa vários PDFs: resultados em cache voltam direto, os demais são lidos em
+    paralelo no pool do módulo. A ordem de `paths` é preservada.
+    """
+    paths = [Path(p) for p in paths]
+    index = _load_index(cache_dir)
+    results = [None] * len(paths)
+    pending = []
+    unindexed = []
+    for i, path in enumerate(paths):
+        sha = _sha_from_name(path) or file_sha256(path)
+        cached = _read_cache(cache_dir, sha)
+        if cached is not None:
+            results[i] = dict(cached, file=path.name, cached=True)
+            if sha not in index:
+                unindexed.append(cached)
+        else:
+            pending.append((i, path, sha))
+
+    if len(pending) == 1 or (pending and workers == 1):
+        parsed = [_parse_file(str(path), sha) for _, path, sha in pending]
+    elif pending:
+        parsed = _parse_in_pool([(path, sha) for _, path, sha in pending])
+    else:
+        parsed = []
+
+    # Falhas também vão para o cache: o resultado só depende do conteúdo e do PARSER_VERSION
+    for (i, path, sha), result in zip(pending, parsed):
+        _write_cache(cache_dir, sha, result)
+        results[i] = dict(result, file=path.name, cached=False)
+    if parsed or unindexed:
+        _update_index(cache_dir, parsed + unindexed)
+    return results
+
+
+def parse_stored(directory: Path, month: str, names=None, cache_dir: Path = PARSE_CACHE_DIR,
+                 workers: int = PARSE_WORKERS) -> list:
+    """
+    Lote do faturamento sobre os PDFs armazenados em `directory`. Com `names`, só esses
+    arquivos. Sem, os ainda não lidos e, pelo índice, os já lidos do `month` ou sem mês
+    (falhas de leitura): resultados de outros meses nem são abertos.
+    """
+    if names is not None:
+        # Só o nome: os arquivos vêm sempre do diretório de uploads
+        paths = [directory / Path(name).name for name in names]
+        missing = [path for path in paths if not path.is_file()]
+        if missing:
+            raise FileNotFoundError(", ".join(path.name for path in missing))
+        return parse_many(paths, cache_dir=cache_dir, workers=workers)
+
+    index = _load_index(cache_dir)
+    paths = []
+    for path in sorted(directory.glob("*.pdf")):
+        sha = _sha_from_name(path)
+        if sha is not None and sha in index and index[sha] not in (month, None):
+            continue
+        paths.append(path)
+    return parse_many(paths, cache_dir=cache_dir, workers=workers)
@@ -0,0 +1,81 @@
+"""
+Valores de energia e dinheiro em ponto fixo.
+
+No banco cada coluna guarda um inteiro na menor unidade (Wh, centavos, ...). No Python ela
+aparece como Decimal na unidade da API (kWh, R$), então somas no banco (SUM, col = col + delta)
+e no crud são exatas e não acumulam erro de arredondamento como o Float fazia.
+
+Atenção ao escrever SQL à mão: a coluna crua está na menor unidade (kwh_generated = 1500 é
+1,5 kWh). Expressões que multiplicam duas dessas colunas precisam de reescala (ver a
+migração 4 em migrations.py).
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from sqlalchemy.types import BigInteger, TypeDecorator
+
+KWH_SCALE = 3 # Wh
+BRL_SCALE = 2 # centavos
+TARIFF_SCALE = 6 # R$/kWh com 6 casas
+PERCENT_SCALE = 4 # 12,3456%
+
+
+def quantize(value, scale: int) -> Decimal:
+    """Decimal com `scale` casas (arredondamento comercial). Floats entram pela repr decimal."""
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value)) if isinstance(value, float) else Decimal(value)
+    return value.quantize(Decimal(1).scaleb(-scale), rounding=ROUND_HALF_UP)
+
+
+def kwh(value) -> Decimal:
+    return quantize(value or 0, KWH_SCALE)
+
+
+def brl(value) -> Decimal:
+    return quantize(value or 0, BRL_SCALE)
+
+
+def percent(value) -> Decimal:
+    return quantize(value or 0, PERCENT_SCALE)
+
+
+def share(percentage, total_kwh) -> Decimal:
+    """Parte de `total_kwh` que cabe a um rateio de `percentage`%, em Wh inteiros."""
+    return kwh(percent(percentage) * kwh(total_kwh) / 100)
+
+
+class FixedPoint(TypeDecorator):
+    """Decimal com `scale` casas guardado como inteiro (valor * 10**scale)."""
+
+    impl = BigInteger
+    cache_ok = True
+
+    def __init__(self, scale: int):
+        super().__init__()
+        self.scale = scale
+
+    @property
+    def python_type(self):
+        return Decimal
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int(quantize(value, self.scale).scaleb(self.scale))
+
+    def process_literal_param(self, value, dialect):
+        return str(self.process_bind_param(value, dialect))
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        # Colunas antigas do SQLite (afinidade REAL) devolvem o inteiro como float
+        return Decimal(int(round(value))).scaleb(-self.scale)
+
+    def coerce_compared_value(self, op, value):
+        return self
+
+
+Energy = FixedPoint(KWH_SCALE)
+Money = FixedPoint(BRL_SCALE)
+Tariff = FixedPoint(TARIFF_SCALE)
+Percent = FixedPoint(PERCENT_SCALE)
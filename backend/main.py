@@ -1,25 +1,44 @@
-from fastapi import FastAPI, Depends, HTTPException, File, UploadFile
+from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from typing import List
+from typing import List, Literal, Optional, Union
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import base64
+import hashlib
 import os
-import shutil
-from pathlib import Path
+import json
+import secrets
 
-import crud, models, schemas
-from database import SessionLocal, engine
+import crud, models, schemas, pix, storage, equatorial, security, auth, migrations, metrics, profiling
+from cache import ResponseCache, StaleWhileRevalidateCache
+from database import SessionLocal, AsyncSessionLocal, async_engine, engine, get_pool_stats
+from fixedpoint import percent
 
 # Create tables logic with more robustness
 try:
-    models.Base.metadata.create_all(bind=engine)
+    # Tabelas novas (create_all) e migrações, serializadas entre os workers
+    migrations.run_migrations(engine)
+    with SessionLocal() as db:
+        crud.ensure_cache_versions(db)
     print("Database tables created/verified successfully.")
 except Exception as e:
     print(f"CRITICAL ERROR during table creation: {str(e)}")
 
 app = FastAPI(title="Solar Admin API")
 
+# Queries e tempo de banco por requisição (ver metrics.py) e log de queries lentas (profiling.py)
+metrics.instrument(engine)
+profiling.instrument(engine)
+if async_engine is not None:
+    metrics.instrument(async_engine.sync_engine)
+    profiling.instrument(async_engine.sync_engine)
+
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -40,7 +59,8 @@ def health_check(db: Session = Depends(get_db)):
             "status": "online",
             "database": "connected",
             "plants_found": plants_count,
-            "engine": str(engine.url.drivername)
+            "engine": str(engine.url.drivername),
+            "pool": get_pool_stats()
         }
     except Exception as e:
         return {
@@ -49,6 +69,30 @@ def health_check(db: Session = Depends(get_db)):
             "detail": str(e)
         }
 
+# --- Metrics ---
+# O Prometheus autentica com Basic auth (qualquer usuário, senha METRICS_PASSWORD); sem ela só operadores
+METRICS_PASSWORD = os.getenv("METRICS_PASSWORD")
+
+def require_metrics_access(request: Request):
+    scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+    if METRICS_PASSWORD and scheme.lower() == "basic":
+        try:
+            password = base64.b64decode(credentials).decode().partition(":")[2]
+        except (ValueError, UnicodeDecodeError):
+            password = ""
+        if secrets.compare_digest(password, METRICS_PASSWORD):
+            return
+    auth.require_admin(request)
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_access)])
+def read_metrics():
+    """Latência, queries e tempo de banco por rota no formato texto do Prometheus."""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+app.add_middleware(storage.UploadSizeLimitMiddleware)
+# Antes da autenticação na lista = roda dentro dela (precisa do principal)
+app.add_middleware(profiling.ProfilingMiddleware)
+app.add_middleware(auth.AuthenticationMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -59,57 +103,157 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Profile-Id"],
 )
+# Por último: mede a requisição inteira, inclusive autenticação e CORS
+app.add_middleware(metrics.MetricsMiddleware)
+
+# --- Pagination ---
+def paginated(response: Response, page):
+    """Desempacota (linhas, proximo_cursor) e expõe o cursor no header X-Next-Cursor."""
+    rows, next_cursor = page
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+def json_array_stream(items):
+    """Serializa um iterável como array JSON, um item por vez."""
+    yield "["
+    for i, item in enumerate(items):
+        yield ("," if i else "") + json.dumps(jsonable_encoder(item), ensure_ascii=False)
+    yield "]"
+
+def fetch_page(fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# --- Read path ---
+def _read_sync(fn):
+    with SessionLocal() as db:
+        return fn(db)
+
+async def read_db(fn):
+    """
+    Executa uma leitura `fn(db)` com as funções síncronas do crud. Com DB_ASYNC ligado roda
+    numa AsyncSession: o I/O do banco é aguardado no event loop e a concorrência fica limitada
+    pelas conexões do pool, não pelas threads. Sem DB_ASYNC usa o threadpool como antes.
+    `fn` deve devolver objetos já serializados (schemas), nada que dispare lazy load depois.
+    """
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            return await session.run_sync(fn)
+    return await run_in_threadpool(_read_sync, fn)
+
+# --- Response cache (ETag) ---
+# Tabelas de que cada resposta depende; qualquer commit que as escreva muda a ETag
+PLANT_TABLES = ("generation_plants", "production", "plant_distributions")
+CLIENT_TABLES = ("clients", "invoices", "plant_distributions", "credit_adjustments")
+STATEMENT_TABLES = ("clients", "generation_plants", "production_allocations", "invoices", "credit_adjustments")
+DASHBOARD_TABLES = ("clients", "monthly_rollups")
+
+response_cache = ResponseCache(max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512")))
+
+async def cache_validators(request: Request, tables):
+    """
+    ETag/Last-Modified da requisição a partir das versões das tabelas (uma query pela chave
+    primária). Retorna (etag, headers, not_modified).
+    """
+    versions = await read_db(lambda db: crud.get_cache_versions(db, tables))
+    fingerprint = repr((request.url.path, sorted(request.query_params.multi_items()),
+                        sorted((table, version) for table, (version, _) in versions.items())))
+    etag = f'W/"{hashlib.sha1(fingerprint.encode()).hexdigest()[:24]}"'
+    last_modified = max((updated_at for _, updated_at in versions.values() if updated_at), default=None)
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified:
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        not_modified = "*" in tags or etag in tags or etag[2:] in tags
+    elif request.headers.get("if-modified-since") and last_modified:
+        try:
+            since = parsedate_to_datetime(request.headers["if-modified-since"])
+            not_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+        except (TypeError, ValueError):
+            not_modified = False
+    else:
+        not_modified = False
+    return etag, headers, not_modified
+
+async def cached_read(request: Request, tables, load):
+    """
+    Resposta JSON com ETag: 304 se o cliente já tem a versão atual; senão devolve o corpo
+    em cache deste worker ou chama `await load(sub_response, etag)` e guarda o resultado.
+    """
+    etag, headers, not_modified = await cache_validators(request, tables)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+
+    key = (request.url.path, request.url.query)
+    cached = response_cache.get(key, etag)
+    if cached is None:
+        sub_response = Response()
+        data = await load(sub_response, etag)
+        body = json.dumps(jsonable_encoder(data), ensure_ascii=False).encode("utf-8")
+        cursor = sub_response.headers.get("X-Next-Cursor")
+        cached = (body, {"X-Next-Cursor": cursor} if cursor else {})
+        response_cache.put(key, etag, cached)
+    body, extra_headers = cached
+    return Response(content=body, media_type="application/json", headers={**headers, **extra_headers})
 
 # Create uploads directory if it doesn't exist
-UPLOADS_DIR = Path("uploads/equatorial_invoices")
-UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+storage.UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
 
 # Mount static files for serving uploaded PDFs
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
 # --- Authentication ---
-@app.post("/login", response_model=schemas.LoginResponse)
-def login(request: schemas.LoginRequest, db: Session = Depends(get_db)):
+def _find_login_user(db: Session, request: schemas.LoginRequest):
     if request.user_type == "admin":
-        user = crud.get_operator_by_email(db, request.identifier)
-        if not user:
-            raise HTTPException(status_code=401, detail="Credenciais incorretas")
-        
-        if not crud.verify_password(request.password, user.hashed_password):
-            raise HTTPException(status_code=401, detail="Senha incorreta")
-        
-        return {
-            "success": True, 
-            "message": "Login realizado com sucesso", 
-            "user_id": user.id, 
-            "name": user.full_name,
-            "user_type": "admin"
-        }
-    else:
-        # Client login
-        # Clients might login by Email or UC Number
-        user = crud.get_client_by_email(db, request.identifier)
-        if not user:
-            user = crud.get_client_by_uc(db, request.identifier)
-            
-        if not user:
-            raise HTTPException(status_code=401, detail="Credenciais incorretas")
-        
-        # Assuming clients have plain text passwords for now (Legacy)
-        if user.password != request.password:
-             raise HTTPException(status_code=401, detail="Senha incorreta")
-             
-        return {
-            "success": True, 
-            "message": "Login realizado com sucesso", 
-            "user_id": user.id, 
-            "name": user.name,
-            "user_type": "client"
-        }
+        return crud.get_operator_by_email(db, request.identifier)
+    # Clients might login by Email or UC Number
+    return crud.get_client_by_email(db, request.identifier) or crud.get_client_by_uc(db, request.identifier)
+
+@app.post("/login", response_model=schemas.LoginResponse)
+async def login(request: schemas.LoginRequest, db: Session = Depends(get_db)):
+    # Async: as consultas vão ao threadpool e o bcrypt ao executor dedicado (security.py),
+    # então uma rajada de logins não ocupa as threads dos demais endpoints
+    user_type = "admin" if request.user_type == "admin" else "client"
+    user = await run_in_threadpool(_find_login_user, db, request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Credenciais incorretas")
+
+    stored = user.hashed_password if user_type == "admin" else user.password
+    try:
+        ok, new_hash = await security.check_password_async(request.password, stored)
+    except security.PasswordVerifierBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    if not ok:
+        raise HTTPException(status_code=401, detail="Senha incorreta")
+    if new_hash:
+        # Custo do bcrypt mudou ou senha de cliente ainda em texto puro (legado)
+        await run_in_threadpool(crud.store_password_hash, db, user_type, user.id, new_hash)
+
+    return {
+        "success": True, 
+        "message": "Login realizado com sucesso", 
+        "user_id": user.id, 
+        "name": user.full_name if user_type == "admin" else user.name,
+        "user_type": user_type,
+        **auth.create_access_token(user.id, user_type)
+    }
+
+@app.post("/logout")
+def logout(principal: auth.Principal = Depends(auth.require_principal)):
+    auth.denylist.revoke_token(principal.jti, principal.expires_at)
+    return {"detail": "Logged out"}
 
 # --- Generation Plants ---
-@app.post("/plants/", response_model=schemas.GenerationPlant)
+@app.post("/plants/", response_model=schemas.GenerationPlantPlain, dependencies=[Depends(auth.require_admin)])
 def create_plant(plant: schemas.GenerationPlantCreate, db: Session = Depends(get_db)):
     try:
         return crud.create_generation_plant(db=db, plant=plant)
@@ -120,11 +264,27 @@ def create_plant(plant: schemas.GenerationPlantCreate, db: Session = Depends(get
             detail=f"Erro interno ao criar usina: {str(e)}"
         )
 
-@app.get("/plants/", response_model=List[schemas.GenerationPlant])
-def read_plants(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_generation_plants(db, skip=skip, limit=limit)
-
-@app.patch("/plants/{plant_id}", response_model=schemas.GenerationPlant)
+@app.get("/plants/", response_model=Union[List[schemas.GenerationPlantSummary], List[schemas.GenerationPlant]], dependencies=[Depends(auth.require_admin)])
+async def read_plants(
+    request: Request,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    view: Literal["summary", "full"] = "summary",
+    months: int = Query(12, ge=0, le=120),
+    is_active: Optional[bool] = None
+):
+    def load(db, response):
+        plants = paginated(response, fetch_page(
+            crud.get_generation_plants, db, skip=skip, limit=limit, cursor=cursor,
+            view=view, recent_months=months, is_active=is_active
+        ))
+        if view == "summary":
+            return [schemas.GenerationPlantSummary(**row) for row in plants]
+        return [schemas.GenerationPlant.model_validate(p) for p in plants]
+    return await cached_read(request, PLANT_TABLES, lambda response, etag: read_db(lambda db: load(db, response)))
+
+@app.patch("/plants/{plant_id}", response_model=schemas.GenerationPlantPlain, dependencies=[Depends(auth.require_admin)])
 def update_plant(plant_id: int, plant: schemas.GenerationPlantUpdate, db: Session = Depends(get_db)):
     db_plant = crud.update_generation_plant(db, plant_id=plant_id, plant_update=plant)
     if db_plant is None:
@@ -132,46 +292,74 @@ def update_plant(plant_id: int, plant: schemas.GenerationPlantUpdate, db: Sessio
     return db_plant
 
 # --- Plant Distributions ---
-@app.post("/plants/{plant_id}/distributions/", response_model=List[schemas.PlantDistributionPlain])
+@app.post("/plants/{plant_id}/distributions/", response_model=List[schemas.PlantDistributionPlain], dependencies=[Depends(auth.require_admin)])
 def set_plant_distributions(
     plant_id: int, 
     distributions: List[schemas.PlantDistributionCreate], 
+    effective_from: Optional[str] = Query(None, pattern=r"^\d{4}-(0[1-9]|1[0-2])$"),
     db: Session = Depends(get_db)
 ):
-    # Clear existing
-    crud.delete_plant_distributions(db, plant_id)
-    # Add new
-    new_dists = []
-    total_percentage = 0
-    for dist in distributions:
-        total_percentage += dist.percentage
-        if total_percentage > 100.1: # Small margin for float precision
-            raise HTTPException(status_code=400, detail="Total percentage cannot exceed 100%")
-        new_dists.append(crud.create_plant_distribution(db, dist))
-    return new_dists
-
-@app.get("/plants/{plant_id}/distributions/", response_model=List[schemas.PlantDistributionPlain])
-def read_plant_distributions(plant_id: int, db: Session = Depends(get_db)):
-    return crud.get_plant_distributions(db, plant_id)
-
-@app.post("/plants/{plant_id}/production/", response_model=schemas.Production)
+    """
+    Novo rateio da usina a partir de `effective_from` (padrão: mês seguinte à última produção
+    lançada; sem produções, desde sempre). Produções já lançadas continuam com o rateio com que
+    foram creditadas.
+    """
+    if sum(percent(dist.percentage) for dist in distributions) > 100: # Soma exata: percentuais em ponto fixo
+        raise HTTPException(status_code=400, detail="Total percentage cannot exceed 100%")
+    return crud.set_plant_distributions(db, plant_id, distributions, effective_from=effective_from)
+
+@app.get("/plants/{plant_id}/distributions/", response_model=List[schemas.PlantDistributionPlain], dependencies=[Depends(auth.require_admin)])
+def read_plant_distributions(
+    plant_id: int,
+    month: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    db: Session = Depends(get_db)
+):
+    """Rateio vigente, ou o que valia para a produção de `month`."""
+    return crud.get_plant_distributions(db, plant_id, month=month)
+
+@app.post("/plants/{plant_id}/production/", response_model=schemas.Production, dependencies=[Depends(auth.require_admin)])
 def create_production_for_plant(
     plant_id: int, production: schemas.ProductionCreate, db: Session = Depends(get_db)
 ):
     return crud.create_plant_production(db=db, production=production, plant_id=plant_id)
 
-@app.get("/plants/{plant_id}/productions/", response_model=List[schemas.Production])
-def read_plant_productions(plant_id: int, db: Session = Depends(get_db)):
-    return crud.get_plant_productions(db, plant_id)
+@app.get("/plants/{plant_id}/productions/", response_model=List[schemas.ProductionPlain], dependencies=[Depends(auth.require_admin)])
+def read_plant_productions(
+    plant_id: int,
+    skip: int = 0,
+    limit: int = Query(120, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    return crud.get_plant_productions(db, plant_id, skip=skip, limit=limit)
+
+@app.post("/productions/import", response_model=schemas.ProductionImportReport, dependencies=[Depends(auth.require_admin)])
+def import_productions(
+    rows: List[schemas.ProductionImportRow],
+    dry_run: bool = False,
+    db: Session = Depends(get_db)
+):
+    return crud.import_productions(db, [row.dict() for row in rows], dry_run=dry_run)
+
+@app.post("/productions/import/csv", response_model=schemas.ProductionImportReport, dependencies=[Depends(auth.require_admin)])
+def import_productions_csv(
+    file: UploadFile = File(...),
+    dry_run: bool = False,
+    db: Session = Depends(get_db)
+):
+    try:
+        content = file.file.read().decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="O arquivo CSV deve estar em UTF-8")
+    return crud.import_productions(db, crud.parse_production_csv(content), dry_run=dry_run)
 
-@app.patch("/productions/{production_id}", response_model=schemas.Production)
+@app.patch("/productions/{production_id}", response_model=schemas.Production, dependencies=[Depends(auth.require_admin)])
 def update_production(production_id: int, production: schemas.ProductionUpdate, db: Session = Depends(get_db)):
     db_production = crud.update_plant_production(db, production_id=production_id, production_update=production)
     if db_production is None:
         raise HTTPException(status_code=404, detail="Production not found")
     return db_production
 
-@app.delete("/productions/{production_id}")
+@app.delete("/productions/{production_id}", dependencies=[Depends(auth.require_admin)])
 def delete_production(production_id: int, db: Session = Depends(get_db)):
     success = crud.delete_plant_production(db, production_id=production_id)
     if not success:
@@ -179,39 +367,73 @@ def delete_production(production_id: int, db: Session = Depends(get_db)):
     return {"detail": "Production deleted"}
 
 # --- Clients ---
-@app.post("/clients/", response_model=schemas.Client)
+@app.post("/clients/", response_model=schemas.Client, dependencies=[Depends(auth.require_admin)])
 def create_client(client: schemas.ClientCreate, db: Session = Depends(get_db)):
     db_client = crud.get_client_by_uc(db, uc_number=client.uc_number)
     if db_client:
         raise HTTPException(status_code=400, detail="Client with this UC already registered")
     return crud.create_client(db=db, client=client)
 
-@app.get("/clients/", response_model=List[schemas.Client])
-def read_clients(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_clients(db, skip=skip, limit=limit)
-
-@app.get("/clients/{uc_number}", response_model=schemas.Client)
-def read_client(uc_number: str, db: Session = Depends(get_db)):
-    db_client = crud.get_client_by_uc(db, uc_number=uc_number)
-    if db_client is None:
-        raise HTTPException(status_code=404, detail="Client not found")
-    return db_client
-
-@app.get("/clients/id/{client_id}", response_model=schemas.Client)
-def read_client_by_id(client_id: int, db: Session = Depends(get_db)):
-    db_client = crud.get_client(db, client_id=client_id)
-    if db_client is None:
+@app.get("/clients/", response_model=Union[List[schemas.Client], List[schemas.ClientPlain]], dependencies=[Depends(auth.require_admin)])
+async def read_clients(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=5000),
+    cursor: Optional[str] = None,
+    view: Literal["summary", "full"] = "full",
+    is_active: Optional[bool] = None,
+    plant_id: Optional[int] = None
+):
+    def load(db):
+        clients = paginated(response, fetch_page(
+            crud.get_clients, db, skip=skip, limit=limit, cursor=cursor,
+            view=view, is_active=is_active, plant_id=plant_id
+        ))
+        if view == "summary":
+            # Serializa apenas as colunas da tabela, sem tocar nos relacionamentos (evita lazy loads)
+            return [schemas.ClientPlain.model_validate(c) for c in clients]
+        return [schemas.Client.model_validate(c) for c in clients]
+    return await read_db(load)
+
+def require_client_access_by_uc(uc_number: str, request: Request):
+    """`auth.require_client_access` para rotas pela UC: o cliente só vê a própria."""
+    principal = auth.require_principal(request)
+    if principal.is_admin:
+        return principal
+    with SessionLocal() as db:
+        db_client = crud.get_client_by_uc(db, uc_number=uc_number)
+    # Cliente de outra UC (ou UC inexistente) recebe 403: não revela quais UCs existem
+    return auth.check_client_access(principal, db_client.id if db_client else None)
+
+@app.get("/clients/{uc_number}", response_model=schemas.Client, dependencies=[Depends(require_client_access_by_uc)])
+async def read_client(uc_number: str, request: Request):
+    def load(db):
+        db_client = crud.get_client_by_uc(db, uc_number=uc_number)
+        if db_client is None:
+            raise HTTPException(status_code=404, detail="Client not found")
+        return schemas.Client.model_validate(db_client)
+    return await cached_read(request, CLIENT_TABLES, lambda response, etag: read_db(load))
+
+@app.get("/clients/id/{client_id}", response_model=schemas.Client, dependencies=[Depends(auth.require_client_access)])
+async def read_client_by_id(client_id: int):
+    def load(db):
+        db_client = crud.get_client(db, client_id=client_id)
+        return schemas.Client.model_validate(db_client) if db_client else None
+    client = await read_db(load)
+    if client is None:
         raise HTTPException(status_code=404, detail="Client not found")
-    return db_client
+    return client
 
-@app.patch("/clients/{client_id}", response_model=schemas.Client)
+@app.patch("/clients/{client_id}", response_model=schemas.Client, dependencies=[Depends(auth.require_admin)])
 def update_client(client_id: int, client_update: schemas.ClientUpdate, db: Session = Depends(get_db)):
     db_client = crud.update_client(db, client_id=client_id, client_update=client_update)
     if db_client is None:
         raise HTTPException(status_code=404, detail="Client not found")
+    if client_update.password or client_update.is_active is False:
+        auth.denylist.revoke_user("client", client_id)
     return db_client
 
-@app.patch("/clients/profile/{client_id}", response_model=schemas.Client)
+@app.patch("/clients/profile/{client_id}", response_model=schemas.Client, dependencies=[Depends(auth.require_client_access)])
 def update_client_profile(client_id: int, client_update: schemas.ClientUpdate, db: Session = Depends(get_db)):
     # Restrict fields for client-initiated profile update
     restricted_fields = ["payment_day", "kwh_value_original", "negotiated_discount", "uc_number", "is_active"]
@@ -227,27 +449,77 @@ def update_client_profile(client_id: int, client_update: schemas.ClientUpdate, d
     db_client = crud.update_client(db, client_id=client_id, client_update=filtered_update)
     if db_client is None:
         raise HTTPException(status_code=404, detail="Client not found")
+    if filtered_update.password:
+        auth.denylist.revoke_user("client", client_id)
     return db_client
 
-@app.get("/clients/{client_id}/statement")
-def read_client_statement(client_id: int, db: Session = Depends(get_db)):
-    return crud.get_client_statement(db, client_id=client_id)
+@app.get("/clients/{client_id}/statement", response_model=List[schemas.CreditStatementEntry], dependencies=[Depends(auth.require_client_access)])
+async def read_client_statement(
+    client_id: int,
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None
+):
+    """
+    Extrato com saldo acumulado, mais recente primeiro. Com `limit` devolve uma página (cursor
+    no header X-Next-Cursor); sem `limit` o historico completo é enviado em streaming.
+    """
+    if limit is not None:
+        return await cached_read(request, STATEMENT_TABLES, lambda response, etag: read_db(lambda db: paginated(response, fetch_page(
+            crud.get_client_statement, db, client_id=client_id, limit=limit, cursor=cursor
+        ))))
+
+    if cursor:
+        fetch_page(crud.decode_cursor, cursor)
+    etag, headers, not_modified = await cache_validators(request, STATEMENT_TABLES)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+
+    def entries():
+        # Sessão própria: o corpo é gerado depois que o endpoint retorna
+        with SessionLocal() as stream_db:
+            yield from crud.iter_client_statement(stream_db, client_id=client_id, cursor=cursor)
+
+    return StreamingResponse(json_array_stream(entries()), media_type="application/json", headers=headers)
+
+@app.get("/clients/{client_id}/ledger", response_model=List[schemas.CreditMovementPlain], dependencies=[Depends(auth.require_client_access)])
+async def read_client_ledger(
+    client_id: int,
+    month_from: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    month_to: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$")
+):
+    return await read_db(lambda db: [
+        schemas.CreditMovementPlain.model_validate(m)
+        for m in crud.get_client_ledger(db, client_id=client_id, month_from=month_from, month_to=month_to)
+    ])
+
+@app.get("/clients/{client_id}/balance", response_model=schemas.CreditBalance, dependencies=[Depends(auth.require_client_access)])
+async def read_client_balance(
+    client_id: int,
+    month: str = Query(..., pattern=r"^\d{4}-\d{2}$")
+):
+    def load(db):
+        if crud.get_client(db, client_id=client_id) is None:
+            raise HTTPException(status_code=404, detail="Client not found")
+        return crud.get_client_balance(db, client_id=client_id, month=month)
+    return await read_db(load)
 
-@app.delete("/clients/{client_id}")
+@app.delete("/clients/{client_id}", dependencies=[Depends(auth.require_admin)])
 def delete_client(client_id: int, db: Session = Depends(get_db)):
     success = crud.delete_client(db, client_id=client_id)
     if not success:
         raise HTTPException(status_code=404, detail="Client not found")
+    auth.denylist.revoke_user("client", client_id)
     return {"detail": "Client deleted"}
 
-@app.post("/clients/{client_id}/credits/", response_model=schemas.Client)
+@app.post("/clients/{client_id}/credits/", response_model=schemas.Client, dependencies=[Depends(auth.require_admin)])
 def add_client_credits(client_id: int, credit_update: schemas.CreditUpdate, db: Session = Depends(get_db)):
     db_client = crud.update_client_credits(db, client_id=client_id, credits_to_add=credit_update.credits_to_add)
     if db_client is None:
         raise HTTPException(status_code=404, detail="Client not found")
     return db_client
 
-@app.post("/clients/{client_id}/adjust-credits/", response_model=schemas.Client)
+@app.post("/clients/{client_id}/adjust-credits/", response_model=schemas.Client, dependencies=[Depends(auth.require_admin)])
 def create_credit_adjustment(client_id: int, adjustment: schemas.CreditAdjustmentCreate, db: Session = Depends(get_db)):
     db_client = crud.create_credit_adjustment(db, client_id=client_id, adjustment=adjustment)
     if not db_client:
@@ -255,30 +527,55 @@ def create_credit_adjustment(client_id: int, adjustment: schemas.CreditAdjustmen
     return db_client
 
 # --- Invoices ---
-@app.post("/invoices/", response_model=schemas.Invoice)
+@app.post("/invoices/", response_model=schemas.Invoice, dependencies=[Depends(auth.require_admin)])
 def create_invoice(invoice: schemas.InvoiceCreate, db: Session = Depends(get_db)):
     return crud.create_invoice(db=db, invoice=invoice)
 
-@app.get("/invoices/", response_model=List[schemas.Invoice])
-def read_invoices(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_invoices(db, skip=skip, limit=limit)
+@app.get("/invoices/", response_model=List[schemas.Invoice], dependencies=[Depends(auth.require_admin)])
+async def read_invoices(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    month_from: Optional[str] = None,
+    month_to: Optional[str] = None,
+    status: Optional[str] = None,
+    status_pago: Optional[bool] = None,
+    client_id: Optional[int] = None,
+    plant_id: Optional[int] = None
+):
+    return await read_db(lambda db: [schemas.Invoice.model_validate(i) for i in paginated(response, fetch_page(
+        crud.get_invoices, db, skip=skip, limit=limit, cursor=cursor,
+        month_from=month_from, month_to=month_to, status=status,
+        status_pago=status_pago, client_id=client_id, plant_id=plant_id
+    ))])
 
-@app.patch("/invoices/{invoice_id}", response_model=schemas.Invoice)
+@app.patch("/invoices/{invoice_id}", response_model=schemas.Invoice, dependencies=[Depends(auth.require_admin)])
 def update_invoice(invoice_id: int, invoice: schemas.InvoiceUpdate, db: Session = Depends(get_db)):
     db_invoice = crud.update_invoice(db, invoice_id=invoice_id, invoice_update=invoice)
     if db_invoice is None:
         raise HTTPException(status_code=404, detail="Invoice not found")
     return db_invoice
 
-@app.delete("/invoices/{invoice_id}")
+@app.delete("/invoices/{invoice_id}", dependencies=[Depends(auth.require_admin)])
 def delete_invoice(invoice_id: int, db: Session = Depends(get_db)):
     success = crud.delete_invoice(db, invoice_id=invoice_id)
     if not success:
         raise HTTPException(status_code=404, detail="Invoice not found")
     return {"detail": "Invoice deleted"}
 
+@app.get("/invoices/pix", response_model=List[schemas.InvoicePix], dependencies=[Depends(auth.require_admin)])
+def read_month_pix(month: str = Query(..., pattern=r"^\d{4}-\d{2}$"), qr: bool = False, db: Session = Depends(get_db)):
+    if qr and not pix.qr_available():
+        raise HTTPException(status_code=501, detail="Geração de QR Code indisponível: instale o pacote 'qrcode[pil]'")
+    return crud.get_month_pix_payloads(db, month=month, include_qr=qr)
+
 @app.get("/invoices/{invoice_id}/pix")
-def read_invoice_pix(invoice_id: int, db: Session = Depends(get_db)):
+def read_invoice_pix(invoice_id: int, principal: auth.Principal = Depends(auth.require_principal), db: Session = Depends(get_db)):
+    # O portal do cliente gera o PIX das próprias faturas
+    if not principal.is_admin:
+        owner = db.query(models.Invoice.client_id).filter(models.Invoice.id == invoice_id).scalar()
+        auth.check_client_access(principal, owner)
     pix_data = crud.get_invoice_pix_payload(db, invoice_id=invoice_id)
     if pix_data is None:
         raise HTTPException(status_code=404, detail="Invoice not found")
@@ -286,44 +583,104 @@ def read_invoice_pix(invoice_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail=pix_data["error"])
     return pix_data
 
-@app.post("/invoices/{invoice_id}/upload-equatorial")
-async def upload_equatorial_invoice(
+@app.post("/invoices/{invoice_id}/upload-equatorial", dependencies=[Depends(auth.require_admin)])
+def upload_equatorial_invoice(
     invoice_id: int,
     file: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
     """Upload Equatorial invoice PDF for a specific invoice"""
-    # Verify invoice exists
+    # Síncrono de propósito: roda no threadpool, sem bloquear o event loop com I/O de disco
     invoice = db.query(models.Invoice).filter(models.Invoice.id == invoice_id).first()
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
     
     # Validate file type
-    if not file.filename.endswith('.pdf'):
+    if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
-    # Create unique filename
-    file_extension = ".pdf"
-    unique_filename = f"invoice_{invoice_id}_{file.filename}"
-    file_path = UPLOADS_DIR / unique_filename
-    
-    # Save file
+    # Save file (em blocos, nomeado pelo SHA-256 do conteúdo)
     try:
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        sha256, size, target = storage.store_stream(file.file)
+    except storage.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
     
     # Update invoice with file path
-    relative_path = f"/uploads/equatorial_invoices/{unique_filename}"
+    relative_path = storage.public_path(target)
     invoice.equatorial_invoice_path = relative_path
     db.commit()
-    db.refresh(invoice)
     
-    return {"detail": "File uploaded successfully", "path": relative_path}
+    return {"detail": "File uploaded successfully", "path": relative_path, "sha256": sha256, "size": size}
+
+# --- Equatorial PDFs ---
+def _require_pdf_parser():
+    if equatorial.PdfReader is None:
+        raise HTTPException(status_code=501, detail="Leitura de PDF indisponível: instale o pacote 'pypdf'")
+
+@app.post("/equatorial/parse", response_model=schemas.EquatorialParseResult, dependencies=[Depends(auth.require_admin)])
+def parse_equatorial_invoice(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    """Armazena o PDF e devolve os campos lidos para pré-preencher a fatura."""
+    _require_pdf_parser()
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    try:
+        sha256, _, target = storage.store_stream(file.file)
+    except storage.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    result = equatorial.parse_pdf(target, sha=sha256)
+    result["path"] = storage.public_path(target)
+    crud.match_equatorial_bills(db, [result], month=None)
+    return result
+
+@app.post("/equatorial/batch", response_model=schemas.EquatorialBatchReport, dependencies=[Depends(auth.require_admin)])
+def import_equatorial_batch(
+    month: str = Query(..., pattern=r"^\d{4}-\d{2}$"),
+    files: Optional[List[str]] = Query(None),
+    create: bool = False,
+    default_fixed_cost: float = 10.0,
+    db: Session = Depends(get_db)
+):
+    """
+    Lê os PDFs armazenados citados em `files` ou, sem eles, os ainda não lidos mais os já
+    lidos do mês (cache por hash, pool de processos), e passa as leituras do mês ao
+    faturamento. Sem create=true é só uma prévia.
+    """
+    _require_pdf_parser()
+    try:
+        results = equatorial.parse_stored(storage.UPLOADS_DIR, month, names=files)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"Arquivo não encontrado: {e}")
+    for result in results:
+        result["path"] = storage.public_path(storage.UPLOADS_DIR / result["file"])
+    readings = crud.match_equatorial_bills(db, results, month=month)
+    billing = crud.run_billing(
+        db, schemas.BillingRunRequest(month=month, readings=readings, default_fixed_cost=default_fixed_cost),
+        dry_run=not create,
+    )
+    files = [r for r in results if (r.get("fields") or {}).get("month") == month or r.get("error")]
+    return {"month": month, "files": files, "billing": billing}
+
+# --- Billing Run ---
+@app.post("/billing/runs", response_model=schemas.BillingRunReport, dependencies=[Depends(auth.require_admin)])
+def run_billing(request: schemas.BillingRunRequest, dry_run: bool = False, db: Session = Depends(get_db)):
+    try:
+        return crud.run_billing(db, request, dry_run=dry_run)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # --- Operators ---
-@app.post("/operators/", response_model=schemas.OperatorPlain)
+def require_admin_or_bootstrap(request: Request, db: Session = Depends(get_db)):
+    # Sem nenhum operador cadastrado, o primeiro pode ser criado sem login
+    principal = auth.get_principal(request)
+    if principal is not None and principal.is_admin:
+        return principal
+    if db.query(models.Operator.id).first() is None:
+        return None
+    return auth.require_admin(request)
+
+@app.post("/operators/", response_model=schemas.OperatorPlain, dependencies=[Depends(require_admin_or_bootstrap)])
 def create_operator(operator: schemas.OperatorCreate, db: Session = Depends(get_db)):
     try:
         # Check if email already exists
@@ -342,32 +699,95 @@ def create_operator(operator: schemas.OperatorCreate, db: Session = Depends(get_
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-@app.get("/operators/", response_model=List[schemas.OperatorPlain])
-def read_operators(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_operators(db, skip=skip, limit=limit)
+@app.get("/operators/", response_model=List[schemas.OperatorPlain], dependencies=[Depends(auth.require_admin)])
+async def read_operators(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    is_active: Optional[bool] = None
+):
+    return await read_db(lambda db: [schemas.OperatorPlain.model_validate(o) for o in paginated(response, fetch_page(
+        crud.get_operators, db, skip=skip, limit=limit, cursor=cursor, is_active=is_active
+    ))])
 
-@app.get("/operators/{operator_id}", response_model=schemas.OperatorPlain)
+@app.get("/operators/{operator_id}", response_model=schemas.OperatorPlain, dependencies=[Depends(auth.require_admin)])
 def read_operator(operator_id: int, db: Session = Depends(get_db)):
     operator = crud.get_operator_by_id(db, operator_id)
     if not operator:
         raise HTTPException(status_code=404, detail="Operator not found")
     return operator
 
-@app.patch("/operators/{operator_id}", response_model=schemas.OperatorPlain)
+@app.patch("/operators/{operator_id}", response_model=schemas.OperatorPlain, dependencies=[Depends(auth.require_admin)])
 def update_operator(operator_id: int, operator_update: schemas.OperatorUpdate, db: Session = Depends(get_db)):
     operator = crud.update_operator(db, operator_id, operator_update)
     if not operator:
         raise HTTPException(status_code=404, detail="Operator not found")
+    if operator_update.password or operator_update.is_active is False:
+        auth.denylist.revoke_user("admin", operator_id)
     return operator
 
-@app.delete("/operators/{operator_id}")
+@app.delete("/operators/{operator_id}", dependencies=[Depends(auth.require_admin)])
 def delete_operator(operator_id: int, db: Session = Depends(get_db)):
     success = crud.delete_operator(db, operator_id)
     if not success:
         raise HTTPException(status_code=404, detail="Operator not found")
+    auth.denylist.revoke_user("admin", operator_id)
     return {"detail": "Operator deleted"}
 
 # --- Dashboard ---
-@app.get("/admin/dashboard", response_model=schemas.DashboardMetrics)
-def read_dashboard_metrics(db: Session = Depends(get_db)):
-    return crud.get_dashboard_metrics(db)
+dashboard_cache = StaleWhileRevalidateCache(
+    ttl=float(os.getenv("DASHBOARD_CACHE_TTL", "15")),
+    stale_ttl=float(os.getenv("DASHBOARD_CACHE_STALE_TTL", "300")),
+)
+
+def _compute_dashboard_metrics(month: Optional[str]):
+    # Sessão própria: pode rodar em background durante a revalidação
+    with SessionLocal() as db:
+        return schemas.DashboardMetrics.model_validate(crud.get_dashboard_metrics(db, month=month))
+
+@app.get("/admin/dashboard", response_model=schemas.DashboardMetrics, dependencies=[Depends(auth.require_admin)])
+async def read_dashboard_metrics(request: Request, month: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$")):
+    # A ETag entra na chave: uma escrita gera outra chave e o valor antigo deixa de ser usado
+    return await cached_read(request, DASHBOARD_TABLES, lambda response, etag: run_in_threadpool(
+        dashboard_cache.get, ("dashboard", month, etag), lambda: _compute_dashboard_metrics(month)
+    ))
+
+@app.post("/admin/credits/snapshots", dependencies=[Depends(auth.require_admin)])
+def create_credit_snapshots(month: str = Query(..., pattern=r"^\d{4}-\d{2}$"), db: Session = Depends(get_db)):
+    clients = crud.create_credit_snapshots(db, month=month)
+    return {"detail": "Snapshots created", "month": month, "clients": clients}
+
+@app.post("/admin/credits/reconcile", response_model=schemas.BalanceReconciliationReport, dependencies=[Depends(auth.require_admin)])
+def reconcile_balances(incremental: bool = False, fix: bool = False, db: Session = Depends(get_db)):
+    """
+    Confere os saldos de créditos contra o histórico e lista os clientes divergentes. Sem
+    fix=true é só um relatório; incremental=true confere só os clientes com movimentos desde
+    a última correção.
+    """
+    return crud.reconcile_balances(db, incremental=incremental, fix=fix)
+
+@app.get("/admin/profiles", dependencies=[Depends(auth.require_admin)])
+def list_profiles(limit: int = Query(50, ge=1, le=500)):
+    """Perfis gravados com X-Profile: 1, do mais recente ao mais antigo."""
+    return profiling.list_profiles(limit=limit)
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(auth.require_admin)])
+def read_profile(profile_id: str):
+    """Pilhas dobradas (abre no speedscope ou no flamegraph.pl)."""
+    target = profiling.profile_path(profile_id)
+    if target is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return Response(content=target.read_text(encoding="utf-8"), media_type="text/plain; charset=utf-8",
+                    headers={"Content-Disposition": f'inline; filename="{profile_id}.folded"'})
+
+@app.get("/admin/slow-queries", dependencies=[Depends(auth.require_admin)])
+def list_slow_queries(limit: int = Query(100, ge=1, le=1000)):
+    """Últimas queries acima de SLOW_QUERY_MS deste processo, com a rota e o plano."""
+    return list(reversed(profiling.slow_queries))[:limit]
+
+@app.post("/admin/rollups/rebuild", dependencies=[Depends(auth.require_admin)])
+def rebuild_monthly_rollups(db: Session = Depends(get_db)):
+    months = crud.rebuild_monthly_rollups(db)
+    dashboard_cache.invalidate()
+    return {"detail": "Rollup rebuilt", "months": months}
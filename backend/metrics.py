@@ -0,0 +1,188 @@
+"""
+Métricas por rota: latência, queries SQL, tempo de banco e detecção de N+1.
+
+O middleware abre um contexto por requisição (contextvar, visível também nas threads do
+threadpool) e os eventos do engine somam nele cada query e o tempo gasto no banco. Ao fim
+da resposta (inclusive respostas em streaming) os números entram em histogramas por
+método e rota (o template, ex.: /clients/{client_id}/statement) e ficam disponíveis em
+/metrics no formato texto do Prometheus.
+
+N+1: a mesma instrução (com os parâmetros normalizados) repetida mais de
+METRICS_N_PLUS_ONE_THRESHOLD vezes numa requisição gera um aviso no log e incrementa
+db_repeated_statements_total.
+
+As métricas são do processo: com vários workers cada um expõe as suas (o Prometheus soma).
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+N_PLUS_ONE_THRESHOLD = int(os.getenv("METRICS_N_PLUS_ONE_THRESHOLD", "10"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+UNMATCHED_ROUTE = "<unmatched>" # 404: não usa o caminho como rótulo (cardinalidade)
+
+
+class _RequestStats:
+    __slots__ = ("scope", "queries", "db_seconds", "statements")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = Counter()
+
+
+_current = ContextVar("request_metrics", default=None)
+
+def current_route() -> str:
+    """Método e rota da requisição em andamento (ex.: "GET /clients/{client_id}"), ou None."""
+    stats = _current.get()
+    if stats is None:
+        return None
+    route = stats.scope.get("route")
+    return f"{stats.scope['method']} {getattr(route, 'path', None) or UNMATCHED_ROUTE}"
+
+_PARAMS = re.compile(r"(\?|%\(\w+\)s|%s|\$\d+)(\s*,\s*(\?|%\(\w+\)s|%s|\$\d+))*")
+_NUMBERS = re.compile(r"\b\d+\b")
+
+def fingerprint(statement: str) -> str:
+    """Instrução sem os parâmetros: listas IN de tamanhos diferentes viram a mesma."""
+    return _NUMBERS.sub("N", _PARAMS.sub("?", " ".join(statement.split())))
+
+
+class Histogram:
+    """Histograma cumulativo do Prometheus por conjunto de rótulos."""
+
+    def __init__(self, name: str, help_text: str, buckets):
+        self.name, self.help, self.buckets = name, help_text, tuple(buckets)
+        self._series = {} # rótulos -> [contagens por bucket..., soma, total]
+
+    def observe(self, labels: tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self, label_names):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            base = _labels(label_names, labels)
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound:g}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name: str, help_text: str):
+        self.name, self.help = name, help_text
+        self._series = Counter()
+
+    def inc(self, labels: tuple, amount: float = 1):
+        self._series[labels] += amount
+
+    def render(self, label_names):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{{{_labels(label_names, labels)}}} {value:g}")
+        return lines
+
+
+def _labels(names, values) -> str:
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+ROUTE_LABELS = ("method", "route")
+_lock = threading.Lock()
+requests_total = CounterMetric("http_requests_total", "Requisições por rota e status")
+request_duration = Histogram("http_request_duration_seconds", "Latência da requisição (até o fim do corpo)", LATENCY_BUCKETS)
+request_queries = Histogram("http_request_db_queries", "Queries SQL por requisição", QUERY_BUCKETS)
+request_db_time = Histogram("http_request_db_seconds", "Tempo gasto no banco por requisição", LATENCY_BUCKETS)
+repeated_statements = CounterMetric("db_repeated_statements_total", "Requisições com a mesma instrução repetida acima do limite (N+1)")
+
+
+def record(method: str, route: str, status: int, elapsed: float, stats: _RequestStats):
+    labels = (method, route)
+    repeated = [(statement, count) for statement, count in stats.statements.items() if count > N_PLUS_ONE_THRESHOLD]
+    with _lock:
+        requests_total.inc((method, route, str(status)))
+        request_duration.observe(labels, elapsed)
+        request_queries.observe(labels, stats.queries)
+        request_db_time.observe(labels, stats.db_seconds)
+        if repeated:
+            repeated_statements.inc(labels)
+    for statement, count in repeated:
+        logger.warning(f"[N+1] {method} {route}: {count} execuções de {statement[:300]}")
+
+
+def render() -> str:
+    with _lock:
+        lines = requests_total.render(("method", "route", "status"))
+        for metric in (request_duration, request_queries, request_db_time, repeated_statements):
+            lines += metric.render(ROUTE_LABELS)
+    return "\n".join(lines) + "\n"
+
+
+# --- Eventos do engine ---
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("metrics_started")
+    elapsed = time.perf_counter() - started.pop() if started else 0.0
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        stats.statements[fingerprint(statement)] += 1
+
+def instrument(engine):
+    """Liga a contagem de queries e o tempo de banco ao engine (síncrono)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class MetricsMiddleware:
+    """Mede cada requisição HTTP e registra por rota ao enviar o fim do corpo."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = _RequestStats(scope)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            record(scope["method"], getattr(route, "path", None) or UNMATCHED_ROUTE, status,
+                   time.perf_counter() - start, stats)
@@ -0,0 +1,226 @@
+"""
+Migrações versionadas do schema.
+
+`create_all` só cria tabelas que não existem; mudanças em tabelas já existentes (índices,
+colunas, dados) entram aqui como migrações numeradas. A tabela schema_version guarda as
+já aplicadas e `run_migrations` (chamado no startup) roda o create_all e aplica as
+pendentes em ordem, cada uma na sua transação junto com o registro da versão.
+
+Com vários workers subindo ao mesmo tempo, cada migração roda sob um lock entre processos
+tomado antes de conferir schema_version: no PostgreSQL um advisory lock da transação; no
+SQLite um BEGIN IMMEDIATE, que pega o lock de escrita do arquivo (o pysqlite não abre
+transação antes de SELECT nem de DDL, então sem ele duas migrações correriam juntas). O
+worker que chega depois espera o lock, encontra a versão já registrada e segue adiante.
+
+Uso manual:
+    python migrations.py          # aplica as pendentes e mostra a versão atual
+"""
+import logging
+import os
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.orm import Session
+
+import crud
+import models
+from fixedpoint import BRL_SCALE, KWH_SCALE, PERCENT_SCALE, TARIFF_SCALE
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = []  # (versão, descrição, função(conn))
+ADVISORY_LOCK_ID = 81020  # pg_advisory_xact_lock das migrações
+# Espera máxima pelo lock do SQLite enquanto outro worker migra (o busy_timeout normal é curto)
+SQLITE_LOCK_TIMEOUT_MS = int(os.getenv("MIGRATION_LOCK_TIMEOUT_MS", "600000"))
+
+
+def migration(version: int, description: str):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def _create_indexes(conn, *names: str):
+    """Cria (se faltarem) os índices declarados nos modelos com estes nomes."""
+    indexes = {index.name: index for table in models.Base.metadata.tables.values() for index in table.indexes}
+    for name in names:
+        indexes[name].create(bind=conn, checkfirst=True)
+
+
+@migration(1, "Índices compostos de listagem e paginação")
+def _listing_indexes(conn):
+    _create_indexes(
+        conn,
+        "ix_generation_plants_is_active_id",
+        "ix_plant_distributions_plant_client",
+        "ix_clients_is_active_id",
+        "ix_invoices_month_id",
+        "ix_invoices_client_month_id",
+        "ix_invoices_status_month_id",
+        "ix_invoices_status_pago_month_id",
+        "ix_operators_is_active_id",
+        "ix_credit_movements_client_month_id",
+        "ix_credit_movements_client_id_id",
+    )
+
+
+@migration(2, "Índices de FK: produção por usina/mês, rateios por cliente, ajustes por cliente")
+def _foreign_key_indexes(conn):
+    _create_indexes(
+        conn,
+        "ix_production_plant_month_id",
+        "ix_production_month",
+        "ix_plant_distributions_client_plant",
+        "ix_credit_adjustments_client_created",
+    )
+    # Estatísticas novas para o planejador escolher os índices
+    conn.execute(text("ANALYZE"))
+
+
+# Colunas Float convertidas para ponto fixo (inteiro na menor unidade) pela migração 3
+FIXED_POINT_COLUMNS = {
+    "generation_plants": {"acquisition_cost": BRL_SCALE, "maintenance_cost": BRL_SCALE},
+    "plant_distributions": {"percentage": PERCENT_SCALE},
+    "clients": {"kwh_value_original": TARIFF_SCALE, "negotiated_discount": PERCENT_SCALE, "current_credits": KWH_SCALE},
+    "production": {"kwh_generated": KWH_SCALE},
+    "credit_adjustments": {"amount": KWH_SCALE},
+    "invoices": {
+        "consumption_kwh": KWH_SCALE, "credited_balance": KWH_SCALE,
+        "kwh_value": TARIFF_SCALE, "kwh_value_original": TARIFF_SCALE, "kwh_value_injection": TARIFF_SCALE,
+        **{column: BRL_SCALE for column in (
+            "invoice_value", "fixed_cost", "total_invoiced", "amount_to_collect", "value_without_discount",
+            "total_value", "original_value", "discount", "profit",
+        )},
+    },
+    "monthly_rollups": {"production_kwh": KWH_SCALE, "open_invoice_value": BRL_SCALE, "profit": BRL_SCALE},
+    "credit_movements": {"kwh": KWH_SCALE},
+    "credit_balance_snapshots": {"balance": KWH_SCALE},
+}
+
+
+@migration(3, "Energia e dinheiro em ponto fixo: Wh, centavos, tarifas e percentuais como inteiros")
+def _fixed_point_columns(conn):
+    for table, columns in FIXED_POINT_COLUMNS.items():
+        if conn.dialect.name == "postgresql":
+            conn.execute(text(f"ALTER TABLE {table} " + ", ".join(
+                f"ALTER COLUMN {column} TYPE BIGINT USING round({column}::numeric * {10 ** scale})::bigint"
+                for column, scale in columns.items()
+            )))
+        else:
+            # SQLite não altera o tipo da coluna: os valores passam a ser inteiros (exatos até 2^53)
+            conn.execute(text(f"UPDATE {table} SET " + ", ".join(
+                f"{column} = CAST(round({column} * {10 ** scale}) AS INTEGER)" for column, scale in columns.items()
+            )))
+
+
+@migration(4, "Rateio com vigência por mês e rateio de cada produção pré-calculado (production_allocations)")
+def _production_allocations(conn):
+    columns = {column["name"] for column in inspect(conn).get_columns("plant_distributions")}
+    for column in ("effective_from", "effective_to"):
+        if column not in columns:
+            conn.execute(text(f"ALTER TABLE plant_distributions ADD COLUMN {column} VARCHAR"))
+    models.ProductionAllocation.__table__.create(bind=conn, checkfirst=True)
+
+    # Produções já lançadas: o rateio atual (o único que existia) vezes a geração, somando por
+    # cliente as partes arredondadas de cada linha como foram creditadas no livro razão
+    scale = 100 * 10 ** PERCENT_SCALE
+    if conn.dialect.name == "postgresql":
+        part = f"round(d.percentage::numeric * p.kwh_generated / {scale})"
+    else:
+        part = f"round(d.percentage * p.kwh_generated / {scale}.0)"
+    conn.execute(text(f"""
+        INSERT INTO production_allocations (production_id, plant_id, client_id, month, percentage, kwh)
+        SELECT p.id, p.plant_id, d.client_id, p.month, CAST(SUM(d.percentage) AS BIGINT), CAST(SUM({part}) AS BIGINT)
+        FROM production p
+        JOIN plant_distributions d ON d.plant_id = p.plant_id
+        WHERE d.client_id IS NOT NULL AND d.percentage IS NOT NULL AND p.month IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM production_allocations a WHERE a.production_id = p.id)
+        GROUP BY p.id, p.plant_id, d.client_id, p.month
+    """))
+    conn.execute(text("ANALYZE"))
+
+
+# Mês das faturas antigas gravadas sem mês: no formato YYYY-MM e antes de qualquer mês real,
+# então vão para o fim da listagem (month DESC) e aparecem com ?month_to=0000-00
+MISSING_INVOICE_MONTH = "0000-00"
+
+
+@migration(5, "Faturas: month NOT NULL (a paginação por (month, id) perdia linhas depois de um mês nulo)")
+def _invoice_month_not_null(conn):
+    conn.execute(text("UPDATE invoices SET month = :month WHERE month IS NULL"), {"month": MISSING_INVOICE_MONTH})
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE invoices ALTER COLUMN month SET NOT NULL"))
+        return
+    # SQLite não altera a restrição de uma coluna existente sem recriar a tabela: triggers
+    # recusam o NULL com o mesmo erro de uma coluna NOT NULL (bancos novos já nascem com ela)
+    for event in ("INSERT", "UPDATE OF month"):
+        name = "invoices_month_not_null_" + event.split()[0].lower()
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS {name} BEFORE {event} ON invoices
+            WHEN NEW.month IS NULL
+            BEGIN SELECT RAISE(ABORT, 'NOT NULL constraint failed: invoices.month'); END
+        """))
+
+
+@migration(6, "Rollup mensal (monthly_rollups) populado a partir do histórico")
+def _monthly_rollups_backfill(conn):
+    # Antes rodava no startup de cada worker, sem lock: o que perdia a corrida caía num
+    # IntegrityError na chave de monthly_rollups. A sessão entra na transação da migração.
+    with Session(bind=conn) as db:
+        crud.ensure_monthly_rollups(db)
+
+
+@migration(7, "Livro razão (credit_movements) gerado a partir do histórico")
+def _credit_ledger_backfill(conn):
+    # Idem: dois workers sem lock viam o livro vazio e lançavam o histórico em dobro.
+    with Session(bind=conn) as db:
+        crud.ensure_credit_ledger(db)
+
+
+def current_version(conn) -> int:
+    version = conn.execute(select(models.SchemaVersion.version).order_by(models.SchemaVersion.version.desc())).scalar()
+    return version or 0
+
+
+def _lock(conn):
+    """Serializa as migrações entre processos até o fim da transação de `conn`."""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+    elif conn.dialect.name == "sqlite":
+        busy_timeout = conn.exec_driver_sql("PRAGMA busy_timeout").scalar()
+        conn.exec_driver_sql(f"PRAGMA busy_timeout = {SQLITE_LOCK_TIMEOUT_MS}")
+        try:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        finally:
+            conn.exec_driver_sql(f"PRAGMA busy_timeout = {busy_timeout}")
+
+
+def run_migrations(engine) -> list:
+    """
+    Cria as tabelas que faltam (create_all, sob o mesmo lock: dois workers num banco novo
+    criariam a mesma tabela) e aplica as migrações pendentes. Retorna as versões aplicadas
+    por este processo.
+    """
+    with engine.begin() as conn:
+        _lock(conn)
+        models.Base.metadata.create_all(bind=conn)
+    applied = []
+    for version, description, fn in MIGRATIONS:
+        with engine.begin() as conn:
+            _lock(conn)
+            if conn.execute(select(models.SchemaVersion.version).where(models.SchemaVersion.version == version)).first():
+                continue
+            logger.info(f"[Migrações] Aplicando {version}: {description}")
+            fn(conn)
+            conn.execute(models.SchemaVersion.__table__.insert().values(version=version, description=description))
+        applied.append(version)
+    return applied
+
+if __name__ == "__main__":
+    from database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    run_migrations(engine)
+    with engine.connect() as conn:
+        print(f"Schema na versão {current_version(conn)}")
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Index, UniqueConstraint
 from datetime import datetime
 from sqlalchemy.orm import relationship
 from database import Base
+from fixedpoint import Energy, Money, Percent, Tariff
 
 class GenerationPlant(Base):
     __tablename__ = "generation_plants"
@@ -11,24 +12,46 @@ class GenerationPlant(Base):
     address = Column(String)
     uc_number = Column(String, unique=True, index=True)
     capacity_kw = Column(Float) # Capacidade instalada
-    acquisition_cost = Column(Float, default=0.0)
-    maintenance_cost = Column(Float, default=0.0)
+    acquisition_cost = Column(Money, default=0.0)
+    maintenance_cost = Column(Money, default=0.0)
     is_active = Column(Boolean, default=True)
     pix_key = Column(String, nullable=True)
     
     productions = relationship("Production", back_populates="plant")
-    distributions = relationship("PlantDistribution", back_populates="plant")
+    # Só o rateio vigente (versões encerradas ficam fora)
+    distributions = relationship(
+        "PlantDistribution",
+        primaryjoin="and_(GenerationPlant.id == PlantDistribution.plant_id, PlantDistribution.effective_to.is_(None))",
+        viewonly=True,
+    )
+
+    __table_args__ = (
+        Index("ix_generation_plants_is_active_id", "is_active", "id"),
+    )
 
 class PlantDistribution(Base):
+    """
+    Linha de uma versão do rateio de uma usina. A versão vale para os meses de produção em
+    [effective_from, effective_to); effective_from NULL = desde sempre, effective_to NULL =
+    versão vigente. Trocar o rateio encerra a versão atual em vez de reescrevê-la.
+    """
     __tablename__ = "plant_distributions"
 
     id = Column(Integer, primary_key=True, index=True)
     plant_id = Column(Integer, ForeignKey("generation_plants.id"))
     client_id = Column(Integer, ForeignKey("clients.id"))
-    percentage = Column(Float) # Ex: 10.5 (10.5%)
+    percentage = Column(Percent) # Ex: 10.5 (10.5%)
+    effective_from = Column(String, nullable=True) # Format: "YYYY-MM"
+    effective_to = Column(String, nullable=True) # Format: "YYYY-MM" (exclusivo)
+
+    plant = relationship("GenerationPlant")
+    client = relationship("Client")
 
-    plant = relationship("GenerationPlant", back_populates="distributions")
-    client = relationship("Client", back_populates="plant_distributions")
+    __table_args__ = (
+        Index("ix_plant_distributions_plant_client", "plant_id", "client_id"),
+        # Rateios de um cliente (extrato, saldo, PIX)
+        Index("ix_plant_distributions_client_plant", "client_id", "plant_id"),
+    )
 
 class Client(Base):
     __tablename__ = "clients"
@@ -41,62 +64,102 @@ class Client(Base):
     password = Column(String)
     phone = Column(String)
     payment_day = Column(Integer)
-    kwh_value_original = Column(Float, default=0.0)
-    negotiated_discount = Column(Float, default=0.0) # Desconto negociado (%)
-    current_credits = Column(Float, default=0.0)
+    kwh_value_original = Column(Tariff, default=0.0)
+    negotiated_discount = Column(Percent, default=0.0) # Desconto negociado (%)
+    current_credits = Column(Energy, default=0.0)
     is_active = Column(Boolean, default=True)
 
     invoices = relationship("Invoice", back_populates="client")
-    plant_distributions = relationship("PlantDistribution", back_populates="client")
+    plant_distributions = relationship(
+        "PlantDistribution",
+        primaryjoin="and_(Client.id == PlantDistribution.client_id, PlantDistribution.effective_to.is_(None))",
+        viewonly=True,
+    )
     credit_adjustments = relationship("CreditAdjustment", back_populates="client")
 
+    __table_args__ = (
+        Index("ix_clients_is_active_id", "is_active", "id"),
+    )
+
 class Production(Base):
     __tablename__ = "production"
 
     id = Column(Integer, primary_key=True, index=True)
     plant_id = Column(Integer, ForeignKey("generation_plants.id")) # Changed from client_id
     month = Column(String)  # Format: "YYYY-MM"
-    kwh_generated = Column(Float)
+    kwh_generated = Column(Energy)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     plant = relationship("GenerationPlant", back_populates="productions")
     # client = relationship("Client", back_populates="productions") # REMOVED
 
+    # Histórico por usina em ordem (month DESC, id DESC) e busca por (usina, mês); rollup por mês
+    __table_args__ = (
+        Index("ix_production_plant_month_id", "plant_id", "month", "id"),
+        Index("ix_production_month", "month"),
+    )
+
+class ProductionAllocation(Base):
+    """
+    Parte de uma produção que coube a um cliente, gravada quando a produção é lançada com o
+    rateio em vigor no mês dela. Extrato, reconciliação e estornos leem estas linhas: mudar o
+    rateio depois não altera a história.
+    """
+    __tablename__ = "production_allocations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    production_id = Column(Integer, ForeignKey("production.id"), nullable=False)
+    plant_id = Column(Integer, ForeignKey("generation_plants.id"), nullable=False)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    month = Column(String, nullable=False) # Format: "YYYY-MM" (o da produção)
+    percentage = Column(Percent, nullable=False)
+    kwh = Column(Energy, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("production_id", "client_id", name="uq_production_allocations_production_client"),
+        # Extrato e saldo do cliente por mês
+        Index("ix_production_allocations_client_month", "client_id", "month", "production_id"),
+    )
+
 class CreditAdjustment(Base):
     __tablename__ = "credit_adjustments"
 
     id = Column(Integer, primary_key=True, index=True)
     client_id = Column(Integer, ForeignKey("clients.id"))
-    amount = Column(Float) # positive for credit, negative for debit
+    amount = Column(Energy) # positive for credit, negative for debit
     description = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     client = relationship("Client", back_populates="credit_adjustments")
 
+    __table_args__ = (
+        Index("ix_credit_adjustments_client_created", "client_id", "created_at"),
+    )
+
 class Invoice(Base):
     __tablename__ = "invoices"
 
     id = Column(Integer, primary_key=True, index=True)
     client_id = Column(Integer, ForeignKey("clients.id"))
-    month = Column(String)
+    month = Column(String, nullable=False) # Format: "YYYY-MM"; chave da paginação (month, id)
     invoice_number = Column(String) # FATURA
     
-    consumption_kwh = Column(Float)
-    kwh_value = Column(Float)
-    kwh_value_original = Column(Float) # V. kWh Original
-    kwh_value_injection = Column(Float) # V. kWh injeção
+    consumption_kwh = Column(Energy)
+    kwh_value = Column(Tariff)
+    kwh_value_original = Column(Tariff) # V. kWh Original
+    kwh_value_injection = Column(Tariff) # V. kWh injeção
     
-    credited_balance = Column(Float) # CREDITADO
-    invoice_value = Column(Float)
-    fixed_cost = Column(Float) # Valor Fixo
-    total_invoiced = Column(Float) # Valor Faturado
-    amount_to_collect = Column(Float) # Valor a cobrar
-    value_without_discount = Column(Float) # Valor sem Desconto
+    credited_balance = Column(Energy) # CREDITADO
+    invoice_value = Column(Money)
+    fixed_cost = Column(Money) # Valor Fixo
+    total_invoiced = Column(Money) # Valor Faturado
+    amount_to_collect = Column(Money) # Valor a cobrar
+    value_without_discount = Column(Money) # Valor sem Desconto
     
-    total_value = Column(Float) # Valor Total (legacy?)
-    original_value = Column(Float) # (legacy?)
-    discount = Column(Float)
-    profit = Column(Float)
+    total_value = Column(Money) # Valor Total (legacy?)
+    original_value = Column(Money) # (legacy?)
+    discount = Column(Money)
+    profit = Column(Money)
     
     status = Column(String, default="aberto") # aberto, vencido, pago
     status_cobrado = Column(Boolean, default=False)
@@ -106,6 +169,14 @@ class Invoice(Base):
 
     client = relationship("Client", back_populates="invoices")
 
+    # Listagem de faturas: ordem (month DESC, id DESC) com filtros opcionais
+    __table_args__ = (
+        Index("ix_invoices_month_id", "month", "id"),
+        Index("ix_invoices_client_month_id", "client_id", "month", "id"),
+        Index("ix_invoices_status_month_id", "status", "month", "id"),
+        Index("ix_invoices_status_pago_month_id", "status_pago", "month", "id"),
+    )
+
 class Operator(Base):
     __tablename__ = "operators"
 
@@ -116,3 +187,89 @@ class Operator(Base):
     hashed_password = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_operators_is_active_id", "is_active", "id"),
+    )
+
+class MonthlyRollup(Base):
+    """Totais por mês (YYYY-MM), mantidos incrementalmente pelo crud a cada escrita."""
+    __tablename__ = "monthly_rollups"
+
+    month = Column(String, primary_key=True)
+    production_kwh = Column(Energy, default=0.0)
+    production_count = Column(Integer, default=0)
+    invoice_count = Column(Integer, default=0)
+    open_invoice_count = Column(Integer, default=0)
+    open_invoice_value = Column(Money, default=0.0)
+    profit = Column(Money, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class CreditMovement(Base):
+    """
+    Livro razão (append-only) de créditos em kWh. Cada linha é um movimento com sinal:
+    rateio de produção (+), compensação em fatura (-) ou ajuste manual (+/-).
+    Client.current_credits é o saldo em cache da soma destes movimentos.
+    """
+    __tablename__ = "credit_movements"
+
+    id = Column(Integer, primary_key=True, index=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    month = Column(String, nullable=False) # Format: "YYYY-MM"
+    kind = Column(String, nullable=False) # geracao, faturamento, ajuste
+    kwh = Column(Energy, nullable=False) # positivo = crédito, negativo = débito
+    description = Column(String, nullable=True)
+    # Referências à origem (sem FK: o movimento sobrevive à exclusão da origem)
+    production_id = Column(Integer, nullable=True)
+    invoice_id = Column(Integer, nullable=True)
+    adjustment_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_credit_movements_client_month_id", "client_id", "month", "id"),
+        Index("ix_credit_movements_client_id_id", "client_id", "id"),
+    )
+
+class CreditBalanceSnapshot(Base):
+    """Saldo consolidado de um cliente até o fim de um mês (inclui movimentos com id <= last_movement_id)."""
+    __tablename__ = "credit_balance_snapshots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    month = Column(String, nullable=False) # Format: "YYYY-MM"
+    balance = Column(Energy, nullable=False)
+    last_movement_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("client_id", "month", name="uq_credit_balance_snapshots_client_month"),
+    )
+
+class BalanceReconciliation(Base):
+    """Execução da reconciliação de saldos (crud.reconcile_balances)."""
+    __tablename__ = "balance_reconciliations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    mode = Column(String, nullable=False) # full, incremental
+    applied = Column(Boolean, nullable=False, default=False) # False = apenas relatório
+    last_movement_id = Column(Integer, nullable=False) # Maior movimento do livro no início da execução
+    clients_checked = Column(Integer, nullable=False, default=0)
+    clients_with_drift = Column(Integer, nullable=False, default=0)
+    total_drift = Column(Energy, nullable=False, default=0) # Soma de |saldo em cache - esperado|
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class CacheVersion(Base):
+    """Contador de versão por tabela (ETags), incrementado logo depois do commit de cada escrita, numa transação própria."""
+    __tablename__ = "cache_versions"
+
+    entity = Column(String, primary_key=True) # Nome da tabela
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class SchemaVersion(Base):
+    """Migrações do schema já aplicadas (ver migrations.py)."""
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True)
+    description = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,107 @@
+"""
+Geração de PIX estático (BR Code / EMV QRCPS-MPM).
+
+O payload depende apenas de (chave, nome, cidade, valor), então fica em cache LRU:
+faturas da mesma usina com o mesmo valor reaproveitam o mesmo código. O CRC16 usa
+tabela pré-calculada (um lookup por byte em vez de 8 iterações por caractere).
+"""
+import base64
+import io
+import re
+import unicodedata
+from functools import lru_cache
+
+try:
+    import qrcode  # Opcional: necessário apenas para gerar as imagens do QR Code
+except ImportError:
+    qrcode = None
+
+PIX_CACHE_SIZE = 4096
+DEFAULT_CITY = "MACAPA"
+DEFAULT_RECIPIENT = "RAIZ SOLAR"
+
+
+def _build_crc16_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+            crc &= 0xFFFF
+        table.append(crc)
+    return tuple(table)
+
+_CRC16_TABLE = _build_crc16_table()
+
+
+def crc16_ccitt(data: str) -> str:
+    """CRC16 CCITT-FALSE (polinomio 0x1021, valor inicial 0xFFFF) em 4 digitos hex."""
+    crc = 0xFFFF
+    table = _CRC16_TABLE
+    for byte in data.encode("utf-8"):
+        crc = ((crc << 8) & 0xFFFF) ^ table[((crc >> 8) ^ byte) & 0xFF]
+    return format(crc, "04X")
+
+
+def normalize_text(text: str) -> str:
+    """Remove acentuação e caracteres especiais para compatibilidade com o padrão EMV."""
+    if not text:
+        return ""
+    # Normaliza para decompor caracteres acentuados (ex: 'á' vira 'a' + '´')
+    normalized = unicodedata.normalize('NFD', text)
+    # Mantém apenas caracteres ASCII básicos
+    ascii_only = normalized.encode('ascii', 'ignore').decode('ascii')
+    # Remove qualquer caractere que não seja letra, número ou espaço e limpa espaços extras
+    clean = re.sub(r'[^a-zA-Z0-9\s]', '', ascii_only)
+    return " ".join(clean.split()).upper()
+
+
+def _field(tag: str, value: str) -> str:
+    return f"{tag}{len(value):02d}{value}"
+
+
+@lru_cache(maxsize=PIX_CACHE_SIZE)
+def _brcode(key: str, name: str, city: str, amount: str) -> str:
+    # Tag 26 - Merchant Account Info (GUI + Chave PIX)
+    merchant_account = _field("26", _field("00", "br.gov.bcb.pix") + _field("01", key))
+    # Tag 62 - Additional Data: txid nulo para máxima compatibilidade em Pix Estático
+    additional = _field("62", _field("05", "***"))
+
+    payload = (
+        _field("00", "01")                         +  # Payload Format Indicator
+        merchant_account                           +  # Tag 26
+        _field("52", "0000")                       +  # MCC
+        _field("53", "986")                        +  # Currency BRL
+        _field("54", amount)                       +  # Valor
+        _field("58", "BR")                         +  # Country Code
+        _field("59", normalize_text(name)[:25])    +  # Nome do Recebedor
+        _field("60", normalize_text(city)[:15])    +  # Cidade
+        additional                                    # Tag 62
+    )
+    # Tag 63 - CRC16 calculado sobre o payload incluindo o proprio cabeçalho "6304"
+    payload += "6304"
+    return payload + crc16_ccitt(payload)
+
+
+def generate_brcode(name: str, key: str, amount: float, city: str = DEFAULT_CITY) -> str:
+    """Payload PIX copia-e-cola para um valor fixo."""
+    return _brcode(key.strip(), name or DEFAULT_RECIPIENT, city, f"{float(amount):.2f}")
+
+
+def qr_available() -> bool:
+    return qrcode is not None
+
+
+@lru_cache(maxsize=PIX_CACHE_SIZE)
+def qr_png_base64(payload: str) -> str:
+    """Imagem PNG do QR Code em base64 (requer o pacote opcional `qrcode[pil]`)."""
+    if qrcode is None:
+        raise RuntimeError("Geração de QR Code indisponível: instale o pacote 'qrcode[pil]'")
+    image = qrcode.make(payload, border=2)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def cache_info() -> dict:
+    return {"payloads": _brcode.cache_info()._asdict(), "qr_images": qr_png_base64.cache_info()._asdict()}
@@ -0,0 +1,285 @@
+"""
+Perfil sob demanda de uma requisição e log de queries lentas.
+
+Perfil: um operador envia `X-Profile: 1` (ou `?_profile=1`) e a requisição roda com um
+profiler por amostragem. Uma thread lê as pilhas de todas as threads do processo a cada
+PROFILE_INTERVAL_MS enquanto a requisição não termina (inclusive o corpo em streaming) e
+grava o resultado em PROFILES_DIR/<id>.folded, no formato de pilhas "dobradas"
+(`thread;func (arquivo:linha);... contagem`) que o speedscope e o flamegraph.pl abrem
+direto. A resposta traz o id em X-Profile-Id; /admin/profiles lista e devolve os perfis.
+Só um perfil por vez em cada processo, e as amostras incluem as outras requisições que o
+mesmo worker atender no período: em produção prefira um horário calmo.
+
+Queries lentas: toda instrução acima de SLOW_QUERY_MS entra num log em memória (as últimas
+SLOW_QUERY_LOG_SIZE, em /admin/slow-queries) e no log da aplicação, com o tempo, a rota que
+a executou e o plano (EXPLAIN QUERY PLAN no SQLite, EXPLAIN sem ANALYZE no PostgreSQL,
+rodado na mesma conexão logo depois). Os parâmetros não são guardados.
+"""
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timezone
+from pathlib import Path
+
+from sqlalchemy import event
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PROFILES_DIR = Path(os.getenv("PROFILES_DIR", "profiles"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY = re.compile(r"(^|&)_profile=(1|true)(&|$)")
+PROFILE_ID = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$")
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200")) # 0 desliga
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "200"))
+
+# Folha da pilha nestes módulos = thread parada esperando (pool ocioso, loop sem eventos)
+_IDLE_MODULES = {"threading.py", "queue.py", "selectors.py"}
+_IDLE_FUNCTIONS = {("thread.py", "_worker")} # concurrent.futures esperando na fila (em C)
+
+
+# --- Profiler por amostragem ---
+def _is_idle(frame) -> bool:
+    module = os.path.basename(frame.f_code.co_filename)
+    return module in _IDLE_MODULES or (module, frame.f_code.co_name) in _IDLE_FUNCTIONS
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Amostra as pilhas de todas as threads (menos a própria) até stop()."""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, max_seconds: float = PROFILE_MAX_SECONDS):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        own = threading.get_ident()
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or _is_idle(frame):
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+
+def _new_profile_id() -> str:
+    return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+
+def save_profile(profile_id: str, stacks: Counter, meta: dict, directory: Path = PROFILES_DIR) -> Path:
+    directory.mkdir(parents=True, exist_ok=True)
+    target = directory / f"{profile_id}.folded"
+    with open(target, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    with open(directory / f"{profile_id}.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return target
+
+
+def list_profiles(limit: int = 50, directory: Path = PROFILES_DIR) -> list:
+    if not directory.exists():
+        return []
+    metas = []
+    for path in sorted(directory.glob("*.json"), reverse=True)[:limit]:
+        with open(path, encoding="utf-8") as f:
+            metas.append(json.load(f))
+    return metas
+
+
+def profile_path(profile_id: str, directory: Path = PROFILES_DIR):
+    """Caminho do perfil, ou None (id inválido ou inexistente; o id vem da URL)."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    target = directory / f"{profile_id}.folded"
+    return target if target.exists() else None
+
+
+class ProfilingMiddleware:
+    """
+    Perfila a requisição pedida com X-Profile: 1 / ?_profile=1 por um operador. Precisa
+    rodar dentro do AuthenticationMiddleware (lê o principal do scope); para os demais o
+    pedido é ignorado.
+    """
+
+    _busy = threading.Lock()
+
+    def __init__(self, app):
+        self.app = app
+
+    def _requested(self, scope) -> bool:
+        if scope["type"] != "http":
+            return False
+        principal = scope.get("state", {}).get("principal")
+        if principal is None or not principal.is_admin:
+            return False
+        if any(name == PROFILE_HEADER and value.strip() in (b"1", b"true") for name, value in scope["headers"]):
+            return True
+        return bool(PROFILE_QUERY.search(scope.get("query_string", b"").decode("latin-1")))
+
+    async def __call__(self, scope, receive, send):
+        if not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+        if not self._busy.acquire(blocking=False):
+            async def send_busy(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = [*message.get("headers", []), (b"x-profile", b"busy")]
+                await send(message)
+            await self.app(scope, receive, send_busy)
+            return
+
+        profile_id = _new_profile_id()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        profiler = SamplingProfiler().start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            stacks = profiler.stop()
+            self._busy.release()
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            meta = {
+                "id": profile_id,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(route, "path", None),
+                "status": status,
+                "duration_ms": round(elapsed * 1000, 1),
+                "samples": profiler.samples,
+                "interval_ms": profiler.interval * 1000,
+                "user_id": scope["state"]["principal"].user_id,
+            }
+            try:
+                target = save_profile(profile_id, stacks, meta)
+                logger.info(f"[Profile] {scope['method']} {scope['path']}: {profiler.samples} amostras "
+                            f"em {meta['duration_ms']} ms -> {target}")
+            except OSError as e:
+                logger.error(f"[Profile] Falha ao gravar o perfil {profile_id}: {e}")
+
+
+# --- Queries lentas ---
+slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_EXPLAINABLE = ("select", "with", "insert", "update", "delete")
+
+
+def _explain(conn, statement, parameters) -> list:
+    """Plano da instrução, rodado num cursor próprio na mesma conexão (mesma transação)."""
+    dialect = conn.dialect.name
+    prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+    cursor = conn.connection.cursor()
+    # No PostgreSQL um erro aborta a transação da requisição: o EXPLAIN fica num savepoint
+    savepoint = dialect == "postgresql" and conn.in_transaction()
+    try:
+        if savepoint:
+            cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        except Exception:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            raise
+        finally:
+            if savepoint:
+                cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+    finally:
+        cursor.close()
+    if dialect == "sqlite":
+        # (id, parent, notused, detail): indenta pela profundidade como o shell do sqlite
+        depth = {0: -1}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            lines.append("  " * depth[node_id] + detail)
+        return lines
+    return [row[0] for row in rows]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("slow_query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("slow_query_started")
+    if not started:
+        return
+    elapsed_ms = (time.perf_counter() - started.pop()) * 1000
+    if elapsed_ms < SLOW_QUERY_MS:
+        return
+    plan = None
+    if not executemany and statement.lstrip().lower().startswith(_EXPLAINABLE):
+        try:
+            plan = _explain(conn, statement, parameters)
+        except Exception as e:
+            plan = [f"EXPLAIN falhou: {e}"]
+    entry = {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "duration_ms": round(elapsed_ms, 1),
+        "route": metrics.current_route(),
+        "statement": " ".join(statement.split()),
+        "executemany": executemany,
+        "plan": plan,
+    }
+    slow_queries.append(entry)
+    logger.warning(f"[Slow query] {entry['duration_ms']} ms em {entry['route'] or '(fora de requisição)'}: "
+                   f"{entry['statement'][:300]}" + ("\n  " + "\n  ".join(plan) if plan else ""))
+
+def _handle_error(context):
+    # after_cursor_execute não dispara quando a instrução falha: descarta o início pendente,
+    # senão ele fica na conexão (que volta ao pool) e desalinha as medições seguintes
+    if context.connection is None:
+        return
+    started = context.connection.info.get("slow_query_started")
+    if started:
+        started.pop()
+
+def instrument(engine):
+    """Liga o log de queries lentas ao engine (síncrono). SLOW_QUERY_MS=0 desliga."""
+    if SLOW_QUERY_MS <= 0:
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
@@ -23,6 +23,8 @@ class PlantDistributionPlain(BaseModel):
     plant_id: int
     client_id: int
     percentage: float
+    effective_from: Optional[str] = None # Primeiro mês de produção da versão (None = desde sempre)
+    effective_to: Optional[str] = None # Mês em que a versão foi substituída (None = vigente)
 
     class Config:
         from_attributes = True
@@ -126,6 +128,28 @@ class ProductionUpdate(BaseModel):
     month: Optional[str] = None
     kwh_generated: Optional[float] = None
 
+class ProductionImportRow(BaseModel):
+    plant_id: Optional[int] = None
+    plant_uc_number: Optional[str] = None # Alternativa ao plant_id
+    month: str
+    kwh_generated: float
+
+class ProductionImportResult(BaseModel):
+    row: int # Posição na planilha/lote (1 = primeira linha de dados)
+    status: str # "created", "valid" (dry run) or "error"
+    plant_id: Optional[int] = None
+    month: Optional[str] = None
+    kwh_generated: Optional[float] = None
+    production_id: Optional[int] = None
+    error: Optional[str] = None
+
+class ProductionImportReport(BaseModel):
+    dry_run: bool
+    total: int
+    created: int
+    errors: int
+    results: List[ProductionImportResult]
+
 class CreditAdjustmentCreate(BaseModel):
     amount: float
     description: str
@@ -210,6 +234,16 @@ class GenerationPlant(GenerationPlantPlain):
     productions: List[ProductionPlain] = []
     distributions: List[PlantDistributionPlain] = []
 
+class PlantMonthlyProduction(BaseModel):
+    month: str
+    kwh_generated: float
+
+class GenerationPlantSummary(GenerationPlantPlain):
+    lifetime_kwh: float = 0.0
+    production_count: int = 0
+    allocated_percentage: float = 0.0 # Soma dos percentuais do rateio
+    recent_production: List[PlantMonthlyProduction] = [] # Ultimos N meses, mais recente primeiro
+
 class Production(ProductionPlain):
     plant: Optional[GenerationPlantPlain] = None
 
@@ -221,12 +255,90 @@ class Client(ClientPlain):
 class Invoice(InvoicePlain):
     client: Optional[ClientPlain] = None
 
+class InvoicePix(BaseModel):
+    invoice_id: int
+    client_id: int
+    month: str
+    pix_payload: Optional[str] = None
+    pix_key: Optional[str] = None
+    amount: Optional[float] = None
+    recipient: Optional[str] = None
+    qr_image: Optional[str] = None # PNG em base64 (apenas com ?qr=true)
+    error: Optional[str] = None
+
+# --- Billing Run ---
+class BillingReading(BaseModel):
+    client_id: int
+    consumption_kwh: float
+    fixed_cost: Optional[float] = None # Padrão: default_fixed_cost do lote
+    kwh_value_original: Optional[float] = None # Padrão: tarifa do cliente
+    credited_balance: Optional[float] = None # Padrão: min(consumo, créditos disponíveis), que também limita o valor informado
+    equatorial_invoice_path: Optional[str] = None
+
+class BillingRunRequest(BaseModel):
+    month: str # YYYY-MM
+    readings: List[BillingReading]
+    default_fixed_cost: float = 10.0
+
+class BillingRunItem(BaseModel):
+    client_id: int
+    client_name: Optional[str] = None
+    status: str # "created", "preview" or "skipped"
+    reason: Optional[str] = None
+    invoice_id: Optional[int] = None
+    consumption_kwh: float = 0.0
+    kwh_value_original: float = 0.0
+    kwh_value_injection: float = 0.0
+    credited_balance: float = 0.0
+    fixed_cost: float = 0.0
+    value_without_discount: float = 0.0
+    total_invoiced: float = 0.0
+    amount_to_collect: float = 0.0
+    discount: float = 0.0
+    profit: float = 0.0
+
+class BillingRunReport(BaseModel):
+    month: str
+    dry_run: bool
+    created: int
+    skipped: int
+    total_amount_to_collect: float
+    total_credited_kwh: float
+    items: List[BillingRunItem]
+
+# --- Equatorial PDFs ---
+class EquatorialFields(BaseModel):
+    month: Optional[str] = None
+    uc_number: Optional[str] = None
+    consumption_kwh: Optional[float] = None
+    kwh_value_original: Optional[float] = None
+    injected_kwh: Optional[float] = None
+    credited_balance: Optional[float] = None
+
+class EquatorialParseResult(BaseModel):
+    file: str
+    sha256: str
+    path: Optional[str] = None
+    fields: Optional[EquatorialFields] = None
+    missing: List[str] = []
+    cached: bool = False
+    error: Optional[str] = None
+    client_id: Optional[int] = None
+
+class EquatorialBatchReport(BaseModel):
+    month: str
+    files: List[EquatorialParseResult]
+    billing: Optional[BillingRunReport] = None
+
 # --- Dashboard ---
 class DashboardMetrics(BaseModel):
-    open_invoices_count: int
+    month: Optional[str] = None # Mês de referência (YYYY-MM) dos campos monthly_*
+    open_invoices_count: int # Todas as faturas não pagas
     open_invoices_value: float
     monthly_production: float
     monthly_margin: float
+    total_production: float = 0.0 # Acumulado de todos os meses
+    total_margin: float = 0.0
     recent_clients: List[ClientPlain]
 
 
@@ -258,11 +370,54 @@ class OperatorUpdate(BaseModel):
 
 class CreditStatementEntry(BaseModel):
     date: str # YYYY-MM
-    type: str # "geracao" or "faturamento"
+    type: str # "geracao", "faturamento" or "ajuste"
     kwh: float # positive for addition, negative for deduction
+    balance: float # Saldo acumulado após este lançamento
     description: str
     status: Optional[str] = None
     invoice_id: Optional[int] = None
+    item: Optional[dict] = None # Detalhes da fatura (apenas faturamento)
+
+class CreditMovementPlain(BaseModel):
+    id: int
+    client_id: int
+    month: str
+    kind: str # "geracao", "faturamento", "ajuste" or "reconciliacao"
+    kwh: float
+    description: Optional[str] = None
+    production_id: Optional[int] = None
+    invoice_id: Optional[int] = None
+    adjustment_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class CreditBalance(BaseModel):
+    client_id: int
+    month: str
+    balance: float
+    snapshot_month: Optional[str] = None # Snapshot usado como ponto de partida
+
+class BalanceDrift(BaseModel):
+    client_id: int
+    name: Optional[str] = None
+    expected: float # Gerações rateadas + ajustes + lançamentos manuais - faturas
+    current_credits: float
+    ledger_balance: float # Soma do livro razão
+    drift: float # current_credits - expected
+    ledger_drift: float # ledger_balance - expected
+
+class BalanceReconciliationReport(BaseModel):
+    id: int
+    mode: str # "full" or "incremental"
+    applied: bool
+    since_movement_id: Optional[int] = None # Incremental: movimentos posteriores a este id
+    last_movement_id: int
+    clients_checked: int
+    clients_with_drift: int
+    total_drift: float
+    items: List[BalanceDrift]
 
 class LoginRequest(BaseModel):
     identifier: str
@@ -275,3 +430,6 @@ class LoginResponse(BaseModel):
     user_id: Optional[int] = None
     name: Optional[str] = None
     user_type: Optional[str] = None
+    access_token: Optional[str] = None
+    token_type: Optional[str] = None
+    expires_in: Optional[int] = None # Segundos
@@ -0,0 +1,91 @@
+"""
+Hash e verificação de senhas fora do threadpool das requisições.
+
+O bcrypt é caro de propósito, então roda num executor próprio e limitado
+(PASSWORD_HASH_WORKERS threads; o bcrypt libera o GIL). Uma rajada de logins
+disputa apenas esse executor e não as threads que atendem os demais endpoints.
+Acima de PASSWORD_HASH_MAX_PENDING verificações na fila, novas tentativas são
+recusadas com PasswordVerifierBusy em vez de se acumularem.
+
+O custo (BCRYPT_ROUNDS) é configurável; hashes com custo diferente do atual e
+senhas legadas em texto puro são regravados no próximo login bem-sucedido.
+"""
+import asyncio
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "256"))
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_pending = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+
+
+class PasswordVerifierBusy(Exception):
+    pass
+
+
+def _password_bytes(password: str) -> bytes:
+    # Bcrypt has a maximum password length of 72 bytes
+    return password.encode('utf-8')[:72]
+
+
+def is_password_hash(value: str) -> bool:
+    return bool(value) and value.startswith(("$2a$", "$2b$", "$2y$"))
+
+
+def hash_password(password: str, rounds: int = None) -> str:
+    salt = bcrypt.gensalt(rounds=rounds or BCRYPT_ROUNDS)
+    return bcrypt.hashpw(_password_bytes(password), salt).decode('utf-8')
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        if not hashed_password:
+            return False
+        return bcrypt.checkpw(_password_bytes(plain_password), hashed_password.encode('utf-8'))
+    except Exception:
+        return False
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    if not is_password_hash(hashed_password):
+        return True
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def check_password(plain_password: str, stored: str):
+    """
+    Confere a senha contra o valor armazenado (hash bcrypt ou texto puro legado).
+    Retorna (ok, novo_hash); novo_hash vem preenchido quando o valor deve ser regravado.
+    """
+    if not stored:
+        return False, None
+    if is_password_hash(stored):
+        ok = verify_password(plain_password, stored)
+    else:
+        ok = hmac.compare_digest(stored.encode('utf-8'), plain_password.encode('utf-8'))
+    if ok and needs_rehash(stored):
+        return True, hash_password(plain_password)
+    return ok, None
+
+
+async def run_in_password_executor(fn, *args):
+    if not _pending.acquire(blocking=False):
+        raise PasswordVerifierBusy("Muitas tentativas de login simultâneas, tente novamente")
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _pending.release()
+
+
+async def check_password_async(plain_password: str, stored: str):
+    return await run_in_password_executor(check_password, plain_password, stored)
@@ -0,0 +1,84 @@
+"""
+Armazenamento dos PDFs da Equatorial endereçado por conteúdo.
+
+O arquivo é gravado em blocos num temporário enquanto o SHA-256 é calculado e depois
+renomeado para `<sha256>.pdf`: reenviar a mesma conta reaproveita o arquivo existente e
+faturas diferentes nunca sobrescrevem o arquivo uma da outra.
+"""
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+UPLOADS_DIR = Path("uploads/equatorial_invoices")
+UPLOADS_URL = "/uploads/equatorial_invoices"
+MAX_UPLOAD_BYTES = int(float(os.getenv("EQUATORIAL_MAX_UPLOAD_MB", "20")) * 1024 * 1024)
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def store_stream(source, directory: Path = UPLOADS_DIR, max_bytes: int = MAX_UPLOAD_BYTES,
+                 suffix: str = ".pdf", chunk_size: int = CHUNK_SIZE):
+    """
+    Copia `source` (file-like) para `directory` em blocos de `chunk_size`.
+    Retorna (sha256, tamanho, caminho). Levanta UploadTooLarge ao passar de `max_bytes`.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_name = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Arquivo excede o limite de {max_bytes // (1024 * 1024)} MB")
+                digest.update(chunk)
+                tmp.write(chunk)
+
+        sha = digest.hexdigest()
+        target = directory / f"{sha}{suffix}"
+        if target.exists():
+            os.unlink(tmp_name)  # Mesmo conteúdo já armazenado
+        else:
+            os.replace(tmp_name, target)
+        return sha, size, target
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+
+def public_path(target: Path) -> str:
+    return f"{UPLOADS_URL}/{target.name}"
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Recusa com 413 uploads cujo Content-Length já excede o limite, antes de o corpo
+    multipart ser lido. Envios sem Content-Length são limitados por store_stream.
+    """
+
+    def __init__(self, app, path_suffix: str = "/upload-equatorial", max_bytes: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.path_suffix = path_suffix
+        # Folga para os cabeçalhos do multipart
+        self.max_body = max_bytes + 64 * 1024
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith(self.path_suffix):
+            for name, value in scope["headers"]:
+                if name == b"content-length" and value.isdigit() and int(value) > self.max_body:
+                    body = b'{"detail":"Arquivo excede o limite de upload"}'
+                    await send({"type": "http.response.start", "status": 413, "headers": [
+                        (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                    ]})
+                    await send({"type": "http.response.body", "body": body})
+                    return
+        await self.app(scope, receive, send)
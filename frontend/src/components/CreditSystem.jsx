@@ -38,7 +38,7 @@ const CreditSystem = () => {
     const fetchClients = async () => {
         try {
             setLoading(true);
-            const response = await api.get('/clients/');
+            const response = await api.get('/clients/', { params: { view: 'summary' } });
             setClients(Array.isArray(response.data) ? response.data : []);
         } catch (error) {
             console.error("Erro ao buscar clientes", error);
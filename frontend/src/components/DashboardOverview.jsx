@@ -45,7 +45,7 @@ const DashboardOverview = () => {
         },
         {
             title: 'Produção Total',
-            value: `${metrics.monthly_production.toFixed(0)} kWh`,
+            value: `${metrics.total_production.toFixed(0)} kWh`,
             subValue: 'Energia Gerada',
             icon: Zap,
             color: 'bg-blue-100 text-blue-600',
@@ -1,9 +1,16 @@
 import { LayoutDashboard, Users, Banknote, LogOut, Factory } from 'lucide-react';
 import { useNavigate } from 'react-router-dom';
+import api from '../services/api';
 
 const Sidebar = ({ activeTab, setActiveTab }) => {
     const navigate = useNavigate();
 
+    const handleLogout = async () => {
+        await api.post('/logout').catch(() => {});
+        localStorage.removeItem('user');
+        navigate('/');
+    };
+
     const menuItems = [
         { id: 'overview', label: 'Visão Geral', icon: LayoutDashboard },
         { id: 'clients', label: 'Cadastros', icon: Users },
@@ -42,7 +49,7 @@ const Sidebar = ({ activeTab, setActiveTab }) => {
 
             <div className="p-4 border-t border-gray-100">
                 <button
-                    onClick={() => navigate('/')}
+                    onClick={handleLogout}
                     className="w-full flex items-center gap-3 px-4 py-3 rounded-lg text-red-600 hover:bg-red-50 transition"
                 >
                     <LogOut size={20} />
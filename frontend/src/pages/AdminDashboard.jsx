@@ -26,7 +26,7 @@ const AdminDashboard = () => {
     // Ideally this should move to a ClientManager component, but keeping here for now
     const fetchClients = async () => {
         try {
-            const response = await api.get('/clients/');
+            const response = await api.get('/clients/', { params: { view: 'summary' } });
             setClients(response.data);
         } catch (error) {
             console.error("Error fetching clients", error);
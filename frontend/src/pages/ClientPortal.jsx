@@ -94,7 +94,8 @@ const ClientPortal = () => {
         });
     };
 
-    const handleLogout = () => {
+    const handleLogout = async () => {
+        await api.post('/logout').catch(() => {});
         localStorage.removeItem('user');
         navigate('/');
     };
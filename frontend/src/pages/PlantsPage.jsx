@@ -62,7 +62,7 @@ const PlantsPage = () => {
         try {
             const [plantsRes, clientsRes] = await Promise.all([
                 api.get('/plants/'),
-                api.get('/clients/')
+                api.get('/clients/', { params: { view: 'summary' } })
             ]);
             setPlants(plantsRes.data);
             setClients(clientsRes.data);
@@ -736,6 +736,10 @@ const PlantsPage = () => {
                                 <Plus size={20} className="group-hover:rotate-90 transition-transform duration-500" />
                                 <span className="uppercase tracking-[0.2em] text-[10px]">Vincular Cliente</span>
                             </button>
+
+                            <p className="text-[10px] text-white/40 text-center leading-relaxed">
+                                O novo rateio vale a partir do mês seguinte à última produção lançada. Produções já lançadas mantêm o rateio anterior.
+                            </p>
                         </div>
 
                         <div className="p-6 bg-white border-t border-gray-50 flex justify-between items-center rounded-t-[2.5rem] shadow-[0_-20px_60px_rgba(0,0,0,0.1)] mt-auto">
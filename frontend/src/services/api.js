@@ -4,4 +4,34 @@ const api = axios.create({
     baseURL: import.meta.env.VITE_API_URL || 'http://localhost:8000', // Dynamic Backend URL
 });
 
+const getStoredUser = () => {
+    try {
+        return JSON.parse(localStorage.getItem('user'));
+    } catch {
+        return null;
+    }
+};
+
+// Envia o token da sessão (salvo pelo Login) em todas as chamadas
+api.interceptors.request.use((config) => {
+    const user = getStoredUser();
+    if (user?.access_token) {
+        config.headers.Authorization = `Bearer ${user.access_token}`;
+    }
+    return config;
+});
+
+// Token expirado ou revogado: limpa a sessão e volta para o login
+api.interceptors.response.use(
+    (response) => response,
+    (error) => {
+        if (error.response?.status === 401 && getStoredUser()?.access_token) {
+            const user = getStoredUser();
+            localStorage.removeItem('user');
+            window.location.href = `/login?type=${user?.user_type === 'admin' ? 'admin' : 'client'}`;
+        }
+        return Promise.reject(error);
+    }
+);
+
 export default api;